@@ -0,0 +1,161 @@
+# /* Analysis.py
+
+# Batch analysis of EPD or FEN positions, one per line, read from a file or
+# stdin. Every position is searched by MinimaxAgent within a per position
+# budget, and one JSON line per position (best move, score, depth, nodes,
+# principal variation) is written as soon as it is known, in the order of
+# the input. Lines are read and results written as the workers go, so a job
+# of any size runs in constant memory.
+#
+#   python -m data.classes.Analysis positions.epd --output analysis.jsonl --depth 5 --workers 4
+#   cat positions.fen | python -m data.classes.Analysis --time 1 > analysis.jsonl
+#
+# Positions are played with the standard rules (en passant, under-promotions)
+# unless --game-rules is given. Scores are in centipawns from the side to
+# move; forced mates are reported as "mate" in moves instead, negative when
+# the side to move gets mated.
+
+import argparse
+import collections
+import json
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from data.classes.Simulation import SimulationBoard
+from data.classes.Bitboard import move_uci
+from data.classes.agents.MinimaxAgent import MinimaxAgent, MATE_SCORE, MATE_BOUND
+
+# positions submitted per worker ahead of the one being written
+IN_FLIGHT = 4
+
+# one agent per color in every process, see _init_worker
+_agents: dict[str, MinimaxAgent] = {}
+
+
+def parse_epd(line: str) -> tuple[str, dict[str, str]]:
+    # (FEN, operations) of an EPD line such as
+    #   rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 bm e5; id "start";
+    # or of a plain FEN, which has no operations
+    fields = line.split()
+    if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit():
+        return ' '.join(fields[:6]), {}
+    operations = {}
+    for operation in ' '.join(fields[4:]).split(';'):
+        opcode, _, operand = operation.strip().partition(' ')
+        if opcode:
+            operations[opcode] = operand.strip().strip('"')
+    return ' '.join(fields[:4]), operations
+
+
+def score_fields(value: int | None) -> dict:
+    # 'score' in centipawns, or 'mate' in moves for mate scores
+    if value is None:
+        return {'score': None, 'mate': None}
+    if abs(value) > MATE_BOUND:
+        plies = MATE_SCORE - abs(value)
+        return {'score': None, 'mate': (plies + 1) // 2 if value > 0 else -(plies // 2)}
+    return {'score': value, 'mate': None}
+
+
+def _init_worker(agent_kwargs: dict):
+    global _agents
+    _agents = {color: MinimaxAgent(color, **agent_kwargs) for color in ('white', 'black')}
+
+
+def analyse_line(number: int, line: str, standard: bool = True) -> dict:
+    # the JSON record of one input line, an 'error' record when it does not
+    # hold a valid position
+    record = {'line': number}
+    try:
+        fen, operations = parse_epd(line)
+        board = SimulationBoard.from_fen(fen, standard)
+    except ValueError as error:
+        record['error'] = str(error)
+        return record
+    if 'id' in operations:
+        record['id'] = operations['id']
+    record['fen'] = board.fen()
+    start_time = time.time()
+    agent = _agents[board.turn]
+    if board.get_legal_moves():
+        value, move, depth = agent.search(board, start_time)
+        record['best_move'] = move_uci(move['move'])
+        record.update(score_fields(value))
+        record.update(depth=depth, nodes=agent.nodes, pv=agent.last_stats['pv'])
+    else:
+        # checkmate or stalemate, nothing to search
+        mated = board.is_in_check(board.turn)
+        record.update(best_move=None, score=None if mated else 0, mate=0 if mated else None,
+                      depth=0, nodes=0, pv=[])
+    record['seconds'] = round(time.time() - start_time, 3)
+    return record
+
+
+def analyse_stream(lines, agent_kwargs: dict, workers: int = 1, standard: bool = True):
+    # yields the records of the positions of `lines` (any iterable, e.g. a
+    # file) in their order. At most IN_FLIGHT positions per worker are read
+    # ahead, blank lines and lines starting with '#' are skipped.
+    positions = ((number, line) for number, line in enumerate(lines, 1)
+                 if line.strip() and not line.lstrip().startswith('#'))
+    if workers <= 1:
+        _init_worker(agent_kwargs)
+        try:
+            for number, line in positions:
+                yield analyse_line(number, line, standard)
+        finally:
+            for agent in _agents.values():
+                agent.close()
+        return
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(agent_kwargs,)) as executor:
+        pending = collections.deque()
+        for number, line in positions:
+            pending.append(executor.submit(analyse_line, number, line, standard))
+            if len(pending) >= workers * IN_FLIGHT:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyse EPD / FEN positions with MinimaxAgent.")
+    parser.add_argument('input', type=str, nargs='?', default='-',
+                        help="file with one position per line, '-' for stdin")
+    parser.add_argument('--output', type=str, default='-', help="JSON lines file, '-' for stdout")
+    parser.add_argument('--depth', type=int, default=4, help="maximum depth in plies")
+    parser.add_argument('--time', type=float, default=None, help="seconds per position")
+    parser.add_argument('--nodes', type=int, default=None, help="nodes per position")
+    parser.add_argument('--workers', type=int, default=1, help="processes searching positions")
+    parser.add_argument('--tt-size', type=float, default=16,
+                        help="transposition table megabytes per agent")
+    parser.add_argument('--tablebase', type=str, default=None, help="endgame tablebase file")
+    parser.add_argument('--game-rules', action='store_true',
+                        help="no en passant and queen only promotions, like Board")
+    args = parser.parse_args()
+
+    agent_kwargs = dict(max_depth=args.depth, time_limit=args.time, node_limit=args.nodes,
+                        tt_size_mb=args.tt_size, tablebase=args.tablebase)
+    source = sys.stdin if args.input == '-' else open(args.input)
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+    count = 0
+    start_time = time.time()
+    try:
+        for record in analyse_stream(source, agent_kwargs, args.workers, not args.game_rules):
+            output.write(json.dumps(record) + '\n')
+            output.flush()
+            count += 1
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+    elapsed = time.time() - start_time
+    print(f'{count} positions in {elapsed:.1f} seconds '
+          f'({count / max(elapsed, 1e-9):.1f} positions/second)', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
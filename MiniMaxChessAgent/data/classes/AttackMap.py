@@ -0,0 +1,222 @@
+# /* AttackMap.py
+
+from __future__ import annotations
+
+from typing import Literal, TYPE_CHECKING
+if TYPE_CHECKING:
+    from data.classes.Board import Board
+    from data.classes.Piece import Piece
+
+# Squares are indexed y * 8 + x, the order of Board.squares
+ROOK_DIRECTIONS = [(0, -1), (1, 0), (0, 1), (-1, 0)]
+BISHOP_DIRECTIONS = [(1, -1), (1, 1), (-1, 1), (-1, -1)]
+SLIDER_DIRECTIONS = {
+    'R': ROOK_DIRECTIONS,
+    'B': BISHOP_DIRECTIONS,
+    'Q': ROOK_DIRECTIONS + BISHOP_DIRECTIONS,
+}
+STEPS = {
+    'N': [(1, -2), (2, -1), (2, 1), (1, 2), (-1, 2), (-2, 1), (-2, -1), (-1, -2)],
+    'K': ROOK_DIRECTIONS + BISHOP_DIRECTIONS,
+}
+
+
+def other_color(color: str) -> str:
+    return 'black' if color == 'white' else 'white'
+
+
+class AttackMap:
+    # Keeps, for both colors, the set of pieces attacking (or defending) every
+    # square of a Board. The board calls update() with the squares a move
+    # changed, and only the pieces on those squares plus the sliders whose
+    # rays end on them are recomputed. That makes is_in_check an O(1) lookup,
+    # and a hypothetical move only has to look at sliders through its squares.
+    def __init__(self, board: Board):
+        self.board = board
+        # attackers[color][square] is the set of pieces of color attacking square
+        self.attackers: dict[str, list[set[Piece]]] = {
+            'white': [set() for _ in range(64)],
+            'black': [set() for _ in range(64)],
+        }
+        # the squares every tracked piece attacks, and where the map saw it
+        self.attacks: dict[Piece, list[int]] = {}
+        self.pieces: list[Piece] = [None] * 64
+        self.kings: dict[str, int] = {}
+        # check and pin constraints by color, dropped whenever the map changes
+        self.constraints: dict[str, tuple[set[int] | None, dict[Piece, set[int]]]] = {}
+        self.refresh()
+
+    def piece_at(self, index: int) -> Piece:
+        return self.board.squares[index].occupying_piece
+
+    def refresh(self):
+        # rebuilds the whole map, needed when squares were edited by hand
+        for color in self.attackers:
+            for attackers in self.attackers[color]:
+                attackers.clear()
+        self.attacks.clear()
+        self.pieces = [None] * 64
+        self.kings.clear()
+        self.constraints.clear()
+        for index in range(64):
+            if self.piece_at(index) is not None:
+                self.add_piece(index)
+
+    def add_piece(self, index: int):
+        piece = self.piece_at(index)
+        attacks = self.piece_attacks(piece, index)
+        self.attacks[piece] = attacks
+        self.pieces[index] = piece
+        attackers = self.attackers[piece.color]
+        for target in attacks:
+            attackers[target].add(piece)
+        if piece.notation == 'K':
+            self.kings[piece.color] = index
+
+    def remove_piece(self, piece: Piece):
+        attackers = self.attackers[piece.color]
+        for target in self.attacks.pop(piece):
+            attackers[target].discard(piece)
+
+    def update(self, *positions: tuple[int, int]):
+        # called after the pieces on `positions` changed: the old and new
+        # occupants are recomputed, and so is every slider whose ray ends on
+        # one of the squares, as it may now be blocked or see further
+        changed = [y * 8 + x for x, y in positions]
+        self.constraints.clear()
+        stale = set()
+        for index in changed:
+            for piece in (self.pieces[index], self.piece_at(index)):
+                if piece is not None:
+                    stale.add(piece)
+            for color in self.attackers:
+                for piece in self.attackers[color][index]:
+                    if piece.notation in SLIDER_DIRECTIONS:
+                        stale.add(piece)
+        for index in changed:
+            self.pieces[index] = None
+        for piece in stale:
+            if piece in self.attacks:
+                self.remove_piece(piece)
+        for piece in stale:
+            index = piece.y * 8 + piece.x
+            if self.piece_at(index) is piece:
+                self.add_piece(index)
+
+    def piece_attacks(self, piece: Piece, index: int, vacated: int = -1,
+                      occupied: int = -1) -> list[int]:
+        # squares attacked by piece standing on index, the first occupied
+        # square of a ray included. vacated / occupied let the caller look at
+        # the board as if one square was emptied and another one filled.
+        x, y = index % 8, index // 8
+        output = []
+        if piece.notation == 'P':
+            dy = -1 if piece.color == 'white' else 1
+            for dx in (-1, 1):
+                if 0 <= x + dx < 8 and 0 <= y + dy < 8:
+                    output.append((y + dy) * 8 + x + dx)
+        elif piece.notation in STEPS:
+            for dx, dy in STEPS[piece.notation]:
+                if 0 <= x + dx < 8 and 0 <= y + dy < 8:
+                    output.append((y + dy) * 8 + x + dx)
+        else:
+            squares = self.board.squares
+            for dx, dy in SLIDER_DIRECTIONS[piece.notation]:
+                tx, ty = x + dx, y + dy
+                while 0 <= tx < 8 and 0 <= ty < 8:
+                    target = ty * 8 + tx
+                    output.append(target)
+                    if target == occupied or (target != vacated
+                                              and squares[target].occupying_piece is not None):
+                        break
+                    tx, ty = tx + dx, ty + dy
+        return output
+
+    def is_attacked(self, index: int, by_color: str) -> bool:
+        return len(self.attackers[by_color][index]) > 0
+
+    def is_in_check(self, color: Literal['white', 'black'],
+                    board_change: tuple[tuple[int, int], tuple[int, int]] = None) -> bool:
+        enemy = other_color(color)
+        if board_change is None:
+            king = self.kings.get(color)
+            return king is not None and self.is_attacked(king, enemy)
+        (from_x, from_y), (to_x, to_y) = board_change
+        vacated, occupied = from_y * 8 + from_x, to_y * 8 + to_x
+        mover = self.piece_at(vacated)
+        captured = self.piece_at(occupied)
+        king = occupied if mover is not None and mover.notation == 'K' else self.kings.get(color)
+        if king is None:
+            return False
+        # current attackers of the king square, unless captured, or sliders
+        # blocked by the piece arriving on `occupied`
+        for piece in self.attackers[enemy][king]:
+            if piece is captured:
+                continue
+            if piece.notation not in SLIDER_DIRECTIONS \
+                    or king in self.piece_attacks(piece, piece.y * 8 + piece.x,
+                                                  vacated, occupied):
+                return True
+        # sliders whose ray stopped on the vacated square may now reach the king
+        for piece in self.attackers[enemy][vacated]:
+            if piece is captured or piece.notation not in SLIDER_DIRECTIONS:
+                continue
+            if king in self.piece_attacks(piece, piece.y * 8 + piece.x, vacated, occupied):
+                return True
+        return False
+
+    def check_constraints(self, color: str) -> tuple[set[int] | None, dict[Piece, set[int]]]:
+        # (squares a piece other than the king must move to, None when not in
+        # check; the squares every pinned piece is left with), worked out once
+        # per position
+        if color in self.constraints:
+            return self.constraints[color]
+        enemy = other_color(color)
+        king = self.kings.get(color)
+        allowed, pins = None, {}
+        if king is not None:
+            kx, ky = king % 8, king // 8
+            checkers = self.attackers[enemy][king]
+            if len(checkers) > 1:
+                allowed = set()  # double check, only the king can move
+            elif checkers:
+                checker = next(iter(checkers))
+                allowed = {checker.y * 8 + checker.x}
+                if checker.notation in SLIDER_DIRECTIONS:
+                    # the squares in between block the check
+                    dx = (checker.x > kx) - (checker.x < kx)
+                    dy = (checker.y > ky) - (checker.y < ky)
+                    x, y = kx + dx, ky + dy
+                    while (x, y) != (checker.x, checker.y):
+                        allowed.add(y * 8 + x)
+                        x, y = x + dx, y + dy
+            for dx, dy in SLIDER_DIRECTIONS['Q']:
+                sliders = 'RQ' if dx == 0 or dy == 0 else 'BQ'
+                ray, pinned = [], None
+                x, y = kx + dx, ky + dy
+                while 0 <= x < 8 and 0 <= y < 8:
+                    ray.append(y * 8 + x)
+                    piece = self.piece_at(y * 8 + x)
+                    if piece is not None:
+                        if piece.color == color and pinned is None:
+                            pinned = piece
+                        else:
+                            if pinned is not None and piece.color == enemy \
+                                    and piece.notation in sliders:
+                                pins[pinned] = set(ray)
+                            break
+                    x, y = x + dx, y + dy
+        self.constraints[color] = (allowed, pins)
+        return allowed, pins
+
+    def legal_moves(self, piece: Piece, squares: list) -> list:
+        # the target squares (of piece.get_moves) that do not leave the own
+        # king in check
+        if piece.notation == 'K':
+            return [square for square in squares
+                    if not self.is_in_check(piece.color, (piece.pos, square.pos))]
+        allowed, pins = self.check_constraints(piece.color)
+        pin = pins.get(piece)
+        return [square for square in squares
+                if (allowed is None or square.y * 8 + square.x in allowed)
+                and (pin is None or square.y * 8 + square.x in pin)]
@@ -0,0 +1,67 @@
+# /* BatchEvaluation.py
+
+# Vectorized version of MinimaxAgent.evaluate_board for scoring many positions
+# in one NumPy pass, with the same weights as the incremental evaluation of
+# SimulationBoard (see Evaluation.py).
+#
+# Positions are accepted in two dense encodings:
+#   piece codes  (N, 64)      0 for an empty square, piece + 1 otherwise
+#   planes       (N, 12, 64)  one 0/1 plane per piece (color * 6 + type)
+# Squares use the SimulationBoard order (index 0 is a8).
+
+from typing import Iterable, Literal
+import numpy as np
+
+from data.classes.Evaluation import MIDDLE_GAME, END_GAME, PHASE, MAX_PHASE
+
+# white terms count positive and black terms negative
+_SIGNS = np.array([1] * 6 + [-1] * 6, dtype=np.int64)
+PLANE_MIDDLE_GAME = np.array(MIDDLE_GAME, dtype=np.int64) * _SIGNS[:, None]
+PLANE_END_GAME = np.array(END_GAME, dtype=np.int64) * _SIGNS[:, None]
+PLANE_PHASE = np.array(PHASE, dtype=np.int64)
+# the same tables with a leading all zero row for the empty square code
+CODE_MIDDLE_GAME = np.vstack([np.zeros((1, 64), dtype=np.int64), PLANE_MIDDLE_GAME])
+CODE_END_GAME = np.vstack([np.zeros((1, 64), dtype=np.int64), PLANE_END_GAME])
+CODE_PHASE = np.concatenate([[0], PLANE_PHASE])
+_SQUARES = np.arange(64)
+
+
+def encode_board(board) -> np.ndarray:
+    # piece codes of one SimulationBoard, the mailbox stores -1 for empty squares
+    return np.array(board.mailbox, dtype=np.int8) + 1
+
+
+def encode_boards(boards: Iterable, planes: bool = False) -> np.ndarray:
+    codes = np.array([board.mailbox for board in boards], dtype=np.int8).reshape(-1, 64) + 1
+    return codes_to_planes(codes) if planes else codes
+
+
+def codes_to_planes(codes: np.ndarray) -> np.ndarray:
+    codes = np.asarray(codes)
+    return (codes[:, None, :] == np.arange(1, 13, dtype=codes.dtype)[None, :, None]).astype(np.int8)
+
+
+def evaluate_batch(positions: np.ndarray,
+                   color: Literal['white', 'black'] = 'white') -> np.ndarray:
+    # scores (centipawns, int64) of all positions from the point of view of color
+    positions = np.asarray(positions)
+    if positions.ndim == 3:
+        if positions.shape[1:] != (12, 64):
+            raise ValueError(f'expected (N, 12, 64) planes, got {positions.shape}')
+        planes = positions.astype(np.int64, copy=False)
+        middle_game = np.einsum('npq,pq->n', planes, PLANE_MIDDLE_GAME)
+        end_game = np.einsum('npq,pq->n', planes, PLANE_END_GAME)
+        phase = planes.sum(axis=2) @ PLANE_PHASE
+    elif positions.ndim == 2:
+        if positions.shape[1] != 64:
+            raise ValueError(f'expected (N, 64) piece codes, got {positions.shape}')
+        codes = positions.astype(np.intp, copy=False)
+        middle_game = CODE_MIDDLE_GAME[codes, _SQUARES].sum(axis=1)
+        end_game = CODE_END_GAME[codes, _SQUARES].sum(axis=1)
+        phase = CODE_PHASE[codes].sum(axis=1)
+    else:
+        raise ValueError(f'expected (N, 64) or (N, 12, 64) positions, got {positions.shape}')
+    phase = np.minimum(phase, MAX_PHASE)
+    scores = (middle_game * phase + end_game * (MAX_PHASE - phase)) // MAX_PHASE
+    return scores if color == 'white' else -scores
+
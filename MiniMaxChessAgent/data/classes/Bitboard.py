@@ -0,0 +1,207 @@
+# /* Bitboard.py
+
+# Low level bitboard helpers shared by the simulation board and the agents.
+# A square index is y * 8 + x, using the same (x, y) coordinates as Board,
+# so index 0 is a8 (top left) and index 63 is h1 (bottom right).
+
+WHITE = 0
+BLACK = 1
+COLORS = ('white', 'black')
+COLOR_INDEX = {'white': WHITE, 'black': BLACK}
+
+PAWN = 0
+KNIGHT = 1
+BISHOP = 2
+ROOK = 3
+QUEEN = 4
+KING = 5
+PIECE_NOTATION = 'PNBRQK'
+PIECE_TYPE = {notation: i for i, notation in enumerate(PIECE_NOTATION)}
+
+# mailbox value of an empty square, pieces are stored as color * 6 + type
+EMPTY = -1
+
+FULL = (1 << 64) - 1
+
+# castling rights
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+
+
+def square_index(pos: tuple[int, int]) -> int:
+    return pos[1] * 8 + pos[0]
+
+
+def square_pos(sq: int) -> tuple[int, int]:
+    return (sq % 8, sq // 8)
+
+
+def rank_mask(y: int) -> int:
+    return 0xFF << (8 * y)
+
+
+def popcount(bb: int) -> int:
+    return bb.bit_count()
+
+
+def iter_bits(bb: int):
+    while bb:
+        bit = bb & -bb
+        yield bit.bit_length() - 1
+        bb ^= bit
+
+
+# Moves are packed into a single int: from | to << 6 | promotion << 12,
+# where promotion is the piece type the pawn turns into (0 for none).
+# En passant captures (standard rules only) also carry the EN_PASSANT bit.
+EN_PASSANT = 1 << 15
+
+
+def encode_move(from_sq: int, to_sq: int, promotion: int = 0) -> int:
+    return from_sq | (to_sq << 6) | (promotion << 12)
+
+
+def move_from(move: int) -> int:
+    return move & 63
+
+
+def move_to(move: int) -> int:
+    return (move >> 6) & 63
+
+
+def move_promotion(move: int) -> int:
+    return (move >> 12) & 7
+
+
+def square_name(sq: int) -> str:
+    # algebraic name of a square, index 0 is a8
+    return 'abcdefgh'[sq % 8] + str(8 - sq // 8)
+
+
+def move_uci(move: int) -> str:
+    # the move in UCI notation, e.g. e2e4 or e7e8q
+    promotion = move_promotion(move)
+    return square_name(move_from(move)) + square_name(move_to(move)) \
+        + (PIECE_NOTATION[promotion].lower() if promotion else '')
+
+
+def _leaper_attacks(deltas) -> list[int]:
+    table = []
+    for sq in range(64):
+        x, y = square_pos(sq)
+        attacks = 0
+        for dx, dy in deltas:
+            if 0 <= x + dx < 8 and 0 <= y + dy < 8:
+                attacks |= 1 << square_index((x + dx, y + dy))
+        table.append(attacks)
+    return table
+
+
+KNIGHT_ATTACKS = _leaper_attacks([
+    (1, -2), (2, -1), (2, 1), (1, 2), (-1, 2), (-2, 1), (-2, -1), (-1, -2)
+])
+KING_ATTACKS = _leaper_attacks([
+    (0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1)
+])
+# squares attacked by a pawn of the given color standing on a square,
+# white pawns move towards y == 0
+PAWN_ATTACKS = [
+    _leaper_attacks([(-1, -1), (1, -1)]),
+    _leaper_attacks([(-1, 1), (1, 1)]),
+]
+
+ROOK_DIRECTIONS = [(0, -1), (1, 0), (0, 1), (-1, 0)]
+BISHOP_DIRECTIONS = [(1, -1), (1, 1), (-1, 1), (-1, -1)]
+
+
+def _slide(sq: int, occupied: int, directions) -> int:
+    x, y = square_pos(sq)
+    attacks = 0
+    for dx, dy in directions:
+        tx, ty = x + dx, y + dy
+        while 0 <= tx < 8 and 0 <= ty < 8:
+            bit = 1 << (ty * 8 + tx)
+            attacks |= bit
+            if occupied & bit:
+                break
+            tx += dx
+            ty += dy
+    return attacks
+
+
+def _relevant_mask(sq: int, directions) -> int:
+    # squares whose occupancy can change the attack set, the last square
+    # of every ray never blocks anything behind it so it is left out
+    x, y = square_pos(sq)
+    mask = 0
+    for dx, dy in directions:
+        tx, ty = x + dx, y + dy
+        while 0 <= tx + dx < 8 and 0 <= ty + dy < 8:
+            mask |= 1 << (ty * 8 + tx)
+            tx += dx
+            ty += dy
+    return mask
+
+
+class _SlidingAttacks(dict):
+    # Attack sets keyed by the relevant occupancy of one square. Entries are
+    # filled in the first time an occupancy is seen, so importing the module
+    # stays cheap and a search only pays for the blocker patterns it meets.
+    def __init__(self, sq: int, directions):
+        super().__init__()
+        self.sq = sq
+        self.directions = directions
+
+    def __missing__(self, occupied: int) -> int:
+        attacks = _slide(self.sq, occupied, self.directions)
+        self[occupied] = attacks
+        return attacks
+
+
+ROOK_MASKS = [_relevant_mask(sq, ROOK_DIRECTIONS) for sq in range(64)]
+BISHOP_MASKS = [_relevant_mask(sq, BISHOP_DIRECTIONS) for sq in range(64)]
+ROOK_TABLES = [_SlidingAttacks(sq, ROOK_DIRECTIONS) for sq in range(64)]
+BISHOP_TABLES = [_SlidingAttacks(sq, BISHOP_DIRECTIONS) for sq in range(64)]
+
+
+def rook_attacks(sq: int, occupied: int) -> int:
+    return ROOK_TABLES[sq][occupied & ROOK_MASKS[sq]]
+
+
+def bishop_attacks(sq: int, occupied: int) -> int:
+    return BISHOP_TABLES[sq][occupied & BISHOP_MASKS[sq]]
+
+
+# castling rights that survive a move touching the square
+CASTLING_MASKS = [0b1111] * 64
+CASTLING_MASKS[square_index((4, 7))] &= ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLING_MASKS[square_index((7, 7))] &= ~WHITE_KINGSIDE
+CASTLING_MASKS[square_index((0, 7))] &= ~WHITE_QUEENSIDE
+CASTLING_MASKS[square_index((4, 0))] &= ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLING_MASKS[square_index((7, 0))] &= ~BLACK_KINGSIDE
+CASTLING_MASKS[square_index((0, 0))] &= ~BLACK_QUEENSIDE
+
+
+def _between(a: int, b: int) -> int:
+    # squares strictly between a and b when they share a rank, file or
+    # diagonal, 0 otherwise
+    ax, ay = square_pos(a)
+    bx, by = square_pos(b)
+    dx, dy = bx - ax, by - ay
+    if a == b or (dx and dy and abs(dx) != abs(dy)):
+        return 0
+    dx = (dx > 0) - (dx < 0)
+    dy = (dy > 0) - (dy < 0)
+    squares = 0
+    x, y = ax + dx, ay + dy
+    while (x, y) != (bx, by):
+        squares |= 1 << (y * 8 + x)
+        x += dx
+        y += dy
+    return squares
+
+
+# BETWEEN[a][b], used to block checks and to keep pinned pieces on their ray
+BETWEEN = [[_between(a, b) for b in range(64)] for a in range(64)]
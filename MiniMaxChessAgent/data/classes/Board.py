@@ -4,7 +4,9 @@ import pygame
 
 from typing import Literal
 from data.classes.Square import Square
+from data.classes.AttackMap import AttackMap
 from data.classes.Piece import Piece
+from data.classes.Bitboard import PIECE_NOTATION
 from data.classes.pieces.Rook import Rook
 from data.classes.pieces.Bishop import Bishop
 from data.classes.pieces.Knight import Knight
@@ -14,7 +16,8 @@ from data.classes.pieces.Pawn import Pawn
 
 # Game state checker
 class Board:
-    def __init__(self, display: pygame.surface.Surface, width: float, height: float):
+    def __init__(self, display: pygame.surface.Surface, width: float, height: float,
+                 fen: str = None):
         self.display = display
         self.width = width
         self.height = height
@@ -22,6 +25,10 @@ class Board:
         self.tile_height = height // 8
         self.selected_square: Square = None
         self.turn: Literal['white', 'black'] = 'white'
+        # the square a pawn skipped on the last move when an enemy pawn could
+        # take it en passant, -1 otherwise. The game has no en passant, the
+        # square only goes into FENs and opening book keys.
+        self.ep_square: int = -1
         self.config = [
             ['bR', 'bN', 'bB', 'bQ', 'bK', 'bB', 'bN', 'bR'],
             ['bP', 'bP', 'bP', 'bP', 'bP', 'bP', 'bP', 'bP'],
@@ -33,7 +40,18 @@ class Board:
             ['wR', 'wN', 'wB', 'wQ', 'wK', 'wB', 'wN', 'wR'],
         ]
         self.squares: list[Square] = self.generate_squares()
+        # what draw() last put on screen: the surface drawn on and the
+        # (piece image, highlight) of every square. The highlighted squares
+        # are kept until the selection or the position changes.
+        self.background: pygame.surface.Surface = None
+        self.drawn_surface: pygame.surface.Surface = None
+        self.drawn: list[tuple] = [None] * 64
+        self.highlights: set[int] = None
         self.setup_board()
+        # attacked squares of both colors, kept up to date by Piece.move
+        self.attack_map = AttackMap(self)
+        if fen is not None:
+            self.set_fen(fen)
 
     def generate_squares(self) -> list[Square]:
         output: list[Square] = []
@@ -45,9 +63,10 @@ class Board:
         return output
 
     def get_square_from_pos(self, pos: tuple[float, float]) -> Square:
-        for square in self.squares:
-            if (square.x, square.y) == (pos[0], pos[1]):
-                return square
+        # squares are generated row by row
+        x, y = int(pos[0]), int(pos[1])
+        if 0 <= x < 8 and 0 <= y < 8:
+            return self.squares[y * 8 + x]
 
     def get_piece_from_pos(self, pos: tuple[float, float]) -> Piece:
         return self.get_square_from_pos(pos).occupying_piece
@@ -56,6 +75,7 @@ class Board:
         for s in self.squares:
             s.highlight = False
         self.selected_square = square
+        self.highlights = None
 
     def setup_board(self) -> None:
         for y, row in enumerate(self.config):
@@ -89,55 +109,79 @@ class Board:
                             (x, y), 'white' if piece[0] == 'w' else 'black', self
                         )
 
+    def set_fen(self, fen: str) -> None:
+        # sets up the position of a FEN through config. Board has no en
+        # passant, the field is only kept in ep_square. The castling field
+        # decides which kings and rooks count as unmoved, and pawns off their
+        # start row lose their double step.
+        from data.classes.Simulation import SimulationBoard, CASTLING_SQUARES
+        position = SimulationBoard.from_fen(fen)
+        self.config = [
+            ['' if piece < 0 else 'wb'[piece // 6] + PIECE_NOTATION[piece % 6]
+             for piece in position.mailbox[y * 8:y * 8 + 8]]
+            for y in range(8)
+        ]
+        for square in self.squares:
+            square.occupying_piece = None
+        self.setup_board()
+        self.turn = position.turn
+        self.ep_square = position.ep_square
+        self.selected_square = None
+        self.highlights = None
+        unmoved = set()
+        for right, _, king_sq, rook_sq in CASTLING_SQUARES:
+            if position.castling & right:
+                unmoved.update((king_sq, rook_sq))
+        for index, square in enumerate(self.squares):
+            piece = square.occupying_piece
+            if piece is None:
+                continue
+            if piece.notation == 'P':
+                piece.has_moved = square.y != (6 if piece.color == 'white' else 1)
+            elif piece.notation in 'KR':
+                piece.has_moved = index not in unmoved
+        self.attack_map.refresh()
+
+    def fen(self) -> str:
+        # the FEN of the position, without move counters
+        from data.classes.Simulation import SimulationBoard
+        position = SimulationBoard()
+        position.copy_from_board(self)
+        position.ep_square = self.ep_square
+        return position.fen()
+
     def handle_move(self, from_square: Square, to_square: Square) -> bool:
         if from_square.occupying_piece is not None:
-            if from_square.occupying_piece.move(self, to_square):
+            piece = from_square.occupying_piece
+            moved = piece.move(self, to_square)
+            # a move (or a rejected one) clears the selection
+            self.highlights = None
+            if moved:
+                self.ep_square = self.skipped_square(piece, from_square, to_square)
                 self.turn = 'white' if self.turn == 'black' else 'black'
                 return True
         
         return False
 
-    # check state checker
+    def skipped_square(self, piece: Piece, from_square: Square, to_square: Square) -> int:
+        # ep_square after the move of piece, like SimulationBoard's
+        if piece.notation != 'P' or abs(to_square.y - from_square.y) != 2:
+            return -1
+        for x in (to_square.x - 1, to_square.x + 1):
+            if 0 <= x < 8:
+                neighbour = self.get_piece_from_pos((x, to_square.y))
+                if neighbour is not None and neighbour.notation == 'P' \
+                        and neighbour.color != piece.color:
+                    return (from_square.y + to_square.y) // 2 * 8 + from_square.x
+        return -1
+
+    # check state checker, an O(1) lookup in the attack map (see AttackMap.py)
     def is_in_check(self, color: Literal['white', 'black'],
                     board_change: tuple[tuple[int, int],
                                         tuple[int, int]]=None) -> bool:
-        # board_change = [(x1, y1), (x2, y2)]
-        output = False
-        king_pos: tuple[int, int] = None
-        changing_piece: Piece = None
-        old_square: Square = None
-        new_square: Square = None
-        new_square_old_piece: Piece = None
-        if board_change is not None:
-            for square in self.squares:
-                if square.pos == board_change[0]:
-                    changing_piece = square.occupying_piece
-                    old_square = square
-                    old_square.occupying_piece = None
-            for square in self.squares:
-                if square.pos == board_change[1]:
-                    new_square = square
-                    new_square_old_piece = new_square.occupying_piece
-                    new_square.occupying_piece = changing_piece
-        pieces = [
-            i.occupying_piece for i in self.squares if i.occupying_piece is not None
-        ]
-        if changing_piece is not None:
-            if changing_piece.notation == 'K':
-                king_pos = new_square.pos
-        if king_pos == None:
-            for piece in pieces:
-                if piece.notation == 'K' and piece.color == color:
-                        king_pos = piece.pos
-        for piece in pieces:
-            if piece.color != color:
-                for square in piece.attacking_squares(self):
-                    if square.pos == king_pos:
-                        output = True
-        if board_change is not None:
-            old_square.occupying_piece = changing_piece
-            new_square.occupying_piece = new_square_old_piece
-        return output
+        # board_change = [(x1, y1), (x2, y2)] asks about the position after
+        # moving the piece on (x1, y1) to (x2, y2), without making the move
+        return self.attack_map.is_in_check(color, board_change)
 
     # checkmate state checker
     def is_in_checkmate(self, color: Literal['white', 'black']):
@@ -149,14 +193,43 @@ class Board:
                 return False
         return True
 
-    def draw(self, display: pygame.surface.Surface = None):
+    def get_background(self) -> pygame.surface.Surface:
+        # the empty board, rendered once
+        if self.background is None:
+            self.background = pygame.Surface((self.width, self.height))
+            self.background.fill('white')
+            for square in self.squares:
+                pygame.draw.rect(self.background, square.draw_color, square.rect)
+        return self.background
+
+    def draw(self, display: pygame.surface.Surface = None, full: bool = False):
+        # Redraws only the squares whose piece or highlight changed since the
+        # last call and updates just their rectangles of the screen. The
+        # whole board is drawn on the first call, on a new surface or with
+        # full (e.g. after the window was covered).
         if display == None:
             display = self.display
-        display.fill('white')
-        if self.selected_square is not None:
-            self.selected_square.highlight = True
-            for square in self.selected_square.occupying_piece.get_valid_moves(self):
-                square.highlight = True
-        for square in self.squares:
-            square.draw(display)
-        pygame.display.update()
\ No newline at end of file
+        if self.highlights is None:
+            self.highlights = set()
+            selected = self.selected_square
+            if selected is not None and selected.occupying_piece is not None:
+                self.highlights.add(selected.y * 8 + selected.x)
+                for square in selected.occupying_piece.get_valid_moves(self):
+                    self.highlights.add(square.y * 8 + square.x)
+        dirty = []
+        if full or display is not self.drawn_surface:
+            display.blit(self.get_background(), (0, 0))
+            self.drawn_surface = display
+            # the background already shows every empty, plain square
+            self.drawn = [(None, False)] * 64
+            dirty.append(display.get_rect())
+        for index, square in enumerate(self.squares):
+            square.highlight = index in self.highlights
+            piece = square.occupying_piece
+            state = (piece.img if piece is not None else None, square.highlight)
+            if state != self.drawn[index]:
+                square.draw(display)
+                self.drawn[index] = state
+                dirty.append(square.rect)
+        if dirty:
+            pygame.display.update(dirty)
\ No newline at end of file
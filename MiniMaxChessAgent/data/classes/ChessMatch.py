@@ -1,76 +1,297 @@
+import contextlib
+import csv
+import json
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import pygame
 from data.classes.Board import Board
+from data.classes import Profiling
 from data.classes.agents.ChessAgent import ChessAgent
 from matplotlib import pyplot as plt
-import time
 
-def chess_match(white_player: ChessAgent, black_player: ChessAgent):
+WINDOW_SIZE = (600, 600)
+# milliseconds the window waits for an event while an agent searches
+EVENT_WAIT_MS = 50
+# a game is drawn after this many moves without a winner
+MAX_MOVES = 1000
+
+# fields of a game record, in the column order of the CSV output
+RESULT_FIELDS = ['game', 'white', 'black', 'minimax_color', 'winner', 'reason',
+                 'moves', 'seconds']
+
+
+class GameTimeout(Exception):
+    pass
+
+
+@contextlib.contextmanager
+def time_limit(seconds: float | None):
+    # interrupts the block with GameTimeout after `seconds`, even inside an
+    # agent's choose_action. Needs SIGALRM, so it only works in the main
+    # thread on POSIX systems; elsewhere play_game still checks the time
+    # between moves.
+    if not seconds or not hasattr(signal, 'setitimer') \
+            or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def on_alarm(signum, frame):
+        raise GameTimeout()
+
+    previous = signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def headless_board(fen: str | None = None) -> Board:
+    # a board drawn on an off-screen surface, no window is opened
+    return Board(pygame.Surface(WINDOW_SIZE), WINDOW_SIZE[0], WINDOW_SIZE[1], fen)
+
+
+def choose(agent: ChessAgent, board: Board, move_time: float | None = None, on_wait=None):
+    # the agent's action. With a move time or an on_wait callback the agent
+    # chooses in the background (ChessAgent.start_search): its search is cut
+    # off after move_time seconds and on_wait(board) is called until it is
+    # done, e.g. to handle window events. on_wait returning False gives the
+    # decision up, as if the agent had no move.
+    if move_time is None and on_wait is None:
+        with Profiling.running():
+            return agent.choose_action(board)
+    handle = agent.start_search(board, time.time() + move_time if move_time else None)
+    try:
+        while on_wait is not None and not handle.poll():
+            if not on_wait(board):
+                handle.cancel()
+                handle.result()
+                return False
+        return handle.result()
+    except BaseException:
+        # e.g. GameTimeout, the background search must not outlive the game
+        handle.cancel()
+        handle.done.wait()
+        raise
+
+
+def play_game(white_player: ChessAgent, black_player: ChessAgent, board: Board = None,
+              max_moves: int = MAX_MOVES, timeout: float | None = None,
+              verbose: bool = False, on_move=None, move_time: float | None = None,
+              on_wait=None) -> dict:
+    # Plays one game and returns {'winner', 'reason', 'moves', 'seconds'}, the
+    # winner being 'white', 'black' or 'draw'. Without a board the game is
+    # played headless. on_move(board) is called after every move that was
+    # played, e.g. to draw the board. move_time and on_wait are passed on to
+    # choose.
     assert(white_player.color == 'white')
     assert(black_player.color == 'black')
-    pygame.init()
-    WINDOW_SIZE = (600, 600)
-    screen = pygame.display.set_mode(WINDOW_SIZE)
-    board = Board(screen, WINDOW_SIZE[0], WINDOW_SIZE[1])
+    if board is None:
+        board = headless_board()
     agents: list[ChessAgent] = [white_player, black_player]
-    i: int = 0
+    # a game set up from a position (see Board) may start with black
+    i: int = 0 if board.turn == 'white' else 1
     moves_count: int = 0
-    winner = None
-
-    # Run the main game loop
-    running = True
-    while running:
-        print(f"Current Turn: {board.turn}")  # Show current turn
-        chosen_action = agents[i].choose_action(board)
-
-        if chosen_action is False or moves_count > 1000:
-            print('Players draw!')
-            running = False
-        else:
-            print("Chosen action:", chosen_action[0].pos, chosen_action[1].pos)  #Show chosen action
-            # Check if the move is valid before applying it
-            if board.handle_move(*chosen_action):
-                moves_count += 1
-                i = (i + 1) % len(agents)  # Switch turns only on valid move
-                # Check for checkmate after a valid move
-                if board.is_in_checkmate(board.turn):
-                    if board.turn == 'white':
-                        winner='black'
-                        print('Black wins!')
+    winner, reason = 'draw', None
+    start_time = time.time()
+    with contextlib.ExitStack() as stack:
+        if not verbose:
+            # agents print while they think, which is only noise in batches
+            stack.enter_context(contextlib.redirect_stdout(
+                stack.enter_context(open(os.devnull, 'w'))))
+        try:
+            with time_limit(timeout):
+                while reason is None:
+                    if verbose:
+                        print(f"Current Turn: {board.turn}")
+                    with Profiling.decision(board, agents[i]):
+                        chosen_action = choose(agents[i], board, move_time, on_wait)
+                    if chosen_action is False:
+                        reason = 'no_moves'
+                        break
+                    if verbose:
+                        print("Chosen action:", chosen_action[0].pos, chosen_action[1].pos)
+                    if not board.handle_move(*chosen_action):
+                        # a player that cannot produce a valid move loses
+                        winner, reason = agents[1 - i].color, 'invalid_move'
                     else:
-                        winner='white'
-                        print('White wins!')
-                    running = False
-            else:
-                print("Invalid move!")  # Notify about invalid moves
-                #break
-                continue
-        board.draw()
+                        moves_count += 1
+                        i = (i + 1) % len(agents)
+                        if on_move is not None:
+                            on_move(board)
+                        if board.is_in_checkmate(board.turn):
+                            winner, reason = agents[1 - i].color, 'checkmate'
+                        elif moves_count > max_moves:
+                            reason = 'move_limit'
+                        elif timeout and time.time() - start_time >= timeout:
+                            reason = 'timeout'
+        except GameTimeout:
+            winner, reason = 'draw', 'timeout'
+    return {'winner': winner, 'reason': reason, 'moves': moves_count,
+            'seconds': round(time.time() - start_time, 3)}
 
-    #return winner
 
+def pump_events(board: Board) -> bool:
+    # keeps the window responsive while an agent searches, False once it is
+    # closed. The quit event is put back for the loop after the game.
+    event = pygame.event.wait(EVENT_WAIT_MS)
+    if event.type == pygame.QUIT:
+        pygame.event.post(event)
+        return False
+    if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+        board.draw(full=True)
+    return True
 
 
+def chess_match(white_player: ChessAgent, black_player: ChessAgent,
+                move_time: float | None = None):
+    # plays a game in a window, the agents searching in the background while
+    # the window handles its events; move_time cuts their searches off
+    pygame.init()
+    screen = pygame.display.set_mode(WINDOW_SIZE)
+    board = Board(screen, WINDOW_SIZE[0], WINDOW_SIZE[1])
+    board.draw()
+    result = play_game(white_player, black_player, board, verbose=True,
+                       on_move=lambda board: board.draw(), move_time=move_time,
+                       on_wait=pump_events)
+    if result['winner'] == 'draw':
+        print('Players draw!')
+    elif result['winner'] == 'white':
+        print('White wins!')
+    else:
+        print('Black wins!')
+
     # Allow the player to view the result
     viewing = True
     while viewing:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                viewing = False
-    return winner
+        event = pygame.event.wait()
+        if event.type == pygame.QUIT:
+            viewing = False
+        elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+            board.draw(full=True)
+    return result['winner'] if result['winner'] != 'draw' else None
+
+
+# Agents of experiments are given as specs rather than instances, so worker
+# processes can build their own: an agent class, or (agent class, kwargs).
+def check_spec(spec):
+    # agents used to be passed as instances, which can not be sent to workers
+    if isinstance(spec, ChessAgent):
+        raise TypeError(f'expected an agent class or (agent class, kwargs), not the agent '
+                        f'{spec!r}: pass {type(spec).__name__}, or ({type(spec).__name__}, '
+                        f'{{...options}}), instead of an instance')
+
+
+def make_agent(spec, color: str) -> ChessAgent:
+    check_spec(spec)
+    if isinstance(spec, tuple):
+        agent_class, kwargs = spec
+        return agent_class(color, **kwargs)
+    return spec(color)
+
+
+def agent_name(spec) -> str:
+    if isinstance(spec, tuple):
+        agent_class, kwargs = spec
+        arguments = ','.join(f'{key}={value}' for key, value in kwargs.items())
+        return f'{agent_class.__name__}({arguments})'
+    return spec.__name__
+
+
+def play_experiment_game(game: int, minimax_spec, opponent_spec, minimax_color: str,
+                         max_moves: int, timeout: float | None) -> dict:
+    # one game of an experiment, run in a worker process
+    opponent_color = 'black' if minimax_color == 'white' else 'white'
+    players = {minimax_color: make_agent(minimax_spec, minimax_color),
+               opponent_color: make_agent(opponent_spec, opponent_color)}
+    try:
+        result = play_game(players['white'], players['black'], max_moves=max_moves,
+                           timeout=timeout)
+    finally:
+        for player in players.values():
+            if hasattr(player, 'close'):
+                player.close()
+    names = {minimax_color: agent_name(minimax_spec), opponent_color: agent_name(opponent_spec)}
+    return dict(game=game, white=names['white'], black=names['black'],
+                minimax_color=minimax_color, **result)
+
+
+class ResultWriter:
+    # streams game records to a .csv file, or JSON lines for any other name
+    def __init__(self, path: str, fields: list[str] = RESULT_FIELDS):
+        self.file = open(path, 'w', newline='')
+        self.csv = None
+        if path.endswith('.csv'):
+            self.csv = csv.DictWriter(self.file, fieldnames=fields)
+            self.csv.writeheader()
 
-def run_experiments(minimax_agent, opponent_agent, iterations=10):
+    def write(self, record: dict):
+        if self.csv is not None:
+            self.csv.writerow(record)
+        else:
+            self.file.write(json.dumps(record) + '\n')
+        # flushed per game, so a long batch can be followed while it runs
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def run_experiments(minimax_agent, opponent_agent, iterations=10, workers: int = 1,
+                    alternate_colors: bool = True, max_moves: int = MAX_MOVES,
+                    timeout: float | None = None, output: str | None = None,
+                    profile: str | None = None, profile_format: str = 'pstats'):
+    # Plays `iterations` headless games between two agent specs (see
+    # make_agent) over `workers` processes. The minimax agent plays white in
+    # even games and, with alternate_colors, black in odd ones. Every game is
+    # written to `output` as soon as it ends. With a `profile` directory every
+    # decision is profiled there (see Profiling.py).
+    check_spec(minimax_agent)
+    check_spec(opponent_agent)
+    if profile is not None:
+        Profiling.configure(profile, profile_format)
     results = {'minimax': 0, 'opponent': 0, 'draw': 0}
-    for _ in range(10):
-        winner = chess_match(minimax_agent, opponent_agent)
-        if winner == 'white' and minimax_agent.color == 'white':
-            results['minimax'] += 1
-        elif winner == 'black' and minimax_agent.color == 'black':
-            results['minimax'] += 1
-        elif winner == 'draw':
+    writer = ResultWriter(output) if output else None
+    start_time = time.time()
+
+    def record(game_result):
+        if game_result['winner'] == 'draw':
             results['draw'] += 1
+        elif game_result['winner'] == game_result['minimax_color']:
+            results['minimax'] += 1
         else:
             results['opponent'] += 1
+        if writer is not None:
+            writer.write(game_result)
 
+    games = [
+        (game, minimax_agent, opponent_agent,
+         'black' if alternate_colors and game % 2 else 'white', max_moves, timeout)
+        for game in range(iterations)
+    ]
+    try:
+        if workers > 1:
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                futures = [executor.submit(play_experiment_game, *game) for game in games]
+                for future in as_completed(futures):
+                    record(future.result())
+        else:
+            for game in games:
+                record(play_experiment_game(*game))
+    finally:
+        if writer is not None:
+            writer.close()
+
+    elapsed = time.time() - start_time
+    print(f'{iterations} games in {elapsed:.1f} seconds '
+          f'({iterations * 3600 / max(elapsed, 1e-9):.0f} games/hour)')
     return results
 
 def plot_win_rate(results):
@@ -78,7 +299,6 @@ def plot_win_rate(results):
     values = [results['minimax'], results['opponent'], results['draw']]
     plt.figure(figsize=(8, 5))
     plt.bar(labels, values, color=['green', 'red', 'gray'])
-    plt.title('Minimax Agent Win Rate over 10 Games')
+    plt.title(f'Minimax Agent Win Rate over {sum(values)} Games')
     plt.ylabel('Number of Games')
     plt.show()
-
@@ -0,0 +1,122 @@
+# /* Evaluation.py
+
+# Evaluation weights of the search: material plus piece-square tables, tapered
+# between a middle game and an end game table by the remaining material.
+# The tables are the "simplified evaluation function" ones, written from
+# white's point of view with a8 first, which is the square order of Board.
+
+# centipawns, the king is not counted as it can never be captured
+MATERIAL = [100, 320, 330, 500, 900, 0]
+
+# game phase contributed by each piece type, 24 with all pieces on the board
+PHASE_WEIGHTS = [0, 1, 1, 2, 4, 0]
+MAX_PHASE = 24
+
+PAWN_TABLE = [
+     0,  0,  0,  0,  0,  0,  0,  0,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    10, 10, 20, 30, 30, 20, 10, 10,
+     5,  5, 10, 25, 25, 10,  5,  5,
+     0,  0,  0, 20, 20,  0,  0,  0,
+     5, -5,-10,  0,  0,-10, -5,  5,
+     5, 10, 10,-20,-20, 10, 10,  5,
+     0,  0,  0,  0,  0,  0,  0,  0,
+]
+
+KNIGHT_TABLE = [
+   -50,-40,-30,-30,-30,-30,-40,-50,
+   -40,-20,  0,  0,  0,  0,-20,-40,
+   -30,  0, 10, 15, 15, 10,  0,-30,
+   -30,  5, 15, 20, 20, 15,  5,-30,
+   -30,  0, 15, 20, 20, 15,  0,-30,
+   -30,  5, 10, 15, 15, 10,  5,-30,
+   -40,-20,  0,  5,  5,  0,-20,-40,
+   -50,-40,-30,-30,-30,-30,-40,-50,
+]
+
+BISHOP_TABLE = [
+   -20,-10,-10,-10,-10,-10,-10,-20,
+   -10,  0,  0,  0,  0,  0,  0,-10,
+   -10,  0,  5, 10, 10,  5,  0,-10,
+   -10,  5,  5, 10, 10,  5,  5,-10,
+   -10,  0, 10, 10, 10, 10,  0,-10,
+   -10, 10, 10, 10, 10, 10, 10,-10,
+   -10,  5,  0,  0,  0,  0,  5,-10,
+   -20,-10,-10,-10,-10,-10,-10,-20,
+]
+
+ROOK_TABLE = [
+     0,  0,  0,  0,  0,  0,  0,  0,
+     5, 10, 10, 10, 10, 10, 10,  5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+     0,  0,  0,  5,  5,  0,  0,  0,
+]
+
+QUEEN_TABLE = [
+   -20,-10,-10, -5, -5,-10,-10,-20,
+   -10,  0,  0,  0,  0,  0,  0,-10,
+   -10,  0,  5,  5,  5,  5,  0,-10,
+    -5,  0,  5,  5,  5,  5,  0, -5,
+     0,  0,  5,  5,  5,  5,  0, -5,
+   -10,  5,  5,  5,  5,  5,  0,-10,
+   -10,  0,  5,  0,  0,  0,  0,-10,
+   -20,-10,-10, -5, -5,-10,-10,-20,
+]
+
+KING_MIDDLE_GAME_TABLE = [
+   -30,-40,-40,-50,-50,-40,-40,-30,
+   -30,-40,-40,-50,-50,-40,-40,-30,
+   -30,-40,-40,-50,-50,-40,-40,-30,
+   -30,-40,-40,-50,-50,-40,-40,-30,
+   -20,-30,-30,-40,-40,-30,-30,-20,
+   -10,-20,-20,-20,-20,-20,-20,-10,
+    20, 20,  0,  0,  0,  0, 20, 20,
+    20, 30, 10,  0,  0, 10, 30, 20,
+]
+
+KING_END_GAME_TABLE = [
+   -50,-40,-30,-20,-20,-30,-40,-50,
+   -30,-20,-10,  0,  0,-10,-20,-30,
+   -30,-10, 20, 30, 30, 20,-10,-30,
+   -30,-10, 30, 40, 40, 30,-10,-30,
+   -30,-10, 30, 40, 40, 30,-10,-30,
+   -30,-10, 20, 30, 30, 20,-10,-30,
+   -30,-30,  0,  0,  0,  0,-30,-30,
+   -50,-30,-30,-30,-30,-30,-30,-50,
+]
+
+_MIDDLE_GAME_TABLES = [PAWN_TABLE, KNIGHT_TABLE, BISHOP_TABLE, ROOK_TABLE,
+                       QUEEN_TABLE, KING_MIDDLE_GAME_TABLE]
+_END_GAME_TABLES = [PAWN_TABLE, KNIGHT_TABLE, BISHOP_TABLE, ROOK_TABLE,
+                    QUEEN_TABLE, KING_END_GAME_TABLE]
+
+
+def _piece_square_values(tables: list[list[int]]) -> list[list[int]]:
+    # material + table value of every piece (color * 6 + type) on every square,
+    # black reads the white table upside down
+    output = []
+    for color in range(2):
+        for piece_type in range(6):
+            table = tables[piece_type]
+            output.append([
+                MATERIAL[piece_type] + table[sq if color == 0 else sq ^ 56]
+                for sq in range(64)
+            ])
+    return output
+
+
+# MIDDLE_GAME[piece][square] and END_GAME[piece][square]
+MIDDLE_GAME = _piece_square_values(_MIDDLE_GAME_TABLES)
+END_GAME = _piece_square_values(_END_GAME_TABLES)
+# PHASE[piece] for piece = color * 6 + type
+PHASE = PHASE_WEIGHTS * 2
+
+
+def tapered_score(middle_game: int, end_game: int, phase: int) -> int:
+    # blends the two scores (white minus black) by the game phase
+    phase = min(phase, MAX_PHASE)
+    return (middle_game * phase + end_game * (MAX_PHASE - phase)) // MAX_PHASE
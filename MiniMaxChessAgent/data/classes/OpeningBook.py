@@ -0,0 +1,131 @@
+# /* OpeningBook.py
+
+import mmap
+import random
+import struct
+
+from data.classes.Simulation import SimulationBoard
+from data.classes.PolyglotRandom import POLYGLOT_RANDOM
+from data.classes.Bitboard import (
+    WHITE, PAWN, KING, PAWN_ATTACKS, WHITE_KINGSIDE, WHITE_QUEENSIDE,
+    BLACK_KINGSIDE, BLACK_QUEENSIDE, EN_PASSANT, encode_move
+)
+
+# Reader for Polyglot (.bin) opening books. A book is a sorted array of 16
+# byte big-endian entries (key, move, weight, learn), so the file is memory
+# mapped and the entries of a position are found by binary search. Worker
+# processes opening the same book share its pages through the page cache.
+ENTRY = struct.Struct('>QHHI')
+
+# offsets of the castling, en passant and side to move keys in POLYGLOT_RANDOM
+CASTLING_OFFSET = 768
+EN_PASSANT_OFFSET = 772
+TURN_OFFSET = 780
+CASTLING_RIGHTS = (WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE)
+
+
+def polyglot_key(board: SimulationBoard, ep_square: int | None = None) -> int:
+    # the Polyglot hash of the position. Polyglot numbers the pieces
+    # black pawn, white pawn, black knight, ... and the rows from rank 1,
+    # while the boards put rank 8 first. ep_square overrides the board's,
+    # which game rule boards never set (see Board.ep_square).
+    if ep_square is None:
+        ep_square = board.ep_square
+    key = 0
+    for sq, piece in enumerate(board.mailbox):
+        if piece >= 0:
+            kind = (piece % 6) * 2 + (1 if piece < 6 else 0)
+            key ^= POLYGLOT_RANDOM[64 * kind + 8 * (7 - sq // 8) + sq % 8]
+    for i, right in enumerate(CASTLING_RIGHTS):
+        if board.castling & right:
+            key ^= POLYGLOT_RANDOM[CASTLING_OFFSET + i]
+    # the en passant file only counts when a pawn can capture there, which
+    # is how SimulationBoard sets ep_square too
+    if ep_square >= 0 and PAWN_ATTACKS[board.side ^ 1][ep_square] \
+            & board.bitboards[board.side * 6 + PAWN]:
+        key ^= POLYGLOT_RANDOM[EN_PASSANT_OFFSET + ep_square % 8]
+    if board.side == WHITE:
+        key ^= POLYGLOT_RANDOM[TURN_OFFSET]
+    return key
+
+
+def decode_move(board: SimulationBoard, book_move: int) -> int:
+    # a Polyglot move as a packed move of the board. Castling is stored as
+    # the king taking its own rook and promotions number knight 1 to queen 4,
+    # which happens to be our piece type order.
+    to_x, to_row = book_move & 7, (book_move >> 3) & 7
+    from_x, from_row = (book_move >> 6) & 7, (book_move >> 9) & 7
+    promotion = (book_move >> 12) & 7
+    frm = (7 - from_row) * 8 + from_x
+    to = (7 - to_row) * 8 + to_x
+    piece = board.mailbox[frm]
+    if piece >= 0 and piece % 6 == KING and from_row == to_row and abs(to_x - from_x) > 2:
+        to = frm + (2 if to_x > from_x else -2)
+    elif piece >= 0 and piece % 6 == PAWN and to == board.ep_square:
+        return encode_move(frm, to) | EN_PASSANT
+    return encode_move(frm, to, promotion)
+
+
+class PolyglotBook:
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, 'rb')
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.map = None  # an empty book can not be mapped
+        self.size = len(self.map) // ENTRY.size if self.map is not None else 0
+
+    def entry(self, index: int) -> tuple[int, int, int, int]:
+        return ENTRY.unpack_from(self.map, index * ENTRY.size)
+
+    def entries(self, key: int) -> list[tuple[int, int]]:
+        # (move, weight) of every book entry of the position key
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if ENTRY.unpack_from(self.map, middle * ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        output = []
+        while low < self.size:
+            entry_key, move, weight, _ = self.entry(low)
+            if entry_key != key:
+                break
+            output.append((move, weight))
+            low += 1
+        return output
+
+    def find_move(self, board: SimulationBoard, mode: str = 'weighted',
+                  rng: random.Random | None = None, ep_square: int | None = None) -> int | None:
+        # a legal move of the board from the book, None when the position is
+        # not in it. 'weighted' picks a move with probability proportional to
+        # its weight, 'best' always plays the heaviest one. ep_square is
+        # passed on to polyglot_key.
+        legal = set(board.get_legal_moves())
+        candidates = []
+        for book_move, weight in self.entries(polyglot_key(board, ep_square)):
+            move = decode_move(board, book_move)
+            # moves the rules of the board do not allow (e.g. en passant in a
+            # game position) are skipped
+            if move in legal:
+                candidates.append((move, weight))
+        if not candidates:
+            return None
+        if mode == 'best':
+            return max(candidates, key=lambda candidate: candidate[1])[0]
+        total = sum(weight for _, weight in candidates)
+        if total == 0:
+            return candidates[0][0]
+        pick = (rng or random).random() * total
+        for move, weight in candidates:
+            pick -= weight
+            if pick < 0:
+                return move
+        return candidates[-1][0]
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
@@ -0,0 +1,339 @@
+# /* ParallelSearch.py
+
+# Parallel searches for MinimaxAgent over a pool of persistent worker
+# processes. Each worker owns a MinimaxAgent (with its own killers and
+# history) and receives only compact SimulationBoard snapshots.
+#
+#   RootParallelSearch  the root moves of every iterative deepening iteration
+#                       are spread over the workers, each with its own table
+#   LazySMPSearch       every worker searches the whole root at staggered
+#                       depths, all of them sharing one transposition table
+#                       in shared memory
+#   PonderSearch        one background worker searching the positions the
+#                       opponent can reach while it thinks
+
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, Future, TimeoutError
+
+from data.classes.Simulation import SimulationBoard
+from data.classes.TranspositionTable import SharedTranspositionTable
+from data.classes.agents.MinimaxAgent import (
+    MinimaxAgent, MATE_BOUND, INFINITY, SearchAborted, COUNTERS
+)
+
+# the lowest possible value of the shared alpha, below any score
+NO_ALPHA = -(1 << 62)
+
+# worker process state, set up once by _init_worker
+_agent = None
+_shared_alpha = None
+_search_id = None
+
+
+def _init_worker(color, agent_kwargs, shared_alpha, shared_nodes, stop_flag,
+                 shared_tt=None):
+    # shared_tt is (name, size_mb) of a SharedTranspositionTable to search with
+    global _agent, _shared_alpha
+    if shared_tt is not None:
+        # skip allocating a private table that would be replaced right away
+        agent_kwargs = dict(agent_kwargs, tt_size_mb=0)
+    _agent = MinimaxAgent(color, **agent_kwargs)
+    _agent.shared_nodes = shared_nodes
+    _agent.stop_flag = stop_flag
+    if shared_tt is not None:
+        name, size_mb = shared_tt
+        _agent.tt = SharedTranspositionTable(size_mb, name=name)
+    _shared_alpha = shared_alpha
+
+
+def _ready():
+    return True
+
+
+def _search_moves(search_id, snapshot, moves, depth, deadline, node_limit):
+    # Searches the given root moves. Every result is (move, value, exact);
+    # a move is searched against the best value found so far by any worker
+    # minus one, so moves as good as the best one still come back exact and
+    # the merge does not depend on which worker finished first.
+    # Returns (results, search counters, aborted).
+    global _search_id
+    agent = _agent
+    if search_id != _search_id:
+        _search_id = search_id
+        agent.new_search()
+    agent.reset_counters()
+    agent.deadline = deadline
+    agent.node_limit = node_limit
+    board = SimulationBoard.from_snapshot(snapshot)
+    agent.root_ply = len(board.history)
+    results = []
+    try:
+        for move in moves:
+            alpha = _shared_alpha.value
+            window = alpha - 1 if alpha != NO_ALPHA else -INFINITY
+            board.make_move(move)
+            value = -agent.negamax(board, depth - 1, -INFINITY, -window)
+            board.unmake_move()
+            exact = value > window
+            if exact:
+                with _shared_alpha.get_lock():
+                    if value > _shared_alpha.value:
+                        _shared_alpha.value = value
+            results.append((move, value, exact))
+    except SearchAborted:
+        return results, agent.counters(), True
+    return results, agent.counters(), False
+
+
+def _lazy_smp_search(search_id, generation, snapshot, helper, max_depth,
+                     deadline, node_limit):
+    # One thread of a Lazy SMP search, an ordinary iterative deepening of the
+    # whole root. Odd helpers start one ply deeper and every helper breaks
+    # ties in its own random order, so the workers spread over the tree and
+    # fill the shared table for each other.
+    # Returns (depth completed, best move, value, search counters).
+    global _search_id
+    agent = _agent
+    if search_id != _search_id:
+        _search_id = search_id
+        agent.new_search()
+        if agent.rng is not None and helper:
+            agent.rng = random.Random(search_id * 1000 + helper)
+    # the table generation is kept by the main process
+    agent.tt.generation = generation
+    agent.reset_counters()
+    agent.deadline = deadline
+    agent.node_limit = node_limit
+    board = SimulationBoard.from_snapshot(snapshot)
+    agent.root_ply = len(board.history)
+    possible_moves = agent.get_all_possible_moves(board, board.turn)
+    if not possible_moves:
+        return 0, None, None, agent.counters()
+    entry = agent.tt.probe(board.key)
+    agent.order_moves(board, possible_moves, 0, entry[0] if entry else 0)
+    completed, best_move, best_value = 0, possible_moves[0]['move'], None
+    for depth in range(1 + helper % 2, max_depth + 1):
+        try:
+            value, move = agent.search_depth(board, possible_moves, depth, best_value)
+        except SearchAborted:
+            break
+        completed, best_move, best_value = depth, move['move'], value
+        possible_moves.remove(move)
+        possible_moves.insert(0, move)
+        if abs(value) > MATE_BOUND:
+            break
+    return completed, best_move, best_value, agent.counters()
+
+
+def _ponder_search(snapshot):
+    # One search of PonderSearch, as deep as the agent's max_depth or until
+    # the stop flag is raised. Returns (value, best move, depth completed,
+    # search statistics).
+    agent = _agent
+    board = SimulationBoard.from_snapshot(snapshot)
+    value, move, depth = agent.search(board)
+    return value, move['move'] if move else None, depth, agent.last_stats
+
+
+class _WorkerPool:
+    def __init__(self, color: str, workers: int, agent_kwargs: dict, shared_tt=None):
+        context = multiprocessing.get_context('spawn')
+        self.workers = workers
+        self.shared_alpha = context.Value('q', NO_ALPHA)
+        self.shared_nodes = context.Value('q', 0)
+        self.stop_flag = context.Value('b', 0)
+        # set by cancel() until the agent's decision is over, the searches
+        # started meanwhile stop right away
+        self.cancelled = False
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(color, agent_kwargs, self.shared_alpha, self.shared_nodes,
+                      self.stop_flag, shared_tt),
+        )
+        self.search_id = 0
+        # search counters of the last search summed over the workers (see
+        # MinimaxAgent.counters), and the nodes after each completed iteration
+        self.nodes = 0
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.iteration_nodes: list[int] = []
+        # start the processes now rather than inside the first timed search
+        for future in [self.executor.submit(_ready) for _ in range(workers)]:
+            future.result()
+
+    def start_search(self):
+        self.search_id += 1
+        self.nodes = 0
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.iteration_nodes = []
+        self.shared_nodes.value = 0
+        with self.stop_flag.get_lock():
+            self.stop_flag.value = int(self.cancelled)
+
+    def cancel(self):
+        # stops the running search, from another thread
+        with self.stop_flag.get_lock():
+            self.cancelled = True
+            self.stop_flag.value = 1
+
+    def add_counters(self, counters: dict):
+        for name, value in counters.items():
+            self.counters[name] += value
+        self.nodes = self.counters['nodes']
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+
+class RootParallelSearch(_WorkerPool):
+    def __init__(self, color: str, workers: int, agent_kwargs: dict,
+                 chunk_size: int = 1):
+        super().__init__(color, workers, agent_kwargs)
+        self.chunk_size = chunk_size
+
+    def search(self, board: SimulationBoard, possible_moves: list[dict], max_depth: int,
+               deadline: float | None, node_limit: int | None):
+        # iterative deepening over the pool, returns (best value, best move
+        # dict, depth) of the deepest iteration that completed
+        if not possible_moves:
+            return None, None, 0
+        self.start_search()
+        snapshot = board.snapshot()
+        best_value, best_move, completed = None, possible_moves[0], 0
+        for depth in range(1, max_depth + 1):
+            if deadline is not None and time.time() >= deadline:
+                break
+            self.shared_alpha.value = NO_ALPHA
+            index = {move['move']: i for i, move in enumerate(possible_moves)}
+            chunks = [
+                [move['move'] for move in possible_moves[i:i + self.chunk_size]]
+                for i in range(0, len(possible_moves), self.chunk_size)
+            ]
+            futures = [
+                self.executor.submit(_search_moves, self.search_id, snapshot, chunk,
+                                     depth, deadline, node_limit)
+                for chunk in chunks
+            ]
+            results = []
+            aborted = False
+            for future in futures:
+                chunk_results, counters, chunk_aborted = future.result()
+                results.extend(chunk_results)
+                self.add_counters(counters)
+                aborted = aborted or chunk_aborted
+            if aborted:
+                break
+            # deterministic merge: highest exact value, ties go to the move
+            # that came first in the root ordering
+            value, position = max(
+                (value, -index[move]) for move, value, exact in results if exact
+            )
+            best_value, best_move, completed = value, possible_moves[-position], depth
+            self.iteration_nodes.append(self.nodes)
+            possible_moves.remove(best_move)
+            possible_moves.insert(0, best_move)
+            if abs(best_value) > MATE_BOUND:
+                break  # a forced mate was found, searching deeper will not change it
+        return best_value, best_move, completed
+
+
+class LazySMPSearch(_WorkerPool):
+    def __init__(self, color: str, workers: int, agent_kwargs: dict):
+        size_mb = agent_kwargs.get('tt_size_mb', 16)
+        self.tt = SharedTranspositionTable(size_mb)
+        super().__init__(color, workers, agent_kwargs, shared_tt=(self.tt.name, size_mb))
+
+    def search(self, board: SimulationBoard, possible_moves: list[dict], max_depth: int,
+               deadline: float | None, node_limit: int | None):
+        # returns (best value, best move dict, depth) of the deepest iteration
+        # completed by any worker, ties going to the main worker (helper 0)
+        if not possible_moves:
+            return None, None, 0
+        self.start_search()
+        self.tt.new_search()
+        snapshot = board.snapshot()
+        futures = [
+            self.executor.submit(_lazy_smp_search, self.search_id, self.tt.generation,
+                                 snapshot, helper, max_depth, deadline, node_limit)
+            for helper in range(self.workers)
+        ]
+        # the search is over once the main worker is done, the helpers are
+        # stopped at their next budget check
+        results = [futures[0].result()]
+        self.stop_flag.value = 1
+        results.extend(future.result() for future in futures[1:])
+        for result in results:
+            self.add_counters(result[3])
+        completed, helper = max(
+            (depth, -helper) for helper, (depth, _, _, _) in enumerate(results)
+        )
+        _, move, value, _ = results[-helper]
+        by_move = {possible_move['move']: possible_move for possible_move in possible_moves}
+        return value, by_move[move], completed
+
+    def close(self):
+        super().close()
+        self.tt.close()
+
+
+class PonderSearch(_WorkerPool):
+    # Searches on the opponent's time. Once the agent has chosen its move,
+    # start() queues a search of every expected reply of the opponent on a
+    # single worker; when the opponent's move is known, result() returns the
+    # search of the position it led to (a ponderhit) and drops the others.
+    def __init__(self, color: str, agent_kwargs: dict):
+        super().__init__(color, 1, agent_kwargs)
+        # pondered searches by the key of their position
+        self.futures: dict[int, Future] = {}
+
+    def start(self, board: SimulationBoard, replies: list[int]):
+        # board is the position after the agent's move, replies are searched
+        # in the given order
+        self.stop()
+        self.cancelled = False
+        self.start_search()
+        for reply in replies:
+            board.make_move(reply)
+            self.futures[board.key] = self.executor.submit(_ponder_search, board.snapshot())
+            board.unmake_move()
+
+    def result(self, board: SimulationBoard, timeout: float | None = None):
+        # (value, move, depth, statistics) of the pondered search of board's
+        # position, waiting at most timeout seconds for it before stopping it
+        # at its last completed depth. None when the position was not
+        # pondered or its search had not started yet.
+        future = self.futures.pop(board.key, None)
+        if future is not None and future.cancel():
+            future = None
+        if future is None:
+            self.stop()
+            return None
+        # a single worker, every other search is either done or still queued
+        for other in self.futures.values():
+            other.cancel()
+        self.futures.clear()
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            self.stop_flag.value = 1
+            return future.result()
+        finally:
+            self.stop_flag.value = int(self.cancelled)
+
+    def stop(self):
+        # drops every pondered search, waiting for the running one to stop
+        for future in self.futures.values():
+            future.cancel()
+        self.stop_flag.value = 1
+        for future in self.futures.values():
+            if not future.cancelled():
+                future.exception()
+        self.futures.clear()
+        self.stop_flag.value = int(self.cancelled)
+
+    def close(self):
+        self.stop()
+        super().close()
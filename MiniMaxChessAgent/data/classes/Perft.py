@@ -0,0 +1,151 @@
+# /* Perft.py
+
+# Move generator benchmark and regression check: perft counts the leaf nodes
+# of the legal move tree down to a depth, divide breaks the count down by
+# root move. Positions are given as FEN and played with the standard rules
+# (en passant, under-promotions) so the counts can be compared with the
+# published ones; --game-rules plays them with the rules of Board instead.
+#
+#   python -m data.classes.Perft --depth 4
+#   python -m data.classes.Perft --fen "<fen>" --depth 3 --divide
+#   python -m data.classes.Perft --reference --max-nodes 2000000 --workers 4
+
+import argparse
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from data.classes.Simulation import SimulationBoard, START_FEN
+from data.classes.Bitboard import move_uci
+
+# (name, FEN, leaf counts for depth 1, 2, ...) of the usual perft positions
+REFERENCE_POSITIONS = [
+    ('start', START_FEN,
+     [20, 400, 8902, 197281, 4865609]),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+     [48, 2039, 97862, 4085603]),
+    ('position 3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+     [14, 191, 2812, 43238, 674624]),
+    ('position 4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+     [6, 264, 9467, 422333]),
+    ('position 5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+     [44, 1486, 62379, 2103487]),
+    ('position 6', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+     [46, 2079, 89890, 3894594]),
+]
+
+
+def perft(board: SimulationBoard, depth: int) -> int:
+    moves = board.get_legal_moves()
+    if depth <= 1:
+        # the last ply is counted without playing it
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        board.make_move(move)
+        nodes += perft(board, depth - 1)
+        board.unmake_move()
+    return nodes
+
+
+def _perft_move(snapshot, move: int, depth: int) -> int:
+    board = SimulationBoard.from_snapshot(snapshot)
+    board.make_move(move)
+    return perft(board, depth - 1)
+
+
+def divide(board: SimulationBoard, depth: int, executor: ProcessPoolExecutor = None) \
+        -> list[tuple[str, int]]:
+    # (move in UCI notation, leaf count below it) for every root move, the
+    # root moves are spread over the executor's workers when one is given
+    moves = board.get_legal_moves()
+    if executor is None:
+        counts = []
+        for move in moves:
+            board.make_move(move)
+            counts.append(perft(board, depth - 1))
+            board.unmake_move()
+    else:
+        snapshot = board.snapshot()
+        counts = list(executor.map(_perft_move, [snapshot] * len(moves), moves,
+                                   [depth] * len(moves)))
+    return sorted(zip(map(move_uci, moves), counts))
+
+
+def make_executor(workers: int) -> ProcessPoolExecutor | None:
+    if workers <= 1:
+        return None
+    return ProcessPoolExecutor(max_workers=workers,
+                               mp_context=multiprocessing.get_context('spawn'))
+
+
+def run_perft(board: SimulationBoard, depth: int, executor=None, show_divide: bool = False) -> int:
+    start_time = time.time()
+    if depth >= 2 and (executor is not None or show_divide):
+        counts = divide(board, depth, executor)
+        if show_divide:
+            for move, count in counts:
+                print(f'{move}: {count}')
+        nodes = sum(count for _, count in counts)
+    else:
+        nodes = perft(board, depth)
+    elapsed = time.time() - start_time
+    print(f'depth {depth}: {nodes} nodes in {elapsed:.3f} seconds '
+          f'({nodes / max(elapsed, 1e-9):.0f} nodes/second)')
+    return nodes
+
+
+def run_reference(max_depth: int | None, max_nodes: int, executor=None) -> bool:
+    # checks the generator against REFERENCE_POSITIONS, every position up to
+    # max_depth or the deepest count not above max_nodes
+    ok = True
+    for name, fen, counts in REFERENCE_POSITIONS:
+        for depth, expected in enumerate(counts, 1):
+            if (max_depth is not None and depth > max_depth) or expected > max_nodes:
+                break
+            board = SimulationBoard.from_fen(fen)
+            start_time = time.time()
+            if executor is not None and depth >= 2:
+                nodes = sum(count for _, count in divide(board, depth, executor))
+            else:
+                nodes = perft(board, depth)
+            elapsed = time.time() - start_time
+            status = 'ok' if nodes == expected else f'FAILED, expected {expected}'
+            ok = ok and nodes == expected
+            print(f'{name} depth {depth}: {nodes} nodes '
+                  f'({nodes / max(elapsed, 1e-9):.0f} nodes/second) {status}')
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count move generator leaf nodes (perft).")
+    parser.add_argument('--fen', type=str, default=START_FEN, help="position to search")
+    parser.add_argument('--depth', type=int, default=4, help="depth in plies")
+    parser.add_argument('--divide', action='store_true', help="print the count of every root move")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="processes the root moves are spread over")
+    parser.add_argument('--game-rules', action='store_true',
+                        help="no en passant and queen only promotions, like Board")
+    parser.add_argument('--reference', action='store_true',
+                        help="check the counts of the bundled reference positions")
+    parser.add_argument('--max-nodes', type=int, default=1000000,
+                        help="largest reference count checked with --reference")
+    args = parser.parse_args()
+
+    executor = make_executor(args.workers)
+    try:
+        if args.reference:
+            max_depth = args.depth if '--depth' in sys.argv else None
+            if not run_reference(max_depth, args.max_nodes, executor):
+                sys.exit(1)
+        else:
+            board = SimulationBoard.from_fen(args.fen, standard=not args.game_rules)
+            run_perft(board, args.depth, executor, args.divide)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
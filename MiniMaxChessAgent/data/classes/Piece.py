@@ -40,11 +40,8 @@ class Piece:
         return output
 
     def get_valid_moves(self, board: Board) -> list[Square]:
-        output: list[Square] = []
-        for square in self.get_moves(board):
-            if not board.is_in_check(self.color, board_change=[self.pos, square.pos]):
-                output.append(square)
-        return output
+        # checkers and pins are worked out once per position by the attack map
+        return board.attack_map.legal_moves(self, self.get_moves(board))
 
     def move(self, board: Board, square: Square, force: bool=False) -> bool:
         if (square is None):
@@ -59,7 +56,7 @@ class Piece:
             board.selected_square = None
             self.has_moved = True
             # Pawn promotion
-            if self.notation == ' ':
+            if self.notation == 'P':
                 if self.y == 0 or self.y == 7:
                     from data.classes.pieces.Queen import Queen
                     square.occupying_piece = Queen(
@@ -67,6 +64,7 @@ class Piece:
                         self.color,
                         board
                     )
+            board.attack_map.update(prev_square.pos, square.pos)
             # Move rook if king castles
             if self.notation == 'K':
                 if prev_square.x - self.x == 2:
@@ -0,0 +1,190 @@
+# /* Profiling.py
+
+# Opt-in profiling of the decisions of a game. It is turned on by the
+# CHESS_PROFILE environment variable, naming a directory, or main.py
+# --profile DIR. Processes started afterwards (e.g. the workers of
+# run_experiments) inherit the variable. Every choose_action played through
+# play_game is then profiled on its own:
+#
+#   DIR/<pid>-<n>-<color>.pstats     cProfile output (CHESS_PROFILE_FORMAT=pstats,
+#                                    the default), e.g. for snakeviz or pstats
+#   DIR/<pid>-<n>-<color>.collapsed  sampled stacks (CHESS_PROFILE_FORMAT=collapsed),
+#                                    one "frame;frame;frame count" line per
+#                                    stack, for flamegraph.pl or speedscope
+#   DIR/decisions.jsonl              one line per decision: its file, the
+#                                    position, the decision time and the
+#                                    calls and seconds spent in move
+#                                    generation and check detection
+#
+# so a slow move can be picked from decisions.jsonl and its profile opened.
+# The profile covers the thread running choose_action (see running()), also
+# when that is the background thread of ChessAgent.start_search, as in
+# chess_match or with a move time, but not the workers of a parallel search.
+# Switched off, a decision costs one environment lookup and nothing is
+# wrapped.
+
+import cProfile
+import collections
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+PROFILE_ENV = 'CHESS_PROFILE'
+FORMAT_ENV = 'CHESS_PROFILE_FORMAT'
+FORMATS = ('pstats', 'collapsed')
+# seconds between two stack samples of the collapsed format
+SAMPLE_INTERVAL = 0.001
+
+# calls, seconds and the depth of the calls in progress per section of the
+# current decision, see instrument()
+_sections: dict[str, list] = {}
+_instrumented = False
+_decisions = 0
+# the profiler of the decision in progress, None between decisions
+_profiler = None
+
+
+def configure(directory: str | None, profile_format: str = 'pstats'):
+    # turns profiling on, or off with directory None, for this process and
+    # the processes it starts
+    if directory is None:
+        os.environ.pop(PROFILE_ENV, None)
+        return
+    if profile_format not in FORMATS:
+        raise ValueError(f'unknown profile format {profile_format!r}')
+    os.makedirs(directory, exist_ok=True)
+    os.environ[PROFILE_ENV] = directory
+    os.environ[FORMAT_ENV] = profile_format
+
+
+def _timed(name: str, function):
+    # a call made from inside the same section (e.g. Board.is_in_check
+    # asking the attack map) is part of the outer one, not counted again
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        section = _sections[name]
+        if section[2]:
+            return function(*args, **kwargs)
+        section[2] = 1
+        start_time = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            section[0] += 1
+            section[1] += time.perf_counter() - start_time
+            section[2] = 0
+    return wrapper
+
+
+def instrument():
+    # wraps the timed sections, once per process and only when profiling
+    global _instrumented
+    if _instrumented:
+        return
+    _instrumented = True
+    from data.classes.AttackMap import AttackMap
+    from data.classes.Board import Board
+    from data.classes.Piece import Piece
+    from data.classes.pieces.King import King
+    from data.classes.Simulation import SimulationBoard
+    # the GUI board's legal moves are checked through the attack map, the
+    # search's through the simulation board
+    for name, owner, attribute in (('movegen', SimulationBoard, 'generate_moves'),
+                                   ('movegen', Piece, 'get_valid_moves'),
+                                   ('movegen', King, 'get_valid_moves'),
+                                   ('is_in_check', Board, 'is_in_check'),
+                                   ('is_in_check', AttackMap, 'is_in_check'),
+                                   ('is_in_check', SimulationBoard, 'is_in_check')):
+        _sections[name] = [0, 0.0, 0]
+        setattr(owner, attribute, _timed(name, getattr(owner, attribute)))
+
+
+class StackSampler:
+    # Samples the stack of the thread that enabled it every SAMPLE_INTERVAL
+    # seconds from a thread of its own, counting identical stacks. Used like
+    # a cProfile.Profile. A signal based sampler would only see the main
+    # thread, which often just waits for the search (see ChessMatch.choose).
+    def __init__(self):
+        self.stacks = collections.Counter()
+        self.thread = None
+        self.stopped = threading.Event()
+        self.sampler = None
+
+    def sample(self):
+        while not self.stopped.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.thread)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def enable(self):
+        self.thread = threading.get_ident()
+        self.stopped.clear()
+        self.sampler = threading.Thread(target=self.sample, daemon=True)
+        self.sampler.start()
+
+    def disable(self):
+        self.stopped.set()
+        self.sampler.join()
+
+    def dump_stats(self, path: str):
+        with open(path, 'w') as file:
+            for stack, count in self.stacks.items():
+                file.write(f'{stack} {count}\n')
+
+
+@contextlib.contextmanager
+def decision(board, agent):
+    # profiles the block, one decision of agent on board, when profiling is
+    # turned on. Its choose_action has to run inside running(), in whichever
+    # thread it runs.
+    directory = os.environ.get(PROFILE_ENV)
+    if not directory:
+        yield
+        return
+    global _decisions, _profiler
+    instrument()
+    _decisions += 1
+    profile_format = os.environ.get(FORMAT_ENV, 'pstats')
+    name = f'{os.getpid()}-{_decisions:05d}-{agent.color}.{profile_format}'
+    fen = board.fen()
+    for section in _sections.values():
+        section[0], section[1] = 0, 0.0
+    profiler = StackSampler() if profile_format == 'collapsed' else cProfile.Profile()
+    _profiler = profiler
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        _profiler = None
+        seconds = time.perf_counter() - start_time
+        profiler.dump_stats(os.path.join(directory, name))
+        record = dict(file=name, agent=type(agent).__name__, color=agent.color, fen=fen,
+                      seconds=round(seconds, 4),
+                      sections={section: {'calls': calls, 'seconds': round(total, 4)}
+                                for section, (calls, total, _) in _sections.items()})
+        with open(os.path.join(directory, 'decisions.jsonl'), 'a') as file:
+            file.write(json.dumps(record) + '\n')
+
+
+@contextlib.contextmanager
+def running():
+    # profiles the block, the choose_action of the decision in progress, in
+    # the calling thread. Nothing is profiled outside of a decision.
+    profiler = _profiler
+    if profiler is None:
+        yield
+        return
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
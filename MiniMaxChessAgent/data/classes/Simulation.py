@@ -1,182 +1,39 @@
 from typing import Literal, List, Tuple
 from data.classes.Board import Board
+from data.classes.Bitboard import (
+    WHITE, BLACK, COLORS, COLOR_INDEX, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING,
+    PIECE_NOTATION, PIECE_TYPE, EMPTY, FULL, WHITE_KINGSIDE, WHITE_QUEENSIDE,
+    BLACK_KINGSIDE, BLACK_QUEENSIDE, KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS,
+    CASTLING_MASKS, BETWEEN, EN_PASSANT, rank_mask, rook_attacks, bishop_attacks,
+    square_index, encode_move, move_from, move_to, move_promotion
+)
+from data.classes.Zobrist import PIECE_KEYS, SIDE_KEY, CASTLING_KEYS, EN_PASSANT_KEYS, compute_key
+from data.classes.Evaluation import MIDDLE_GAME, END_GAME, PHASE
 
 class SmSq:
+    # Lightweight square handle used in the move dicts of the agents.
+    # Squares carry no piece, the position lives in the board bitboards.
     def __init__(self, x: int, y: int):
         self.x = x
         self.y = y
         self.pos = (x,y)
-        self.occupying_piece: SimulationPiece = None
-
-class SimulationPiece:
-    def __init__(self, pos: Tuple[int, int], color: Literal['white', 'black']):
-        self.pos = pos
-        self.color = color
-        self.notation = ' '
-        self.has_moved = False
-
-    def get_valid_moves(self, board: 'SimulationBoard') -> List[SmSq]:
-        # To be implemented in specific piece subclasses
-        return []
-
-class SimulationPawn(SimulationPiece):
-    def __init__(self, pos: Tuple[int, int], color: Literal['white', 'black']):
-        super().__init__(pos, color)
-        self.notation = 'P'
-
-    def get_valid_moves(self, board: 'SimulationBoard') -> List['SmSq']:
-        valid_moves = []
-
-        # Determine movement direction based on the pawn's color
-        direction = -1 if self.color == 'white' else 1
-
-        # Get the current position of the pawn
-        curr_x, curr_y = self.pos
-
-        # Normal pawn movement (forward by 1 square)
-        forward_pos = (curr_x, curr_y + direction)
-
-        # Check if the forward square is empty
-        if board.is_empty(forward_pos):
-            valid_moves.append(forward_pos)
-
-        
-        for diag_x in [-1, 1]:  # Diagonals (left and right)
-            diagonal_pos = (curr_x + diag_x, curr_y + direction)
-            if board.is_enemy(diagonal_pos, self.color):  # Can capture if there's an enemy piece
-                valid_moves.append(diagonal_pos)
-
-        return valid_moves
-
-class SimulationKnight(SimulationPiece):
-    def __init__(self, pos: Tuple[int, int], color: Literal['white', 'black']):
-        super().__init__(pos, color)
-        self.notation = 'N'
-
-
-    def get_valid_moves(self, board: 'SimulationBoard') -> List['SmSq']:
-        valid_moves = []
-        x, y = self.pos
-        
-        # Knight moves (L-shape)
-        moves = [
-            (2, 1), (2, -1), (-2, 1), (-2, -1),
-            (1, 2), (1, -2), (-1, 2), (-1, -2)
-        ]
 
-        for dx, dy in moves:
-            target_x = x + dx
-            target_y = y + dy
-            
-            if 0 <= target_x < 8 and 0 <= target_y < 8:
-                target_square = board.get_square((target_x, target_y))
-                if target_square.occupying_piece is None or target_square.occupying_piece.color != self.color:
-                    valid_moves.append(target_square)  # Move or capture
-
-        return valid_moves
-
-class SimulationRook(SimulationPiece):
-    def __init__(self, pos: Tuple[int, int], color: Literal['white', 'black']):
-        super().__init__(pos, color)
-        self.notation = 'R'
-
-    def get_valid_moves(self, board: 'SimulationBoard') -> List['SmSq']:
-        valid_moves = []
-        x, y = self.pos
-
-        directions = [(1, 0), (-1, 0), (0, 1), (0, -1)]  # Right, Left, Down, Up
-        
-        for dx, dy in directions:
-            for i in range(1, 8):
-                target_x = x + dx * i
-                target_y = y + dy * i
-                
-                if 0 <= target_x < 8 and 0 <= target_y < 8:
-                    target_square = board.get_square((target_x, target_y))
-                    if target_square.occupying_piece is None:
-                        valid_moves.append(target_square)  # Empty square
-                    elif target_square.occupying_piece.color != self.color:
-                        valid_moves.append(target_square)  # Capture
-                        break
-                    else:
-                        break  # Blocked by own piece
-                else:
-                    break  # Out of bounds
-
-        return valid_moves
-
-class SimulationBishop(SimulationPiece):
-    def __init__(self, pos: Tuple[int, int], color: Literal['white', 'black']):
-        super().__init__(pos, color)
-        self.notation = 'B'
-
-    def get_valid_moves(self, board: 'SimulationBoard') -> List['SmSq']:
-        valid_moves = []
-        x, y = self.pos
-
-        # Diagonal moves
-        directions = [(1, 1), (1, -1), (-1, 1), (-1, -1)]  # Down-Right, Up-Right, Down-Left, Up-Left
-        
-        for dx, dy in directions:
-            for i in range(1, 8):
-                target_x = x + dx * i
-                target_y = y + dy * i
-                
-                if 0 <= target_x < 8 and 0 <= target_y < 8:
-                    target_square = board.get_square((target_x, target_y))
-                    if target_square.occupying_piece is None:
-                        valid_moves.append(target_square)  # Empty square
-                    elif target_square.occupying_piece.color != self.color:
-                        valid_moves.append(target_square)  # Capture
-                        break
-                    else:
-                        break  # Blocked by own piece
-                else:
-                    break  # Out of bounds
-
-        return valid_moves
-
-class SimulationQueen(SimulationPiece):
-    def __init__(self, pos: Tuple[int, int], color: Literal['white', 'black']):
-        super().__init__(pos, color)
-        self.notation = 'Q'
-
-    def get_valid_moves(self, board: 'SimulationBoard') -> List['SmSq']:
-        valid_moves = []
-        
-        # Combine rook and bishop movements
-        rook = SimulationRook(self.pos, self.color)
-        bishop = SimulationBishop(self.pos, self.color)
-        
-        valid_moves.extend(rook.get_valid_moves(board))
-        valid_moves.extend(bishop.get_valid_moves(board))
-
-        return valid_moves
-
-class SimulationKing(SimulationPiece):
-    def __init__(self, pos: Tuple[int, int], color: Literal['white', 'black']):
-        super().__init__(pos, color)
-        self.notation = 'K'
-
-    def get_valid_moves(self, board: 'SimulationBoard') -> List['SmSq']:
-        valid_moves = []
-        x, y = self.pos
-
-        # King can move one square in any direction
-        directions = [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)]
-        
-        for dx, dy in directions:
-            target_x = x + dx
-            target_y = y + dy
-            
-            if 0 <= target_x < 8 and 0 <= target_y < 8:
-                target_square = board.get_square((target_x, target_y))
-                if target_square.occupying_piece is None or target_square.occupying_piece.color != self.color:
-                    valid_moves.append(target_square)  # Move or capture
-
-        return valid_moves
+SQUARES: List[SmSq] = [SmSq(sq % 8, sq // 8) for sq in range(64)]
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+# promotions generated by each rule set, see SimulationBoard.standard
+GAME_PROMOTIONS = (QUEEN,)
+STANDARD_PROMOTIONS = (QUEEN, ROOK, BISHOP, KNIGHT)
+CASTLING_CHARACTERS = ((WHITE_KINGSIDE, 'K'), (WHITE_QUEENSIDE, 'Q'),
+                       (BLACK_KINGSIDE, 'k'), (BLACK_QUEENSIDE, 'q'))
+# (right, color, king square, rook square) of the castling rights
+CASTLING_SQUARES = ((WHITE_KINGSIDE, WHITE, 60, 63), (WHITE_QUEENSIDE, WHITE, 60, 56),
+                    (BLACK_KINGSIDE, BLACK, 4, 7), (BLACK_QUEENSIDE, BLACK, 4, 0))
 
 class SimulationBoard:
+    # Bitboard position used by the search. There is one bitboard per piece
+    # (index color * 6 + piece type), an occupancy mask per color and a
+    # mailbox to find the piece on a square without scanning the bitboards.
     def __init__(self):
         self.config = [
             ['bR', 'bN', 'bB', 'bQ', 'bK', 'bB', 'bN', 'bR'],
@@ -188,135 +45,622 @@ class SimulationBoard:
             ['wP', 'wP', 'wP', 'wP', 'wP', 'wP', 'wP', 'wP'],
             ['wR', 'wN', 'wB', 'wQ', 'wK', 'wB', 'wN', 'wR'],
         ]
-        self.turn: Literal['white', 'black'] = 'white'
-        self.squares: List[SmSq] = self.generate_squares()
+        self.side: int = WHITE
+        self.bitboards: List[int] = [0] * 12
+        self.occupancy: List[int] = [0, 0]
+        self.occupied: int = 0
+        self.mailbox: List[int] = [EMPTY] * 64
+        self.castling: int = 0
+        # The game is played with the rules of Board: no en passant and pawns
+        # always promote to a queen. With standard rules (e.g. positions set
+        # up from a FEN for perft) en passant and under-promotions are played
+        # too, ep_square then being the square a pawn skipped on its last move
+        # while an enemy pawn could take it (-1 otherwise).
+        self.standard: bool = False
+        self.ep_square: int = -1
+        # FEN move counters
+        self.halfmove: int = 0
+        self.fullmove: int = 1
+        # Zobrist key of the position, kept up to date by make_move
+        self.key: int = 0
+        # evaluation terms kept up to date by make_move: material plus
+        # piece-square values per side for the middle and end game, and the
+        # game phase (see Evaluation.py)
+        self.middle_game: List[int] = [0, 0]
+        self.end_game: List[int] = [0, 0]
+        self.phase: int = 0
+        # undo records of the moves made on the board, see make_move
+        self.history: List[Tuple[int, int, int, int, int, int]] = []
         self.setup_board()
 
-    def generate_squares(self) -> List[SmSq]:
-        output: list[SmSq] = []
-        for y in range(8):
-            for x in range(8):
-                output.append(
-                    SmSq(x,  y)
-                )
-        return output
-
-    def get_square(self, pos) -> SmSq:
-        for square in self.squares:
-            if (square.x, square.y) == (pos[0],pos[1]):
-                return square
+    @property
+    def turn(self) -> Literal['white', 'black']:
+        return COLORS[self.side]
+
+    def clear(self):
+        self.bitboards = [0] * 12
+        self.occupancy = [0, 0]
+        self.occupied = 0
+        self.mailbox = [EMPTY] * 64
+        self.castling = 0
+        self.ep_square = -1
+        self.halfmove = 0
+        self.fullmove = 1
+        self.key = 0
+        self.middle_game = [0, 0]
+        self.end_game = [0, 0]
+        self.phase = 0
+        self.history = []
+
+    def put_piece(self, piece: int, sq: int):
+        bit = 1 << sq
+        self.bitboards[piece] |= bit
+        self.occupancy[piece // 6] |= bit
+        self.occupied |= bit
+        self.mailbox[sq] = piece
+        self.middle_game[piece // 6] += MIDDLE_GAME[piece][sq]
+        self.end_game[piece // 6] += END_GAME[piece][sq]
+        self.phase += PHASE[piece]
 
     def setup_board(self):
+        self.clear()
         for y, row in enumerate(self.config):
             for x, piece in enumerate(row):
                 if piece != '':
-                    square = self.get_square((x, y))
-                    piece_color = 'white' if piece[0] == 'w' else 'black'
-                    piece_notation = piece[1]
-
-                    # Instantiate the appropriate piece class based on notation
-                    if piece_notation == 'R':
-                        square.occupying_piece = SimulationRook((x, y), piece_color)
-                    elif piece_notation == 'N':
-                        square.occupying_piece = SimulationKnight((x, y), piece_color)
-                    elif piece_notation == 'B':
-                        square.occupying_piece = SimulationBishop((x, y), piece_color)
-                    elif piece_notation == 'Q':
-                        square.occupying_piece = SimulationQueen((x, y), piece_color)
-                    elif piece_notation == 'K':
-                        square.occupying_piece = SimulationKing((x, y), piece_color)
-                    elif piece_notation == 'P':
-                        square.occupying_piece = SimulationPawn((x, y), piece_color)
-                    
-                    square.occupying_piece.color = piece_color
+                    color = WHITE if piece[0] == 'w' else BLACK
+                    self.put_piece(color * 6 + PIECE_TYPE[piece[1]], square_index((x, y)))
+        self.side = WHITE
+        self.castling = self.castling_from_placement()
+        self.key = self.compute_key()
+
+    def castling_from_placement(self, moved=lambda sq: False) -> int:
+        # a right exists while the king and the rook are on their home squares
+        # and neither of them has moved
+        rights = 0
+        for right, color, king_sq, rook_sq in CASTLING_SQUARES:
+            if self.mailbox[king_sq] == color * 6 + KING and not moved(king_sq) \
+                and self.mailbox[rook_sq] == color * 6 + ROOK and not moved(rook_sq):
+                rights |= right
+        return rights
 
+    def copy_from_board(self, board: Board):
+        self.clear()
+        self.standard = False
+        self.side = COLOR_INDEX[board.turn]
+        moved = set()
+        for square in board.squares:
+            piece = square.occupying_piece
+            if piece is not None:
+                sq = square_index(square.pos)
+                self.put_piece(COLOR_INDEX[piece.color] * 6 + PIECE_TYPE[piece.notation], sq)
+                if piece.has_moved:
+                    moved.add(sq)
+        self.castling = self.castling_from_placement(lambda sq: sq in moved)
+        self.key = self.compute_key()
+
+    def set_fen(self, fen: str, standard: bool = True):
+        # sets up the position of a FEN (or of the first four fields of an
+        # EPD line), by default with the standard rules, see __init__
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError(f'invalid FEN: {fen!r}')
+        placement, side, castling, ep_square = fields[:4]
+        rows = placement.split('/')
+        if len(rows) != 8:
+            raise ValueError(f'invalid FEN placement: {placement!r}')
+        self.clear()
+        self.standard = standard
+        for y, row in enumerate(rows):
+            x = 0
+            for char in row:
+                if char.isdigit():
+                    x += int(char)
+                elif char.upper() in PIECE_TYPE and x < 8:
+                    color = WHITE if char.isupper() else BLACK
+                    self.put_piece(color * 6 + PIECE_TYPE[char.upper()], square_index((x, y)))
+                    x += 1
+                else:
+                    raise ValueError(f'invalid FEN placement: {placement!r}')
+            if x != 8:
+                raise ValueError(f'invalid FEN placement: {placement!r}')
+        if side not in ('w', 'b'):
+            raise ValueError(f'invalid FEN side to move: {side!r}')
+        self.side = WHITE if side == 'w' else BLACK
+        for right, char in CASTLING_CHARACTERS:
+            if char in castling:
+                self.castling |= right
+        # rights whose king or rook is not at home are dropped
+        self.castling &= self.castling_from_placement()
+        if ep_square != '-' and standard:
+            if len(ep_square) != 2 or ep_square[0] not in 'abcdefgh' or ep_square[1] not in '36':
+                raise ValueError(f'invalid FEN en passant square: {ep_square!r}')
+            sq = square_index(('abcdefgh'.index(ep_square[0]), 8 - int(ep_square[1])))
+            if PAWN_ATTACKS[self.side ^ 1][sq] & self.bitboards[self.side * 6 + PAWN]:
+                self.ep_square = sq
+        if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit():
+            self.halfmove = int(fields[4])
+            self.fullmove = int(fields[5])
+        self.key = self.compute_key()
+
+    @classmethod
+    def from_fen(cls, fen: str, standard: bool = True) -> 'SimulationBoard':
+        board = cls.__new__(cls)
+        board.config = None
+        board.set_fen(fen, standard)
+        return board
+
+    def fen(self) -> str:
+        rows = []
+        for y in range(8):
+            row = ''
+            empty = 0
+            for x in range(8):
+                piece = self.mailbox[y * 8 + x]
+                if piece == EMPTY:
+                    empty += 1
+                    continue
+                if empty:
+                    row += str(empty)
+                    empty = 0
+                notation = PIECE_NOTATION[piece % 6]
+                row += notation if piece < 6 else notation.lower()
+            rows.append(row + (str(empty) if empty else ''))
+        castling = ''.join(char for right, char in CASTLING_CHARACTERS if self.castling & right)
+        ep_square = '-'
+        if self.ep_square >= 0:
+            ep_square = 'abcdefgh'[self.ep_square % 8] + str(8 - self.ep_square // 8)
+        return f"{'/'.join(rows)} {'wb'[self.side]} {castling or '-'} {ep_square} " \
+               f"{self.halfmove} {self.fullmove}"
+
+    def compute_key(self) -> int:
+        return compute_key(self.bitboards, self.side, self.castling, self.ep_square)
+
+    def evaluation_terms(self) -> Tuple[List[int], List[int], int]:
+        # middle game, end game and phase terms recomputed from scratch,
+        # make_move keeps the same values up to date incrementally
+        middle_game = [0, 0]
+        end_game = [0, 0]
+        phase = 0
+        for sq, piece in enumerate(self.mailbox):
+            if piece != EMPTY:
+                middle_game[piece // 6] += MIDDLE_GAME[piece][sq]
+                end_game[piece // 6] += END_GAME[piece][sq]
+                phase += PHASE[piece]
+        return middle_game, end_game, phase
+
+    def snapshot(self) -> Tuple[Tuple[int, ...], int, int, int, bool]:
+        # compact picklable form of the position for worker processes
+        return (tuple(self.bitboards), self.side, self.castling, self.ep_square, self.standard)
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Tuple[Tuple[int, ...], int, int, int, bool]) -> 'SimulationBoard':
+        bitboards, side, castling, ep_square, standard = snapshot
+        board = cls.__new__(cls)
+        board.config = None
+        board.clear()
+        board.standard = standard
+        board.ep_square = ep_square
+        for piece, bitboard in enumerate(bitboards):
+            while bitboard:
+                bit = bitboard & -bitboard
+                board.put_piece(piece, bit.bit_length() - 1)
+                bitboard ^= bit
+        board.side = side
+        board.castling = castling
+        board.key = board.compute_key()
+        return board
+
+    def copy(self) -> 'SimulationBoard':
+        board = SimulationBoard.__new__(SimulationBoard)
+        board.config = self.config
+        board.side = self.side
+        board.bitboards = self.bitboards[:]
+        board.occupancy = self.occupancy[:]
+        board.occupied = self.occupied
+        board.mailbox = self.mailbox[:]
+        board.castling = self.castling
+        board.standard = self.standard
+        board.ep_square = self.ep_square
+        board.halfmove = self.halfmove
+        board.fullmove = self.fullmove
+        board.key = self.key
+        board.middle_game = self.middle_game[:]
+        board.end_game = self.end_game[:]
+        board.phase = self.phase
+        board.history = self.history[:]
+        return board
 
-    def handle_move(self, from_pos: Tuple[int, int], to_pos: Tuple[int, int]) -> bool:
-        from_square = self.get_square(from_pos)
-        to_square = self.get_square(to_pos)
-        if from_square and from_square.occupying_piece:
-            piece = from_square.occupying_piece
-            if to_square in piece.get_valid_moves(self):
-                to_square.occupying_piece = piece
-                from_square.occupying_piece = None
-                piece.pos = to_pos
-                self.turn = 'white' if self.turn == 'black' else 'black'
-                return True
-        return False
+    def get_square(self, pos) -> SmSq:
+        return SQUARES[square_index(pos)]
+
+    def get_square_from_pos(self, pos: tuple[float, float]) -> SmSq:
+        return SQUARES[square_index((int(pos[0]), int(pos[1])))]
+
+    def piece_at(self, sq: int) -> Tuple[str, str] | None:
+        piece = self.mailbox[sq]
+        if piece == EMPTY:
+            return None
+        return COLORS[piece // 6], PIECE_NOTATION[piece % 6]
+
+    def king_square(self, side: int) -> int:
+        king = self.bitboards[side * 6 + KING]
+        return (king & -king).bit_length() - 1
+
+    def is_square_attacked(self, sq: int, by_side: int) -> bool:
+        return self.attackers_to(sq, by_side, self.occupied) != 0
+
+    def attackers_to(self, sq: int, by_side: int, occupied: int) -> int:
+        # pieces of by_side attacking sq with the given occupancy
+        bbs = self.bitboards
+        base = by_side * 6
+        queens = bbs[base + QUEEN]
+        # a pawn of the defending color on sq attacks exactly the squares
+        # from which an enemy pawn attacks sq
+        return (PAWN_ATTACKS[by_side ^ 1][sq] & bbs[base + PAWN]) \
+            | (KNIGHT_ATTACKS[sq] & bbs[base + KNIGHT]) \
+            | (KING_ATTACKS[sq] & bbs[base + KING]) \
+            | (bishop_attacks(sq, occupied) & (bbs[base + BISHOP] | queens)) \
+            | (rook_attacks(sq, occupied) & (bbs[base + ROOK] | queens))
+
+    def pinned_pieces(self, side: int, king_sq: int) -> dict[int, int]:
+        # square of every piece of side pinned to its king, mapped to the
+        # squares it can still move to (the ray up to and including the pinner)
+        bbs = self.bitboards
+        base = (side ^ 1) * 6
+        queens = bbs[base + QUEEN]
+        snipers = (rook_attacks(king_sq, 0) & (bbs[base + ROOK] | queens)) \
+            | (bishop_attacks(king_sq, 0) & (bbs[base + BISHOP] | queens))
+        pins = {}
+        while snipers:
+            bit = snipers & -snipers
+            sniper = bit.bit_length() - 1
+            blockers = BETWEEN[king_sq][sniper] & self.occupied
+            # exactly one piece in between, and it is ours
+            if blockers and not blockers & (blockers - 1) and blockers & self.occupancy[side]:
+                pins[blockers.bit_length() - 1] = BETWEEN[king_sq][sniper] | bit
+            snipers ^= bit
+        return pins
 
     def is_in_check(self, color: Literal['white', 'black']) -> bool:
-        # Simplified check logic
-        return False
+        side = COLOR_INDEX[color]
+        if not self.bitboards[side * 6 + KING]:
+            return False
+        return self.is_square_attacked(self.king_square(side), side ^ 1)
 
     def is_in_checkmate(self, color: Literal['white', 'black']) -> bool:
         if not self.is_in_check(color):
             return False
-        # Check for no valid moves
-        return True
-
-    def copy_from_board(self, board: Board):
-        self.squares.clear()
-
-        # Copy basic attributes
-        self.turn = board.turn
-        self.selected_square = board.selected_square  
-
-        # Loop through the original board's squares and copy the pieces
-        for square in board.squares:
-            simulation_square = SmSq(square.x, square.y)
-            if square.occupying_piece:
-                piece_notation = square.occupying_piece.notation
-                piece_color = square.occupying_piece.color
-                
-                if piece_notation == 'R':
-                        simulation_square.occupying_piece = SimulationRook((square.x,square.y), piece_color)
-                elif piece_notation == 'N':
-                        simulation_square.occupying_piece = SimulationKnight((square.x,square.y), piece_color)
-                elif piece_notation == 'B':
-                        simulation_square.occupying_piece = SimulationBishop((square.x,square.y), piece_color)
-                elif piece_notation == 'Q':
-                        simulation_square.occupying_piece = SimulationQueen((square.x,square.y), piece_color)
-                elif piece_notation == 'K':
-                        simulation_square.occupying_piece = SimulationKing((square.x,square.y), piece_color)
-                elif piece_notation == 'P':
-                        simulation_square.occupying_piece = SimulationPawn((square.x,square.y), piece_color)
-            self.squares.append(simulation_square)
-
-    
-    def make_move(self, from_square: SmSq, to_square: SmSq):
-        if from_square.occupying_piece and to_square not in from_square.occupying_piece.get_valid_moves(self):
-            return False 
-
-        if to_square.occupying_piece:
-            to_square.occupying_piece = None  
-
-        to_square.occupying_piece = from_square.occupying_piece
-        from_square.occupying_piece = None  
-        if to_square.occupying_piece:
-            to_square.occupying_piece.pos = to_square.pos
-        self.turn = 'black' if self.turn == 'white' else 'white'
-
-        return True  
-
-    def is_empty(self, pos):
-        x, y = pos
-        return self.get_square((x,y)).occupying_piece is None
-
-    def is_enemy(self, pos, color):
-        square = self.get_square(pos)
-        
-        
-        if square is None or square.occupying_piece is None:
-            return False  
-        
-        
-        return square.occupying_piece.color != color
-    
-        
-    def get_square_from_pos(self, pos: tuple[float, float]) -> SmSq:
-        for square in self.squares:
-            if (square.x, square.y) == (pos[0], pos[1]):
-                return square
+        return color == self.turn and len(self.get_legal_moves()) == 0
+
+    def generate_moves(self, captures_only: bool = False, legal: bool = False) -> List[int]:
+        # moves for the side to move. By default they are pseudo legal and may
+        # leave the own king in check; with legal the checkers and pinned
+        # pieces are worked out once and only legal moves are generated.
+        # With captures_only only captures and promotions are generated, for
+        # the quiescence search.
+        side = self.side
+        bbs = self.bitboards
+        base = side * 6
+        own = self.occupancy[side]
+        enemy = self.occupancy[side ^ 1]
+        occupied = self.occupied
+        empty = ~occupied & FULL
+        moves = []
+
+        # squares that block or capture a check, and pin rays
+        check_mask = FULL
+        pins = {}
+        king_sq = -1
+        if legal and bbs[base + KING]:
+            king_sq = self.king_square(side)
+            checkers = self.attackers_to(king_sq, side ^ 1, occupied)
+            if checkers:
+                if checkers & (checkers - 1):
+                    check_mask = 0  # double check, only the king can move
+                else:
+                    check_mask = checkers | BETWEEN[king_sq][checkers.bit_length() - 1]
+            pins = self.pinned_pieces(side, king_sq)
+
+        # pawns, promotions only turn into a queen like on Board unless the
+        # standard rules are played
+        promotions = STANDARD_PROMOTIONS if self.standard and not captures_only else GAME_PROMOTIONS
+        pawns = bbs[base + PAWN]
+        if side == WHITE:
+            single = (pawns >> 8) & empty
+            double = ((single & rank_mask(5)) >> 8) & empty
+            step = 8
+            last_rank = rank_mask(0)
+        else:
+            single = (pawns << 8) & empty
+            double = ((single & rank_mask(2)) << 8) & empty
+            step = -8
+            last_rank = rank_mask(7)
+        if captures_only:
+            single &= last_rank
+            double = 0
+        single &= check_mask
+        double &= check_mask
+        while single:
+            bit = single & -single
+            to = bit.bit_length() - 1
+            if not pins or to + step not in pins or bit & pins[to + step]:
+                if bit & last_rank:
+                    moves.extend(encode_move(to + step, to, promotion) for promotion in promotions)
+                else:
+                    moves.append(encode_move(to + step, to))
+            single ^= bit
+        while double:
+            bit = double & -double
+            to = bit.bit_length() - 1
+            if not pins or to + 2 * step not in pins or bit & pins[to + 2 * step]:
+                moves.append(encode_move(to + 2 * step, to))
+            double ^= bit
+        attacks_table = PAWN_ATTACKS[side]
+        while pawns:
+            bit = pawns & -pawns
+            frm = bit.bit_length() - 1
+            targets = attacks_table[frm] & enemy & check_mask
+            if frm in pins:
+                targets &= pins[frm]
+            while targets:
+                target = targets & -targets
+                to = target.bit_length() - 1
+                if target & last_rank:
+                    moves.extend(encode_move(frm, to, promotion) for promotion in promotions)
+                else:
+                    moves.append(encode_move(frm, to))
+                targets ^= target
+            pawns ^= bit
+        if self.ep_square >= 0:
+            # en passant can uncover a check along the rank of both pawns,
+            # so these rare moves are checked by playing them
+            attackers = PAWN_ATTACKS[side ^ 1][self.ep_square] & bbs[base + PAWN]
+            while attackers:
+                bit = attackers & -attackers
+                move = encode_move(bit.bit_length() - 1, self.ep_square) | EN_PASSANT
+                if not legal or king_sq < 0 or self.is_legal(move):
+                    moves.append(move)
+                attackers ^= bit
+
+        # pieces
+        for piece_type in (KNIGHT, BISHOP, ROOK, QUEEN, KING):
+            pieces = bbs[base + piece_type]
+            while pieces:
+                bit = pieces & -pieces
+                frm = bit.bit_length() - 1
+                if piece_type == KNIGHT:
+                    targets = KNIGHT_ATTACKS[frm]
+                elif piece_type == BISHOP:
+                    targets = bishop_attacks(frm, occupied)
+                elif piece_type == ROOK:
+                    targets = rook_attacks(frm, occupied)
+                elif piece_type == QUEEN:
+                    targets = rook_attacks(frm, occupied) | bishop_attacks(frm, occupied)
+                else:
+                    targets = KING_ATTACKS[frm]
+                targets &= enemy if captures_only else ~own
+                if piece_type != KING:
+                    targets &= check_mask
+                    if frm in pins:
+                        targets &= pins[frm]
+                while targets:
+                    target = targets & -targets
+                    to = target.bit_length() - 1
+                    # the king may not step onto an attacked square, sliders
+                    # are looked at through the square it leaves
+                    if piece_type != KING or king_sq < 0 \
+                            or not self.attackers_to(to, side ^ 1, occupied ^ bit):
+                        moves.append(frm | (to << 6))
+                    targets ^= target
+                pieces ^= bit
+
+        if not captures_only:
+            moves.extend(self.generate_castling())
+        return moves
+
+    def generate_castling(self) -> List[int]:
+        moves = []
+        side = self.side
+        if side == WHITE:
+            rights = self.castling & (WHITE_KINGSIDE | WHITE_QUEENSIDE)
+            king_sq, kingside, queenside = 60, WHITE_KINGSIDE, WHITE_QUEENSIDE
+        else:
+            rights = self.castling & (BLACK_KINGSIDE | BLACK_QUEENSIDE)
+            king_sq, kingside, queenside = 4, BLACK_KINGSIDE, BLACK_QUEENSIDE
+        if not rights or self.is_square_attacked(king_sq, side ^ 1):
+            return moves
+        occupied = self.occupied
+        # the king may not pass through or land on an attacked square
+        if rights & kingside and not occupied & (0b11 << (king_sq + 1)) \
+            and not self.is_square_attacked(king_sq + 1, side ^ 1) \
+            and not self.is_square_attacked(king_sq + 2, side ^ 1):
+            moves.append(encode_move(king_sq, king_sq + 2))
+        if rights & queenside and not occupied & (0b111 << (king_sq - 3)) \
+            and not self.is_square_attacked(king_sq - 1, side ^ 1) \
+            and not self.is_square_attacked(king_sq - 2, side ^ 1):
+            moves.append(encode_move(king_sq, king_sq - 2))
+        return moves
+
+    def get_legal_moves(self, captures_only: bool = False) -> List[int]:
+        return self.generate_moves(captures_only, legal=True)
+
+    def is_legal(self, move: int) -> bool:
+        # plays a pseudo legal move to see whether it leaves the king in check
+        side = self.side
+        self.make_move(move)
+        legal = not self.is_square_attacked(self.king_square(side), side ^ 1)
+        self.unmake_move()
+        return legal
+
+    def make_move(self, move: int):
+        # plays the move in place and pushes an undo record of (move, captured
+        # piece, castling rights, key, en passant square and halfmove clock
+        # before the move)
+        frm = move_from(move)
+        to = move_to(move)
+        promotion = move_promotion(move)
+        bbs = self.bitboards
+        occupancy = self.occupancy
+        mailbox = self.mailbox
+        side = self.side
+        piece = mailbox[frm]
+        captured = mailbox[to]
+        from_bit = 1 << frm
+        to_bit = 1 << to
+        castling = self.castling
+        key = self.key
+        ep_square = self.ep_square
+        self.history.append((move, captured, castling, key, ep_square, self.halfmove))
+
+        middle_game = self.middle_game
+        end_game = self.end_game
+
+        if ep_square >= 0:
+            key ^= EN_PASSANT_KEYS[ep_square & 7]
+            self.ep_square = -1
+            if move & EN_PASSANT:
+                self.remove_en_passant_pawn(side, to)
+                key ^= PIECE_KEYS[(side ^ 1) * 6 + PAWN][to + (8 if side == WHITE else -8)]
+        if captured != EMPTY:
+            bbs[captured] ^= to_bit
+            occupancy[side ^ 1] ^= to_bit
+            key ^= PIECE_KEYS[captured][to]
+            middle_game[side ^ 1] -= MIDDLE_GAME[captured][to]
+            end_game[side ^ 1] -= END_GAME[captured][to]
+            self.phase -= PHASE[captured]
+        bbs[piece] ^= from_bit | to_bit
+        occupancy[side] ^= from_bit | to_bit
+        mailbox[frm] = EMPTY
+        mailbox[to] = piece
+        key ^= PIECE_KEYS[piece][frm]
+
+        if promotion:
+            bbs[piece] ^= to_bit
+            new_piece = side * 6 + promotion
+            bbs[new_piece] |= to_bit
+            mailbox[to] = new_piece
+            key ^= PIECE_KEYS[new_piece][to]
+            middle_game[side] += MIDDLE_GAME[new_piece][to] - MIDDLE_GAME[piece][frm]
+            end_game[side] += END_GAME[new_piece][to] - END_GAME[piece][frm]
+            self.phase += PHASE[new_piece]
+        else:
+            key ^= PIECE_KEYS[piece][to]
+            middle_game[side] += MIDDLE_GAME[piece][to] - MIDDLE_GAME[piece][frm]
+            end_game[side] += END_GAME[piece][to] - END_GAME[piece][frm]
+            if piece % 6 == KING and abs(to - frm) == 2:
+                key ^= self.move_castling_rook(side, frm, to)
+            elif self.standard and piece % 6 == PAWN and abs(to - frm) == 16 \
+                    and PAWN_ATTACKS[side][(frm + to) // 2] & bbs[(side ^ 1) * 6 + PAWN]:
+                self.ep_square = (frm + to) // 2
+                key ^= EN_PASSANT_KEYS[to & 7]
+
+        if piece % 6 == PAWN or captured != EMPTY:
+            self.halfmove = 0
+        else:
+            self.halfmove += 1
+        self.fullmove += side
+        self.castling = castling & CASTLING_MASKS[frm] & CASTLING_MASKS[to]
+        self.key = key ^ SIDE_KEY ^ CASTLING_KEYS[castling] ^ CASTLING_KEYS[self.castling]
+        self.occupied = occupancy[WHITE] | occupancy[BLACK]
+        self.side = side ^ 1
+
+    def unmake_move(self):
+        move, captured, castling, key, ep_square, halfmove = self.history.pop()
+        frm = move_from(move)
+        to = move_to(move)
+        bbs = self.bitboards
+        occupancy = self.occupancy
+        mailbox = self.mailbox
+        side = self.side ^ 1
+        from_bit = 1 << frm
+        to_bit = 1 << to
+
+        middle_game = self.middle_game
+        end_game = self.end_game
+
+        if move_promotion(move):
+            new_piece = mailbox[to]
+            bbs[new_piece] ^= to_bit
+            piece = side * 6 + PAWN
+            bbs[piece] |= to_bit
+            middle_game[side] -= MIDDLE_GAME[new_piece][to] - MIDDLE_GAME[piece][frm]
+            end_game[side] -= END_GAME[new_piece][to] - END_GAME[piece][frm]
+            self.phase -= PHASE[new_piece]
+        else:
+            piece = mailbox[to]
+            middle_game[side] -= MIDDLE_GAME[piece][to] - MIDDLE_GAME[piece][frm]
+            end_game[side] -= END_GAME[piece][to] - END_GAME[piece][frm]
+            if piece % 6 == KING and abs(to - frm) == 2:
+                self.move_castling_rook(side, frm, to, undo=True)
+        bbs[piece] ^= from_bit | to_bit
+        occupancy[side] ^= from_bit | to_bit
+        mailbox[frm] = piece
+        mailbox[to] = captured
+        if captured != EMPTY:
+            bbs[captured] |= to_bit
+            occupancy[side ^ 1] |= to_bit
+            middle_game[side ^ 1] += MIDDLE_GAME[captured][to]
+            end_game[side ^ 1] += END_GAME[captured][to]
+            self.phase += PHASE[captured]
+        if move & EN_PASSANT:
+            self.remove_en_passant_pawn(side, to)
+
+        self.castling = castling
+        self.ep_square = ep_square
+        self.halfmove = halfmove
+        self.fullmove -= side
+        self.key = key
+        self.occupied = occupancy[WHITE] | occupancy[BLACK]
+        self.side = side
+
+    def remove_en_passant_pawn(self, side: int, to: int):
+        # toggles the pawn taken by an en passant capture of side landing on
+        # to, removing it on make_move and putting it back on unmake_move
+        sq = to + (8 if side == WHITE else -8)
+        pawn = (side ^ 1) * 6 + PAWN
+        bit = 1 << sq
+        self.bitboards[pawn] ^= bit
+        self.occupancy[side ^ 1] ^= bit
+        if self.mailbox[sq] == EMPTY:
+            self.mailbox[sq] = pawn
+            sign = 1
+        else:
+            self.mailbox[sq] = EMPTY
+            sign = -1
+        self.middle_game[side ^ 1] += sign * MIDDLE_GAME[pawn][sq]
+        self.end_game[side ^ 1] += sign * END_GAME[pawn][sq]
+
+    def move_castling_rook(self, side: int, king_from: int, king_to: int, undo: bool = False) -> int:
+        # castling, bring the rook to the other side of the king (or back),
+        # returns the change of the Zobrist key
+        if king_to > king_from:
+            rook_from, rook_to = king_from + 3, king_from + 1
+        else:
+            rook_from, rook_to = king_from - 4, king_from - 1
+        if undo:
+            rook_from, rook_to = rook_to, rook_from
+        rook_bits = (1 << rook_from) | (1 << rook_to)
+        self.bitboards[side * 6 + ROOK] ^= rook_bits
+        self.occupancy[side] ^= rook_bits
+        self.mailbox[rook_to] = self.mailbox[rook_from]
+        self.mailbox[rook_from] = EMPTY
+        rook = side * 6 + ROOK
+        self.middle_game[side] += MIDDLE_GAME[rook][rook_to] - MIDDLE_GAME[rook][rook_from]
+        self.end_game[side] += END_GAME[rook][rook_to] - END_GAME[rook][rook_from]
+        keys = PIECE_KEYS[rook]
+        return keys[rook_from] ^ keys[rook_to]
+
+    def find_move(self, from_pos: Tuple[int, int], to_pos: Tuple[int, int]) -> int | None:
+        frm = square_index(from_pos)
+        to = square_index(to_pos)
+        for move in self.get_legal_moves():
+            if move_from(move) == frm and move_to(move) == to:
+                return move
+        return None
 
-    def get_piece_from_pos(self, pos: tuple[float, float]) -> SimulationPiece:
-        return self.get_square_from_pos(pos).occupying_piece
+    def handle_move(self, from_pos: Tuple[int, int], to_pos: Tuple[int, int]) -> bool:
+        move = self.find_move(from_pos, to_pos)
+        if move is None:
+            return False
+        self.make_move(move)
+        return True
@@ -0,0 +1,55 @@
+# /* Sprites.py
+
+import os
+import pygame
+
+# Piece images, loaded once per process and shared by every piece. By default
+# all twelve sprites are sliced out of the ChessPiecesArray.png atlas (black
+# pieces on the top row, white on the bottom one), so a whole board costs a
+# single image load; the separate <color>_<piece>.png files are used when the
+# atlas is missing or use_atlas is turned off.
+ATLAS_PATH = 'data/imgs/ChessPiecesArray.png'
+ATLAS_ORDER = 'QKRNBP'
+ATLAS_ROWS = {'black': 0, 'white': 1}
+PIECE_NAMES = {'P': 'pawn', 'N': 'knight', 'B': 'bishop', 'R': 'rook',
+               'Q': 'queen', 'K': 'king'}
+use_atlas = True
+
+_atlas: pygame.surface.Surface = None
+# unscaled images by (color, notation) and scaled sprites by (color, notation, size)
+_images: dict[tuple[str, str], pygame.surface.Surface] = {}
+_sprites: dict[tuple[str, str, tuple[int, int]], pygame.surface.Surface] = {}
+
+
+def _load_image(color: str, notation: str) -> pygame.surface.Surface:
+    global _atlas
+    if use_atlas and os.path.exists(ATLAS_PATH):
+        if _atlas is None:
+            _atlas = pygame.image.load(ATLAS_PATH)
+        width = _atlas.get_width() // len(ATLAS_ORDER)
+        height = _atlas.get_height() // len(ATLAS_ROWS)
+        return _atlas.subsurface(pygame.Rect(
+            ATLAS_ORDER.index(notation) * width, ATLAS_ROWS[color] * height, width, height
+        ))
+    return pygame.image.load('data/imgs/' + color + '_' + PIECE_NAMES[notation] + '.png')
+
+
+def get_sprite(color: str, notation: str, size: tuple[int, int]) -> pygame.surface.Surface:
+    # the image of a piece scaled to size, the same surface is returned for
+    # every piece of that color and type so it must not be drawn on
+    key = (color, notation, size)
+    sprite = _sprites.get(key)
+    if sprite is None:
+        image = _images.get((color, notation))
+        if image is None:
+            image = _images[(color, notation)] = _load_image(color, notation)
+        sprite = _sprites[key] = pygame.transform.scale(image, size)
+    return sprite
+
+
+def clear():
+    # drops every cached image, e.g. after changing use_atlas
+    global _atlas
+    _atlas = None
+    _images.clear()
+    _sprites.clear()
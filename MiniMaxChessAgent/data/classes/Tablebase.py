@@ -0,0 +1,451 @@
+# /* Tablebase.py
+
+# Distance to mate tables of the small endgames where one side only has its
+# king left: KQK, KRK, KPK and KBNK. The tables are built once by retrograde
+# analysis and written to a binary file, which the agents memory map and probe
+# instead of searching (see MinimaxAgent). Like Board, the tables promote
+# pawns to queens only and know nothing of castling.
+#
+#   python -m data.classes.Tablebase --output tablebases.bin
+#   python -m data.classes.Tablebase --output tablebases.bin --tables KQK KRK
+#
+# Positions are stored with the stronger side as white. The index of a
+# position is (side to move, white king, black king, white pieces...), the
+# white king being limited to the squares left after the board symmetries:
+# the a1-d1-d4 triangle without pawns, the a to d files with a pawn. Every
+# entry is one byte, 0 for a draw (or an unused index) and plies + 1
+# otherwise: white to move mates in that many plies, black to move is mated
+# in that many.
+
+import argparse
+import mmap
+import struct
+import time
+
+import numpy as np
+
+from data.classes.Bitboard import (
+    WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, PIECE_NOTATION,
+    KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, BETWEEN, ROOK_DIRECTIONS,
+    BISHOP_DIRECTIONS, popcount, iter_bits
+)
+
+# white pieces next to the white king, per table, in the order they are indexed
+TABLES = {
+    'KQK': (QUEEN,),
+    'KRK': (ROOK,),
+    'KPK': (PAWN,),
+    'KBNK': (BISHOP, KNIGHT),
+}
+# KPK promotes into KQK, so KQK is built first
+BUILD_ORDER = ('KQK', 'KRK', 'KPK', 'KBNK')
+MAX_PIECES = 4
+
+# file layout: header, one directory entry per table, then the tables
+MAGIC = b'MMTB'
+HEADER = struct.Struct('<4sI')
+DIRECTORY_ENTRY = struct.Struct('<8sQQ')
+
+
+def _transform(sq: int, symmetry: int) -> int:
+    # bit 0 mirrors the files, bit 1 the ranks, bit 2 the a1-h8 diagonal
+    x, y = sq % 8, sq // 8
+    if symmetry & 1:
+        x = 7 - x
+    if symmetry & 2:
+        y = 7 - y
+    if symmetry & 4:
+        x, y = y, x
+    return y * 8 + x
+
+
+TRANSFORMS = [[_transform(sq, symmetry) for sq in range(64)] for symmetry in range(8)]
+
+
+def table_name(pieces) -> str:
+    # 'K' + the pieces of the stronger side (queen first) + 'K'
+    return 'K' + ''.join(PIECE_NOTATION[piece] for piece in sorted(pieces, reverse=True)) + 'K'
+
+
+class TableLayout:
+    # index arithmetic of one table
+    def __init__(self, name: str):
+        self.name = name
+        self.pieces = TABLES[name]
+        # pawns only allow mirroring the files
+        self.symmetries = (0, 1) if PAWN in self.pieces else tuple(range(8))
+        # a position is stored under its smallest (king, king, pieces...)
+        # image, so the white king is always the smallest square of its orbit
+        self.king_squares = [sq for sq in range(64)
+                             if sq == min(TRANSFORMS[s][sq] for s in self.symmetries)]
+        self.king_index = [-1] * 64
+        for i, sq in enumerate(self.king_squares):
+            self.king_index[sq] = i
+        self.size = 2 * len(self.king_squares) * 64 ** (len(self.pieces) + 1)
+
+    def index(self, side: int, squares: list[int]) -> int:
+        # squares: white king, black king, then the white pieces
+        best = min([TRANSFORMS[s][sq] for sq in squares] for s in self.symmetries)
+        index = side * len(self.king_squares) + self.king_index[best[0]]
+        for sq in best[1:]:
+            index = index * 64 + sq
+        return index
+
+    def indices(self, side: np.ndarray, squares: list[np.ndarray]) -> np.ndarray:
+        # index() of many positions at once
+        best_key = best_symmetry = None
+        for s in self.symmetries:
+            key = np.zeros(len(side), dtype=np.int64)
+            for sq in squares:
+                key = key * 64 + _TRANSFORMS[s][sq]
+            if best_key is None:
+                best_key, best_symmetry = key, np.full(len(side), s)
+            else:
+                smaller = key < best_key
+                best_key = np.where(smaller, key, best_key)
+                best_symmetry[smaller] = s
+        mapped = [_TRANSFORMS[best_symmetry, sq] for sq in squares]
+        index = side.astype(np.int64) * len(self.king_squares) + _KING_INDEX[self.name][mapped[0]]
+        for sq in mapped[1:]:
+            index = index * 64 + sq
+        return index
+
+    def decode(self, index: np.ndarray) -> tuple[np.ndarray, list[np.ndarray]]:
+        # (side to move, [white king, black king, white pieces...]) of indices
+        squares = []
+        for _ in range(len(self.pieces) + 1):
+            squares.append(index % 64)
+            index = index // 64
+        squares.append(np.array(self.king_squares)[index % len(self.king_squares)])
+        return index // len(self.king_squares), squares[::-1]
+
+
+LAYOUTS = {name: TableLayout(name) for name in TABLES}
+
+
+# NumPy versions of the move tables
+def _bits(table) -> np.ndarray:
+    return np.array([[bool(attacks >> sq & 1) for sq in range(64)] for attacks in table])
+
+
+def _steps(table) -> np.ndarray:
+    # target squares of a leaper, padded with -1
+    steps = np.full((64, 8), -1, dtype=np.int64)
+    for frm, attacks in enumerate(table):
+        targets = list(iter_bits(attacks))
+        steps[frm, :len(targets)] = targets
+    return steps
+
+
+def _rays(directions) -> np.ndarray:
+    # rays[d, frm, k] is the square k + 1 steps from frm in direction d, or -1
+    rays = np.full((len(directions), 64, 7), -1, dtype=np.int64)
+    for d, (dx, dy) in enumerate(directions):
+        for frm in range(64):
+            x, y = frm % 8 + dx, frm // 8 + dy
+            k = 0
+            while 0 <= x < 8 and 0 <= y < 8:
+                rays[d, frm, k] = y * 8 + x
+                x, y, k = x + dx, y + dy, k + 1
+    return rays
+
+
+def _lines(directions) -> np.ndarray:
+    lines = np.zeros((64, 64), dtype=bool)
+    rays = _rays(directions)
+    for frm in range(64):
+        targets = rays[:, frm].ravel()
+        lines[frm, targets[targets >= 0]] = True
+    return lines
+
+
+_TRANSFORMS = np.array(TRANSFORMS, dtype=np.int64)
+_KING_INDEX = {name: np.array(layout.king_index, dtype=np.int64) for name, layout in LAYOUTS.items()}
+_BIT = np.array([1 << sq for sq in range(64)], dtype=np.uint64)
+_BETWEEN = np.array(BETWEEN, dtype=np.uint64)
+_KING_ADJACENT = _bits(KING_ATTACKS)
+_KNIGHT_ADJACENT = _bits(KNIGHT_ATTACKS)
+_PAWN_ADJACENT = _bits(PAWN_ATTACKS[WHITE])
+_KING_STEPS = _steps(KING_ATTACKS)
+_KNIGHT_STEPS = _steps(KNIGHT_ATTACKS)
+_RAYS = {ROOK: _rays(ROOK_DIRECTIONS), BISHOP: _rays(BISHOP_DIRECTIONS)}
+_RAYS[QUEEN] = np.concatenate([_RAYS[ROOK], _RAYS[BISHOP]])
+_LINES = {ROOK: _lines(ROOK_DIRECTIONS), BISHOP: _lines(BISHOP_DIRECTIONS)}
+_LINES[QUEEN] = _LINES[ROOK] | _LINES[BISHOP]
+
+
+def _attacks(piece: int, frm: np.ndarray, target: np.ndarray, occupied: np.ndarray) -> np.ndarray:
+    # whether the white piece on frm attacks target
+    if piece == PAWN:
+        return _PAWN_ADJACENT[frm, target]
+    if piece == KNIGHT:
+        return _KNIGHT_ADJACENT[frm, target]
+    if piece == KING:
+        return _KING_ADJACENT[frm, target]
+    return _LINES[piece][frm, target] & ((_BETWEEN[frm, target] & occupied) == 0)
+
+
+def _sources(piece: int, sq: np.ndarray, occupied: np.ndarray):
+    # (square, ok) pairs of the squares a white piece on sq can have come
+    # from, whatever stands on them. Apart from pawns these are the squares
+    # it can move to.
+    if piece == PAWN:
+        yield sq + 8, sq // 8 <= 5
+        double = (sq // 8 == 4) & ((occupied & _BIT[np.minimum(sq + 8, 63)]) == 0)
+        yield np.minimum(sq + 16, 63), double
+    elif piece in (KING, KNIGHT):
+        steps = _KING_STEPS if piece == KING else _KNIGHT_STEPS
+        for d in range(8):
+            target = steps[sq, d]
+            yield np.maximum(target, 0), target >= 0
+    else:
+        rays = _RAYS[piece]
+        for d in range(len(rays)):
+            for k in range(7):
+                target = rays[d, sq, k]
+                ok = target >= 0
+                target = np.maximum(target, 0)
+                yield target, ok & ((_BETWEEN[sq, target] & occupied) == 0)
+
+
+def _occupied(squares: list[np.ndarray]) -> np.ndarray:
+    occupied = np.zeros(len(squares[0]), dtype=np.uint64)
+    for sq in squares:
+        occupied |= _BIT[sq]
+    return occupied
+
+
+def generate(name: str, tables: dict[str, np.ndarray], verbose: bool = False) -> np.ndarray:
+    # builds one table, `tables` holds the tables built so far (KPK needs KQK)
+    layout = LAYOUTS[name]
+    pieces = layout.pieces
+    index = np.arange(layout.size, dtype=np.int64)
+    side, squares = layout.decode(index)
+    white_king, black_king = squares[0], squares[1]
+    occupied = _occupied(squares)
+
+    # legal positions, each under its canonical index only
+    valid = layout.indices(side, squares) == index
+    valid &= ~_KING_ADJACENT[white_king, black_king]
+    for i in range(len(squares)):
+        for j in range(i):
+            valid &= squares[i] != squares[j]
+    for piece, sq in zip(pieces, squares[2:]):
+        if piece == PAWN:
+            valid &= (sq // 8 >= 1) & (sq // 8 <= 6)
+    in_check = np.zeros(layout.size, dtype=bool)
+    for piece, sq in zip(pieces, squares[2:]):
+        in_check |= _attacks(piece, sq, black_king, occupied)
+    valid &= (side == BLACK) | ~in_check
+
+    # black to move without a legal move is mated or stalemated
+    black = valid & (side == BLACK)
+    stuck = black.copy()
+    for target, legal, capture in _black_moves(pieces, squares, occupied):
+        stuck &= ~legal
+    dtm = np.zeros(layout.size, dtype=np.uint8)
+    frontier = np.flatnonzero(stuck & in_check)
+    dtm[frontier] = 1
+    del index, side, squares, white_king, black_king, occupied, in_check, black, stuck
+
+    # promotions to a queen, by the plies white needs to mate after them
+    promotions = {}
+    if PAWN in pieces:
+        promotions = _promotions(layout, valid, tables['KQK'])
+
+    ply = 0
+    while len(frontier) or any(plies > ply for plies in promotions):
+        if ply % 2 == 0:
+            # black to move is mated in `ply`: white positions leading there win
+            candidates = _white_predecessors(layout, frontier)
+            if ply + 1 in promotions:
+                candidates = np.concatenate([candidates, promotions.pop(ply + 1)])
+            candidates = candidates[valid[candidates] & (dtm[candidates] == 0)]
+            frontier = np.unique(candidates)
+        else:
+            # white to move mates in `ply`: black positions with a move there
+            # lose if every other move of theirs reaches a mate too. The
+            # moves are looked at again rather than counted down, as mirrored
+            # moves of a symmetric position lead to the same entry.
+            candidates = _black_predecessors(layout, frontier)
+            candidates = np.unique(candidates[valid[candidates] & (dtm[candidates] == 0)])
+            frontier = candidates[_all_moves_lose(layout, candidates, dtm)]
+        dtm[frontier] = ply + 2
+        ply += 1
+        if verbose and len(frontier):
+            print(f'{name}: {len(frontier)} positions at {ply} plies')
+    return dtm
+
+
+def _black_moves(pieces: tuple[int, ...], squares: list[np.ndarray], occupied: np.ndarray):
+    # (target, legal, capture) of the eight king steps of black
+    white_king, black_king = squares[0], squares[1]
+    without_king = occupied & ~_BIT[black_king]
+    for d in range(8):
+        target = _KING_STEPS[black_king, d]
+        legal = target >= 0
+        target = np.maximum(target, 0)
+        legal &= ~_KING_ADJACENT[white_king, target]
+        capture = np.zeros(len(target), dtype=bool)
+        for piece, sq in zip(pieces, squares[2:]):
+            captured = sq == target
+            capture |= captured
+            legal &= captured | ~_attacks(piece, sq, target, without_king)
+        yield target, legal, capture & legal
+
+
+def _all_moves_lose(layout: TableLayout, index: np.ndarray, dtm: np.ndarray) -> np.ndarray:
+    # whether every legal move of the black to move positions reaches a
+    # position white has already won, a capture leaves a drawn ending
+    side, squares = layout.decode(index)
+    white = np.full(len(index), WHITE)
+    lost = np.ones(len(index), dtype=bool)
+    for target, legal, capture in _black_moves(layout.pieces, squares, _occupied(squares)):
+        moved = list(squares)
+        moved[1] = target
+        won = dtm[layout.indices(white, moved)] != 0
+        lost &= ~legal | (~capture & won)
+    return lost
+
+
+def _white_predecessors(layout: TableLayout, frontier: np.ndarray) -> np.ndarray:
+    # indices of the white to move positions reaching the black to move
+    # positions of frontier with one move, illegal ones included
+    side, squares = layout.decode(frontier)
+    occupied = _occupied(squares)
+    white = np.full(len(frontier), WHITE)
+    output = []
+    for i, piece in enumerate((KING,) + layout.pieces):
+        i = 0 if i == 0 else i + 1
+        for source, ok in _sources(piece, squares[i], occupied):
+            if not ok.any():
+                continue
+            moved = [sq[ok] for sq in squares]
+            moved[i] = source[ok]
+            output.append(layout.indices(white[ok], moved))
+    return np.concatenate(output) if output else np.zeros(0, dtype=np.int64)
+
+
+def _black_predecessors(layout: TableLayout, frontier: np.ndarray) -> np.ndarray:
+    # the same for black king moves into the white to move positions
+    side, squares = layout.decode(frontier)
+    black = np.full(len(frontier), BLACK)
+    output = []
+    for d in range(8):
+        source = _KING_STEPS[squares[1], d]
+        ok = source >= 0
+        if not ok.any():
+            continue
+        moved = [sq[ok] for sq in squares]
+        moved[1] = source[ok]
+        output.append(layout.indices(black[ok], moved))
+    return np.concatenate(output) if output else np.zeros(0, dtype=np.int64)
+
+
+def _promotions(layout: TableLayout, valid: np.ndarray, queen_table: np.ndarray) -> dict[int, np.ndarray]:
+    # white to move positions of a pawn table where promoting wins, keyed by
+    # the plies to mate counting the promotion
+    index = np.flatnonzero(valid)
+    side, squares = layout.decode(index)
+    pawn = squares[2]
+    ok = (side == WHITE) & (pawn // 8 == 1)
+    target = pawn - 8
+    ok &= (target != squares[0]) & (target != squares[1])
+    index, squares, target = index[ok], [sq[ok] for sq in squares], target[ok]
+    queen = LAYOUTS['KQK'].indices(np.full(len(index), BLACK), [squares[0], squares[1], target])
+    plies = queen_table[queen].astype(np.int64)
+    promotions = {}
+    for value in np.unique(plies[plies > 0]):
+        promotions[int(value)] = index[plies == value]
+    return promotions
+
+
+def write_tables(path: str, tables: dict[str, np.ndarray]):
+    offset = HEADER.size + DIRECTORY_ENTRY.size * len(tables)
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, len(tables)))
+        for name, table in tables.items():
+            file.write(DIRECTORY_ENTRY.pack(name.encode(), offset, len(table)))
+            offset += len(table)
+        for table in tables.values():
+            file.write(table.tobytes())
+
+
+class Tablebase:
+    # Read-only access to a file written by write_tables. The file is memory
+    # mapped, so the worker processes of a parallel search share its pages.
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f'{path} is not a tablebase file')
+        # name -> offset of the tables found in the file
+        self.tables: dict[str, int] = {}
+        for i in range(count):
+            name, offset, size = DIRECTORY_ENTRY.unpack_from(self.map, HEADER.size + i * DIRECTORY_ENTRY.size)
+            name = name.rstrip(b'\0').decode()
+            if name in LAYOUTS and LAYOUTS[name].size == size:
+                self.tables[name] = offset
+
+    def probe(self, board) -> tuple[int, int] | None:
+        # (1 if the side to move wins, 0 for a draw and -1 when it loses,
+        # plies to mate) of a SimulationBoard, None when the material has no
+        # table. Positions with castling rights are left to the search, and
+        # with standard rules so are pawn endings, which could need an
+        # under-promotion.
+        if popcount(board.occupied) > MAX_PIECES or board.castling:
+            return None
+        bitboards = board.bitboards
+        strong = WHITE if board.occupancy[WHITE] != bitboards[WHITE * 6 + KING] else BLACK
+        if board.occupancy[strong ^ 1] != bitboards[(strong ^ 1) * 6 + KING]:
+            return None  # both sides have pieces
+        pieces = [board.mailbox[sq] % 6 for sq in iter_bits(board.occupancy[strong])]
+        name = table_name([piece for piece in pieces if piece != KING])
+        offset = self.tables.get(name)
+        if offset is None or (board.standard and PAWN in TABLES[name]):
+            return None
+        # the stronger side is stored as white
+        flip = 56 if strong == BLACK else 0
+        squares = [next(iter_bits(bitboards[strong * 6 + KING])) ^ flip,
+                   next(iter_bits(bitboards[(strong ^ 1) * 6 + KING])) ^ flip]
+        for piece in TABLES[name]:
+            for sq in iter_bits(bitboards[strong * 6 + piece]):
+                squares.append(sq ^ flip)
+        side = WHITE if board.side == strong else BLACK
+        value = self.map[offset + LAYOUTS[name].index(side, squares)]
+        if value == 0:
+            return 0, 0
+        return (1 if side == WHITE else -1), value - 1
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate endgame distance to mate tables.")
+    parser.add_argument('--output', type=str, default='tablebases.bin', help="file to write")
+    parser.add_argument('--tables', nargs='+', choices=BUILD_ORDER, default=list(BUILD_ORDER),
+                        help="tables to generate")
+    parser.add_argument('--verbose', action='store_true', help="print every retrograde step")
+    args = parser.parse_args()
+
+    tables = {}
+    for name in BUILD_ORDER:
+        if name not in args.tables and not (name == 'KQK' and 'KPK' in args.tables):
+            continue
+        start_time = time.time()
+        tables[name] = generate(name, tables, args.verbose)
+        won = np.count_nonzero(tables[name])
+        longest = int(tables[name].max()) - 1
+        print(f'{name}: {won} decided positions, longest mate {longest} plies, '
+              f'{time.time() - start_time:.1f} seconds')
+    write_tables(args.output, {name: tables[name] for name in BUILD_ORDER if name in args.tables})
+    print(f'written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
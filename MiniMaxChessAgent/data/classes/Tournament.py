@@ -0,0 +1,390 @@
+# /* Tournament.py
+
+# Headless tournaments between agents, to compare agent versions or settings.
+# Every pairing (all of them with --mode round-robin, the first agent against
+# each other one with --mode gauntlet) plays the opening suite in order, each
+# opening twice with the colors swapped, over a pool of worker processes.
+# Results are streamed to --output as they come, and the score of every
+# pairing is reported as an Elo difference with its 95% error margin and the
+# likelihood of superiority.
+#
+#   python -m data.classes.Tournament "MinimaxAgent(max_depth=3)" "MinimaxAgent(max_depth=2)" \
+#       --games 200 --workers 4 --sprt --elo0 0 --elo1 50 --output games.jsonl
+#   python -m data.classes.Tournament MinimaxAgent RandomPlayer "MinimaxAgent(quiescence=False)" \
+#       --mode round-robin --games 20 --openings suite.epd
+#
+# Agents are written like the names of the experiment records: a class name,
+# optionally called with keyword arguments. With --sprt a pairing stops as
+# soon as a sequential probability ratio test tells whether the first agent
+# is elo1 or more stronger (H1) or at most elo0 (H0), instead of playing all
+# of its games.
+
+import argparse
+import ast
+import math
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from data.classes.Analysis import parse_epd
+from data.classes.ChessMatch import (
+    MAX_MOVES, RESULT_FIELDS, ResultWriter, headless_board, play_game, make_agent, agent_name
+)
+from data.classes.agents.MinimaxAgent import MinimaxAgent
+from data.classes.agents.RandomPlayer import RandomPlayer
+
+# agents that can play headless, by class name
+AGENTS = {agent_class.__name__: agent_class for agent_class in (MinimaxAgent, RandomPlayer)}
+
+# the experiment record fields, with the opening's name and FEN in place of
+# minimax_color, since both agents of a tournament may be minimax agents
+TOURNAMENT_FIELDS = [new for field in RESULT_FIELDS
+                     for new in (['opening', 'fen'] if field == 'minimax_color' else [field])]
+
+# games submitted per worker ahead of the ones being played
+IN_FLIGHT = 2
+
+# quantile of the normal distribution for the 95% error margins
+Z_95 = 1.959964
+
+# (name, FEN) of a few mainstream openings, a handful of moves deep
+OPENINGS = [
+    ('Italian', 'r1bqk1nr/pppp1ppp/2n5/2b1p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4'),
+    ('Ruy Lopez', 'r1bqkbnr/1ppp1ppp/p1n5/1B2p3/4P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 0 4'),
+    ('Petrov', 'rnbqkb1r/pppp1ppp/5n2/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3'),
+    ("King's Gambit", 'rnbqkbnr/pppp1ppp/8/8/4Pp2/8/PPPP2PP/RNBQKBNR w KQkq - 0 3'),
+    ('Sicilian', 'rnbqkbnr/pp2pppp/3p4/8/3pP3/5N2/PPP2PPP/RNBQKB1R w KQkq - 0 4'),
+    ('French', 'rnbqkbnr/ppp2ppp/4p3/3p4/3PP3/8/PPP2PPP/RNBQKBNR w KQkq - 0 3'),
+    ('Caro-Kann', 'rnbqkbnr/pp2pppp/2p5/3p4/3PP3/8/PPP2PPP/RNBQKBNR w KQkq - 0 3'),
+    ('Scandinavian', 'rnb1kbnr/ppp1pppp/8/3q4/8/8/PPPP1PPP/RNBQKBNR w KQkq - 0 3'),
+    ('Alekhine', 'rnbqkb1r/pppppppp/8/3nP3/8/8/PPPP1PPP/RNBQKBNR w KQkq - 1 3'),
+    ('Modern', 'rnbqk1nr/ppppppbp/6p1/8/3PP3/8/PPP2PPP/RNBQKBNR w KQkq - 1 3'),
+    ("Queen's Gambit Declined", 'rnbqkbnr/ppp2ppp/4p3/3p4/2PP4/8/PP2PPPP/RNBQKBNR w KQkq - 0 3'),
+    ('Slav', 'rnbqkbnr/pp2pppp/2p5/3p4/2PP4/8/PP2PPPP/RNBQKBNR w KQkq - 0 3'),
+    ("King's Indian", 'rnbqk2r/ppppppbp/5np1/8/2PP4/2N5/PP2PPPP/R1BQKBNR w KQkq - 2 4'),
+    ('Nimzo-Indian', 'rnbqk2r/pppp1ppp/4pn2/8/1bPP4/2N5/PP2PPPP/R1BQKBNR w KQkq - 2 4'),
+    ('Dutch', 'rnbqkbnr/ppppp1pp/8/5p2/3P4/8/PPP1PPPP/RNBQKBNR w KQkq - 0 2'),
+    ('English', 'rnbqkbnr/pppp1ppp/8/4p3/2P5/8/PP1PPPPP/RNBQKBNR w KQkq - 0 2'),
+    ('Reti', 'rnbqkbnr/ppp1pppp/8/3p4/8/5NP1/PPPPPP1P/RNBQKB1R b KQkq - 0 2'),
+]
+
+
+def parse_agent(text: str):
+    # the agent spec (see make_agent) of "Name" or "Name(key=value, ...)".
+    # Values are Python literals, bare words are taken as strings.
+    try:
+        node = ast.parse(text.strip(), mode='eval').body
+    except SyntaxError:
+        raise ValueError(f'invalid agent {text!r}')
+    call = node if isinstance(node, ast.Call) else None
+    name = call.func if call is not None else node
+    if not isinstance(name, ast.Name) or name.id not in AGENTS:
+        raise ValueError(f'unknown agent {text!r}, expected one of {", ".join(AGENTS)}')
+    if call is None:
+        return AGENTS[name.id]
+    if call.args:
+        raise ValueError(f'agent options must be keywords: {text!r}')
+    kwargs = {}
+    for keyword in call.keywords:
+        value = keyword.value
+        kwargs[keyword.arg] = value.id if isinstance(value, ast.Name) else ast.literal_eval(value)
+    return AGENTS[name.id], kwargs
+
+
+def load_openings(path: str) -> list[tuple[str, str]]:
+    # (name, FEN) of every EPD or FEN line of the file, named by their id
+    # operation when they have one
+    openings = []
+    with open(path) as file:
+        for number, line in enumerate(file, 1):
+            if line.strip() and not line.lstrip().startswith('#'):
+                fen, operations = parse_epd(line)
+                openings.append((operations.get('id', f'{path}:{number}'), fen))
+    if not openings:
+        raise ValueError(f'no positions in {path}')
+    return openings
+
+
+def expected_score(elo: float) -> float:
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def elo_difference(score: float) -> float:
+    # the Elo difference expected to give the score (0 to 1)
+    if score <= 0:
+        return float('-inf')
+    if score >= 1:
+        return float('inf')
+    return -400 * math.log10(1 / score - 1)
+
+
+def score_variance(wins: int, draws: int, losses: int) -> tuple[float, float]:
+    # (score, variance of the score of one game). A half game of every
+    # result is added to the variance, which would be 0 (and the test
+    # statistics meaningless) as long as all the games ended the same way.
+    games = wins + draws + losses
+    score = (wins + draws / 2) / games
+    variance = ((wins + 0.5) * (1 - score) ** 2 + (draws + 0.5) * (0.5 - score) ** 2
+                + (losses + 0.5) * score ** 2) / (games + 1.5)
+    return score, variance
+
+
+def elo_stats(wins: int, draws: int, losses: int) -> dict:
+    # Elo difference of the results, its 95% error margin and the likelihood
+    # of superiority (the probability of the difference being positive)
+    games = wins + draws + losses
+    if games == 0:
+        return {'elo': None, 'margin': None, 'los': None}
+    score, variance = score_variance(wins, draws, losses)
+    deviation = math.sqrt(variance / games)
+    low = elo_difference(max(score - Z_95 * deviation, 0))
+    high = elo_difference(min(score + Z_95 * deviation, 1))
+    decisive = wins + losses
+    los = 0.5 * (1 + math.erf((wins - losses) / math.sqrt(2 * decisive))) if decisive else 0.5
+    return {'elo': elo_difference(score), 'margin': (high - low) / 2, 'los': los}
+
+
+class SPRT:
+    # Sequential probability ratio test of H0: the Elo difference is elo0
+    # against H1: it is elo1, with false positive rate alpha and false
+    # negative rate beta. The log likelihood ratio uses the normal
+    # approximation of the score.
+    def __init__(self, elo0: float = 0, elo1: float = 10, alpha: float = 0.05,
+                 beta: float = 0.05):
+        self.elo0, self.elo1 = elo0, elo1
+        self.lower = math.log(beta / (1 - alpha))
+        self.upper = math.log((1 - beta) / alpha)
+
+    def llr(self, wins: int, draws: int, losses: int) -> float:
+        games = wins + draws + losses
+        if games == 0:
+            return 0.0
+        score, variance = score_variance(wins, draws, losses)
+        score0, score1 = expected_score(self.elo0), expected_score(self.elo1)
+        return games * (score1 - score0) * (2 * score - score0 - score1) / (2 * variance)
+
+    def status(self, wins: int, draws: int, losses: int) -> str | None:
+        # 'H1', 'H0', or None while the test goes on
+        llr = self.llr(wins, draws, losses)
+        if llr >= self.upper:
+            return 'H1'
+        if llr <= self.lower:
+            return 'H0'
+        return None
+
+
+class Pairing:
+    # the games of two agents, counted from the point of view of the first
+    def __init__(self, first: int, second: int, sprt: SPRT | None = None):
+        self.first, self.second = first, second
+        self.wins = self.draws = self.losses = 0
+        self.started = 0
+        self.sprt = sprt
+        self.decision: str | None = None
+
+    @property
+    def games(self) -> int:
+        return self.wins + self.draws + self.losses
+
+    def next_game(self, openings: list) -> tuple[int, int, tuple[str, str]]:
+        # (white, black, opening) of the next game: every opening twice, the
+        # first agent playing white in the first game
+        game = self.started
+        self.started += 1
+        opening = openings[(game // 2) % len(openings)]
+        if game % 2 == 0:
+            return self.first, self.second, opening
+        return self.second, self.first, opening
+
+    def record(self, white: int, winner: str):
+        if winner == 'draw':
+            self.draws += 1
+        elif (winner == 'white') == (white == self.first):
+            self.wins += 1
+        else:
+            self.losses += 1
+        if self.sprt is not None and self.decision is None:
+            self.decision = self.sprt.status(self.wins, self.draws, self.losses)
+
+
+def play_tournament_game(game: int, white_spec, black_spec, opening: tuple[str, str],
+                         max_moves: int, timeout: float | None,
+                         move_time: float | None) -> dict:
+    # one game of a tournament, run in a worker process
+    name, fen = opening
+    players = {'white': make_agent(white_spec, 'white'), 'black': make_agent(black_spec, 'black')}
+    try:
+        result = play_game(players['white'], players['black'], headless_board(fen),
+                           max_moves=max_moves, timeout=timeout, move_time=move_time)
+    finally:
+        for player in players.values():
+            if hasattr(player, 'close'):
+                player.close()
+    return dict(game=game, white=agent_name(white_spec), black=agent_name(black_spec),
+                opening=name, fen=fen, **result)
+
+
+def pairings_of(players: int, mode: str, sprt: SPRT | None = None) -> list[Pairing]:
+    if mode == 'gauntlet':
+        return [Pairing(0, other, sprt) for other in range(1, players)]
+    if mode == 'round-robin':
+        return [Pairing(first, second, sprt)
+                for first in range(players) for second in range(first + 1, players)]
+    raise ValueError(f'unknown tournament mode {mode!r}')
+
+
+def run_tournament(specs: list, mode: str = 'round-robin', games: int = 100,
+                   openings: list[tuple[str, str]] = OPENINGS, workers: int = 1,
+                   sprt: SPRT | None = None, max_moves: int = MAX_MOVES,
+                   timeout: float | None = None, move_time: float | None = None,
+                   output: str | None = None, verbose: bool = True) -> list[Pairing]:
+    # Plays up to `games` games per pairing of the agent specs (see
+    # make_agent) over `workers` processes and returns the pairings. The
+    # pairing with the fewest games gets the next free worker, pairings
+    # decided by the SPRT are not given new games.
+    pairings = pairings_of(len(specs), mode, sprt)
+    names = [agent_name(spec) for spec in specs]
+    writer = ResultWriter(output, TOURNAMENT_FIELDS) if output else None
+    played = 0
+    start_time = time.time()
+
+    def next_job():
+        open_pairings = [pairing for pairing in pairings
+                         if pairing.decision is None and pairing.started < games]
+        if not open_pairings:
+            return None
+        pairing = min(open_pairings, key=lambda pairing: pairing.started)
+        white, black, opening = pairing.next_game(openings)
+        job = (sum(p.started for p in pairings), specs[white], specs[black], opening,
+               max_moves, timeout, move_time)
+        return pairing, white, job
+
+    def record(pairing: Pairing, white: int, result: dict):
+        nonlocal played
+        played += 1
+        pairing.record(white, result['winner'])
+        if writer is not None:
+            writer.write(result)
+        if verbose:
+            outcome = {'white': '1-0', 'black': '0-1', 'draw': '1/2-1/2'}[result['winner']]
+            print(f"game {result['game']}: {result['white']} - {result['black']} {outcome} "
+                  f"({result['reason']}, {result['opening']})")
+            if pairing.decision is not None and pairing.games == pairing.started:
+                print(f'{names[pairing.first]} vs {names[pairing.second]}: '
+                      f'SPRT accepts {pairing.decision} after {pairing.games} games')
+
+    try:
+        if workers > 1:
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                pending = {}
+                while True:
+                    while len(pending) < workers * IN_FLIGHT:
+                        job = next_job()
+                        if job is None:
+                            break
+                        pairing, white, arguments = job
+                        pending[executor.submit(play_tournament_game, *arguments)] = (pairing, white)
+                    if not pending:
+                        break
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        record(*pending.pop(future), future.result())
+        else:
+            while (job := next_job()) is not None:
+                pairing, white, arguments = job
+                record(pairing, white, play_tournament_game(*arguments))
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if verbose:
+        elapsed = time.time() - start_time
+        print(f'{played} games in {elapsed:.1f} seconds '
+              f'({played * 3600 / max(elapsed, 1e-9):.0f} games/hour)')
+        print_report(names, pairings)
+    return pairings
+
+
+def format_elo(stats: dict) -> str:
+    if stats['elo'] is None:
+        return '-'
+    if math.isinf(stats['elo']):
+        return '+inf' if stats['elo'] > 0 else '-inf'
+    margin = 'inf' if math.isinf(stats['margin']) else f"{stats['margin']:.0f}"
+    return f"{stats['elo'] + 0:+.0f} +/- {margin}"
+
+
+def print_report(names: list[str], pairings: list[Pairing]):
+    # the pairings, then every agent's results against the field when more
+    # than one pairing was played
+    width = max(len(name) for name in names)
+    print(f"{'pairing':<{2 * width + 4}} {'games':>5} {'W-D-L':>11} {'score':>6} "
+          f"{'elo':>14} {'los':>6}  sprt")
+    for pairing in pairings:
+        stats = elo_stats(pairing.wins, pairing.draws, pairing.losses)
+        score = (pairing.wins + pairing.draws / 2) / pairing.games if pairing.games else 0
+        sprt = ''
+        if pairing.sprt is not None:
+            llr = pairing.sprt.llr(pairing.wins, pairing.draws, pairing.losses)
+            sprt = f'{pairing.decision or "running"} (llr {llr:.2f}, bounds '\
+                   f'{pairing.sprt.lower:.2f} {pairing.sprt.upper:.2f})'
+        los = f"{stats['los']:.1%}" if stats['los'] is not None else '-'
+        print(f'{names[pairing.first] + " vs " + names[pairing.second]:<{2 * width + 4}} '
+              f'{pairing.games:>5} {f"{pairing.wins}-{pairing.draws}-{pairing.losses}":>11} '
+              f'{score:>6.1%} {format_elo(stats):>14} {los:>6}  {sprt}')
+    if len(pairings) < 2:
+        return
+    print(f"{'agent':<{width}} {'games':>5} {'W-D-L':>11} {'score':>6} {'elo vs field':>14}")
+    for player, name in enumerate(names):
+        wins = draws = losses = 0
+        for pairing in pairings:
+            if pairing.first == player:
+                wins, draws, losses = wins + pairing.wins, draws + pairing.draws, losses + pairing.losses
+            elif pairing.second == player:
+                wins, draws, losses = wins + pairing.losses, draws + pairing.draws, losses + pairing.wins
+        games = wins + draws + losses
+        score = (wins + draws / 2) / games if games else 0
+        print(f'{name:<{width}} {games:>5} {f"{wins}-{draws}-{losses}":>11} {score:>6.1%} '
+              f'{format_elo(elo_stats(wins, draws, losses)):>14}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play a tournament between agents.")
+    parser.add_argument('agents', type=str, nargs='+',
+                        help='agents such as MinimaxAgent or "MinimaxAgent(max_depth=3)"')
+    parser.add_argument('--mode', choices=('round-robin', 'gauntlet'), default='round-robin',
+                        help="every pairing, or the first agent against each other one")
+    parser.add_argument('--games', type=int, default=100, help="most games per pairing")
+    parser.add_argument('--workers', type=int, default=1, help="processes playing games")
+    parser.add_argument('--openings', type=str, default=None,
+                        help="EPD or FEN file of starting positions, a built in suite otherwise")
+    parser.add_argument('--sprt', action='store_true', help="stop pairings once the SPRT decides")
+    parser.add_argument('--elo0', type=float, default=0, help="Elo difference of H0")
+    parser.add_argument('--elo1', type=float, default=10, help="Elo difference of H1")
+    parser.add_argument('--alpha', type=float, default=0.05, help="false positive rate")
+    parser.add_argument('--beta', type=float, default=0.05, help="false negative rate")
+    parser.add_argument('--max-moves', type=int, default=MAX_MOVES,
+                        help="moves after which a game is drawn")
+    parser.add_argument('--timeout', type=float, default=None,
+                        help="seconds after which a game is drawn")
+    parser.add_argument('--move-time', type=float, default=None,
+                        help="seconds after which a search is cut off")
+    parser.add_argument('--output', type=str, default=None,
+                        help="file the games are streamed to (.csv or JSON lines)")
+    args = parser.parse_args()
+
+    try:
+        specs = [parse_agent(agent) for agent in args.agents]
+    except ValueError as error:
+        parser.error(str(error))
+    if len(specs) < 2:
+        parser.error('a tournament needs at least two agents')
+    openings = load_openings(args.openings) if args.openings else OPENINGS
+    sprt = SPRT(args.elo0, args.elo1, args.alpha, args.beta) if args.sprt else None
+    run_tournament(specs, args.mode, args.games, openings, args.workers, sprt,
+                   args.max_moves, args.timeout, args.move_time, args.output)
+
+
+if __name__ == '__main__':
+    main()
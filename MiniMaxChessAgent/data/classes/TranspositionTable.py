@@ -0,0 +1,140 @@
+# /* TranspositionTable.py
+
+from array import array
+from multiprocessing import shared_memory
+
+# bound types stored with a score
+EXACT = 0
+LOWER = 1  # the search failed high, the real score is at least the stored one
+UPPER = 2  # the search failed low, the real score is at most the stored one
+
+# Every entry is two 64 bit words: the Zobrist key xor-ed with the data word,
+# and a packed data word
+#   bits  0-15  best move (packed move, 0 when there is none)
+#   bits 16-23  depth
+#   bits 24-25  bound type
+#   bits 26-31  search generation, used to age out old entries
+#   bits 32-63  score + SCORE_OFFSET
+# Storing key ^ data lets a probe detect an entry whose two words were written
+# by different processes at the same time (the xor no longer gives the key),
+# so a table shared between processes needs no locks.
+# A bucket holds two entries: a depth-preferred slot that is only overwritten
+# by deeper (or stale) results, and an always-replace slot.
+ENTRY_WORDS = 2
+BUCKET_ENTRIES = 2
+BUCKET_BYTES = ENTRY_WORDS * BUCKET_ENTRIES * 8
+SCORE_OFFSET = 1 << 31
+GENERATION_MASK = 0x3F
+
+
+def pack_entry(move: int, depth: int, bound: int, generation: int, score: int) -> int:
+    return move | (depth << 16) | (bound << 24) | (generation << 26) \
+        | ((score + SCORE_OFFSET) << 32)
+
+
+def unpack_entry(data: int) -> tuple[int, int, int, int]:
+    # (move, depth, bound, score)
+    return (data & 0xFFFF, (data >> 16) & 0xFF, (data >> 24) & 0x3,
+            (data >> 32) - SCORE_OFFSET)
+
+
+def bucket_count(size_mb: float) -> int:
+    buckets = max(1, int(size_mb * 1024 * 1024) // BUCKET_BYTES)
+    # a power of two number of buckets lets the key be masked into an index
+    return 1 << (buckets.bit_length() - 1)
+
+
+class TranspositionTable:
+    def __init__(self, size_mb: float = 16, buffer=None):
+        # the entries live in a private array, or in `buffer` (any writable
+        # buffer of at least size_mb, e.g. shared memory) when one is given
+        self.buckets = bucket_count(size_mb)
+        if buffer is None:
+            self.table = array('Q', bytes(self.buckets * BUCKET_BYTES))
+        else:
+            self.table = memoryview(buffer)[:self.buckets * BUCKET_BYTES].cast('Q')
+        self.mask = self.buckets - 1
+        self.generation = 0
+
+    @property
+    def size_mb(self) -> float:
+        return self.buckets * BUCKET_BYTES / (1024 * 1024)
+
+    def clear(self):
+        for i in range(len(self.table)):
+            self.table[i] = 0
+        self.generation = 0
+
+    def new_search(self):
+        # entries written by earlier searches become preferred for replacement
+        self.generation = (self.generation + 1) & GENERATION_MASK
+
+    def probe(self, key: int) -> tuple[int, int, int, int] | None:
+        # (move, depth, bound, score) of the stored entry for key, or None
+        table = self.table
+        index = (key & self.mask) * (ENTRY_WORDS * BUCKET_ENTRIES)
+        data = table[index + 1]
+        if table[index] ^ data == key:
+            return unpack_entry(data)
+        data = table[index + 3]
+        if table[index + 2] ^ data == key:
+            return unpack_entry(data)
+        return None
+
+    def store(self, key: int, move: int, depth: int, bound: int, score: int):
+        table = self.table
+        index = (key & self.mask) * (ENTRY_WORDS * BUCKET_ENTRIES)
+        data = table[index + 1]
+        same_key = table[index] ^ data == key
+        stale = (data >> 26) & GENERATION_MASK != self.generation
+        if same_key or stale or depth >= (data >> 16) & 0xFF or not data:
+            if same_key and not move:
+                # keep the best move of an earlier search of the position
+                move = data & 0xFFFF
+        else:
+            index += ENTRY_WORDS
+            data = table[index + 1]
+            if table[index] ^ data == key and not move:
+                move = data & 0xFFFF
+        data = pack_entry(move, depth, bound, self.generation, score)
+        table[index] = key ^ data
+        table[index + 1] = data
+
+    def hashfull(self) -> float:
+        # fraction of the first buckets written by the current search
+        sample = min(self.buckets, 1000)
+        used = 0
+        for bucket in range(sample):
+            index = bucket * ENTRY_WORDS * BUCKET_ENTRIES
+            for slot in (1, 3):
+                data = self.table[index + slot]
+                if data and (data >> 26) & GENERATION_MASK == self.generation:
+                    used += 1
+        return used / (sample * BUCKET_ENTRIES)
+
+
+class SharedTranspositionTable(TranspositionTable):
+    # A table in multiprocessing shared memory. The creating process owns the
+    # segment and unlinks it in close(), other processes attach by name with
+    # the same size_mb.
+    def __init__(self, size_mb: float = 16, name: str | None = None):
+        if name is None:
+            size = bucket_count(size_mb) * BUCKET_BYTES
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+        else:
+            # worker processes share the resource tracker of the process that
+            # started them, so attaching does not hand them the segment
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        super().__init__(size_mb, buffer=self.shm.buf)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def close(self):
+        self.table.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
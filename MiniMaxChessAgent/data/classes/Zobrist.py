@@ -0,0 +1,42 @@
+# /* Zobrist.py
+
+import random
+
+# Zobrist keys for hashing SimulationBoard positions. The generator is seeded
+# so every process (and every run) agrees on the key of a position.
+_rng = random.Random(0x5A0B7157)
+
+# PIECE_KEYS[piece][square] with piece = color * 6 + piece type
+PIECE_KEYS: list[list[int]] = [
+    [_rng.getrandbits(64) for _ in range(64)] for _ in range(12)
+]
+# xor-ed in when black is to move
+SIDE_KEY: int = _rng.getrandbits(64)
+
+_CASTLING_RIGHT_KEYS = [_rng.getrandbits(64) for _ in range(4)]
+# one key per combination of the four castling right bits
+CASTLING_KEYS: list[int] = []
+for rights in range(16):
+    key = 0
+    for bit in range(4):
+        if rights & (1 << bit):
+            key ^= _CASTLING_RIGHT_KEYS[bit]
+    CASTLING_KEYS.append(key)
+# xor-ed in by file while an en passant capture is possible (standard rules)
+EN_PASSANT_KEYS: list[int] = [_rng.getrandbits(64) for _ in range(8)]
+
+
+def compute_key(bitboards: list[int], side: int, castling: int, ep_square: int = -1) -> int:
+    # full hash of a position, the board keeps it up to date incrementally
+    key = CASTLING_KEYS[castling]
+    if ep_square >= 0:
+        key ^= EN_PASSANT_KEYS[ep_square & 7]
+    if side:
+        key ^= SIDE_KEY
+    for piece, bitboard in enumerate(bitboards):
+        keys = PIECE_KEYS[piece]
+        while bitboard:
+            bit = bitboard & -bitboard
+            key ^= keys[bit.bit_length() - 1]
+            bitboard ^= bit
+    return key
@@ -1,9 +1,79 @@
 # /* ChessAgent.py
 
+import threading
+import time
 from typing import Literal
+from data.classes import Profiling
 from data.classes.Square import Square
 from data.classes.Board import Board
 
+class SearchHandle:
+    # A decision of an agent started with ChessAgent.start_search. poll()
+    # tells whether it is over, cancel() asks it to play its best move so far
+    # and result() waits for the action, what choose_action would return.
+    # The decision is cancelled once the deadline (a time.time()) has passed.
+    def __init__(self, deadline: float | None = None):
+        self.deadline = deadline
+        self.action = None
+        self.error = None
+        self.done = threading.Event()
+
+    def finish(self, action=None, error: BaseException | None = None):
+        self.action, self.error = action, error
+        self.done.set()
+
+    def poll(self) -> bool:
+        if not self.done.is_set() and self.deadline is not None and time.time() >= self.deadline:
+            self.cancel()
+        return self.done.is_set()
+
+    def cancel(self):
+        # a decision that can not be stopped runs to its end
+        pass
+
+    def result(self, timeout: float | None = None):
+        # the action, raising TimeoutError when it is not there after
+        # timeout seconds
+        end = time.time() + timeout if timeout is not None else None
+        if self.deadline is not None and (end is None or self.deadline < end):
+            self.done.wait(max(self.deadline - time.time(), 0))
+            self.poll()
+        if not self.done.wait(max(end - time.time(), 0) if end is not None else None):
+            raise TimeoutError('the agent is still choosing its action')
+        if self.error is not None:
+            raise self.error
+        return self.action
+
+class ThreadedSearch(SearchHandle):
+    # Runs the agent's choose_action in a background thread. The agent has
+    # to provide stop(), making a running choose_action return soon, and
+    # clear_stop(), called once the decision is over.
+    def __init__(self, agent, board: Board, deadline: float | None = None):
+        super().__init__(deadline)
+        self.agent = agent
+        # cancel() and the end of the decision exclude each other, so a late
+        # cancel can not leave the agent stopped for its next decision
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, args=(board,), daemon=True)
+        self.thread.start()
+
+    def run(self, board: Board):
+        action, error = None, None
+        try:
+            # the decision is profiled here, not in the thread waiting for it
+            with Profiling.running():
+                action = self.agent.choose_action(board)
+        except BaseException as exception:
+            error = exception
+        with self.lock:
+            self.agent.clear_stop()
+            self.finish(action, error)
+
+    def cancel(self):
+        with self.lock:
+            if not self.done.is_set():
+                self.agent.stop()
+
 class ChessAgent:
     # Create private variables for Agent
     def __init__(self, color: Literal['white', 'black']):
@@ -12,4 +82,13 @@ class ChessAgent:
         self.color = color
 
     def choose_action(self, board: Board) -> tuple[Square, Square] | bool:
-        return False
\ No newline at end of file
+        return False
+
+    def start_search(self, board: Board, deadline: float | None = None) -> SearchHandle:
+        # starts choosing an action without waiting for it. Agents are
+        # synchronous unless they override this, the action is then chosen
+        # right away and the handle is already done.
+        handle = SearchHandle(deadline)
+        with Profiling.running():
+            handle.finish(self.choose_action(board))
+        return handle
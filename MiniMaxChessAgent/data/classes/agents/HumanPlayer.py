@@ -11,16 +11,19 @@ class HumanPlayer(ChessAgent):
 
     def choose_action(self, board: Board):
         assert(board.turn == self.color)
-        choosing_move = True
-        while choosing_move:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    return False
-                if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                    move = self.handle_click(board, *pygame.mouse.get_pos())
-                    if move is not None:
-                        return move
-            board.draw()
+        board.draw()
+        # sleeps until something happens, the board only changes on clicks
+        while True:
+            event = pygame.event.wait()
+            if event.type == pygame.QUIT:
+                return False
+            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                move = self.handle_click(board, *event.pos)
+                if move is not None:
+                    return move
+                board.draw()
+            elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                board.draw(full=True)
 
     def handle_click(self, board: Board, mx: float, my: float) \
                      -> tuple[Square, Square]:
@@ -1,9 +1,19 @@
 # /* MinimaxPlayer.py
 
 from data.classes.Board import Board
-from data.classes.agents.ChessAgent import ChessAgent
-from data.classes.Simulation import SimulationBoard, SmSq
+from data.classes.agents.ChessAgent import ChessAgent, ThreadedSearch
+from data.classes.Simulation import SimulationBoard, SmSq, SQUARES
+from data.classes.Bitboard import (
+    COLOR_INDEX, PIECE_NOTATION, move_from, move_to, move_promotion, move_uci, square_pos
+)
 from data.classes.Square import Square
+from data.classes.Evaluation import MATERIAL, tapered_score
+from data.classes.BatchEvaluation import evaluate_batch
+from data.classes.TranspositionTable import TranspositionTable, EXACT, LOWER, UPPER
+from data.classes.OpeningBook import PolyglotBook
+from data.classes.Tablebase import Tablebase
+from typing import Literal
+import json
 import random
 import time
 
@@ -22,9 +32,130 @@ point_map = {
             "K": "INF" #King
         }
 
+# attacker values for MVV-LVA ordering, capturing with the king is tried last
+# among the captures of the same victim
+attacker_values = {"P": 1, "N": 3, "B": 3, "R": 5, "Q": 9, "K": 10}
+
+# move ordering tiers, higher is searched first
+TT_MOVE_ORDER = 1 << 30
+CAPTURE_ORDER = 1 << 28
+KILLER_ORDER = 1 << 26
+# history scores are halved before they would reach the killer tier
+HISTORY_LIMIT = 1 << 24
+MAX_PLY = 128
+
+# a capture is skipped in the quiescence search when even winning the captured
+# piece plus this margin (centipawns) cannot bring the score back to alpha (or beta)
+DELTA_MARGIN = 200
+
+# score of a checkmate, shortened by the number of plies needed to deliver it
+MATE_SCORE = 100000
+MATE_BOUND = MATE_SCORE - 1000
+# bound above every score, for the open ends of search windows
+INFINITY = MATE_SCORE + 1
+
+# half width (centipawns) of the first aspiration window around the score of
+# the previous iteration, doubled after each failure
+ASPIRATION_WINDOW = 50
+
+# how many nodes are searched between two checks of the time and node budget
+BUDGET_CHECK_INTERVAL = 256
+
+# counters kept for every decision, summed over the workers of a parallel
+# search (see MinimaxAgent.search_stats)
+COUNTERS = ('nodes', 'qnodes', 'cutoffs', 'first_move_cutoffs', 'tt_probes', 'tt_hits',
+            'tablebase_hits', 'researches', 'aspiration_researches')
+
+class SearchAborted(Exception):
+    # raised inside the search once the time or node budget is used up
+    pass
+
 class MinimaxAgent(ChessAgent):
+    def __init__(self, color: Literal['white', 'black'], tt_size_mb: float = 16,
+                 max_depth: int = 4, time_limit: float | None = None,
+                 node_limit: int | None = None, tie_break: bool = True,
+                 seed: int | None = None, quiescence: bool = True,
+                 quiescence_checks: bool = False, workers: int = 1,
+                 parallel_mode: Literal['root', 'lazy_smp'] = 'root',
+                 book: str | None = None,
+                 book_mode: Literal['weighted', 'best'] = 'weighted',
+                 tablebase: str | None = None, stats_sink: str | None = None,
+                 ponder: Literal['expected', 'all'] | None = None):
+        super().__init__(color)
+        # search settings, handed to the agents of worker processes
+        self.search_options = dict(tt_size_mb=tt_size_mb, max_depth=max_depth,
+                                   tie_break=tie_break, seed=seed,
+                                   quiescence=quiescence,
+                                   quiescence_checks=quiescence_checks,
+                                   tablebase=tablebase)
+        # the table is kept between decisions, positions searched for the
+        # previous move are often reached again
+        self.tt = TranspositionTable(tt_size_mb)
+        # iterative deepening stops at max_depth plies or when the per move
+        # budget (seconds and/or nodes) runs out, whichever comes first
+        self.max_depth = max_depth
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.deadline: float | None = None
+        # node counter and stop flag shared by the workers of a parallel
+        # search, if any
+        self.shared_nodes = None
+        self.stop_flag = None
+        # set by stop() while a decision runs in the background (see
+        # start_search), the search then returns its best move so far
+        self.stopped = False
+        # at the horizon captures are resolved before evaluating, optionally
+        # searching every evasion when the side to move is in check
+        self.quiescence = quiescence
+        self.quiescence_checks = quiescence_checks
+        # search counters of the current decision (COUNTERS), and the node
+        # count after every completed iteration
+        self.reset_counters()
+        self.iteration_nodes: list[int] = []
+        # moves that caused a cutoff at a ply, and cutoff counts of quiet
+        # moves indexed by side and from/to squares
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        self.history = [[0] * 4096 for _ in range(2)]
+        # length of the board history at the root of the search, plies (and
+        # so mate distances) are counted from there
+        self.root_ply = 0
+        # equally ordered moves are shuffled by a (seedable) random tie-breaker,
+        # which keeps the games varied without throwing the ordering away
+        self.rng = random.Random(seed) if tie_break else None
+        # with more than one worker the search runs on a pool of persistent
+        # processes, either splitting the root moves between them ('root') or
+        # with all of them searching the root over one shared table ('lazy_smp')
+        if parallel_mode not in ('root', 'lazy_smp'):
+            raise ValueError(f'unknown parallel mode {parallel_mode!r}')
+        self.workers = workers
+        self.parallel_mode = parallel_mode
+        self.parallel = None
+        if workers > 1:
+            self.parallel_search()
+        # while the opponent thinks, a background worker searches the reply
+        # expected from the principal variation ('expected') or every reply in
+        # turn, expected one first ('all'). When the opponent plays a pondered
+        # reply its search is used (a ponderhit), otherwise it is dropped.
+        if ponder not in (None, 'expected', 'all'):
+            raise ValueError(f'unknown ponder mode {ponder!r}')
+        self.ponder = ponder
+        self.ponderer = None
+        if ponder is not None:
+            from data.classes.ParallelSearch import PonderSearch
+            self.ponderer = PonderSearch(self.color, self.search_options)
+        # moves found in a Polyglot opening book are played without a search
+        self.book = PolyglotBook(book) if book else None
+        self.book_mode = book_mode
+        # endgames found in the tablebase file (see Tablebase.py) are looked
+        # up instead of searched
+        self.tablebase = Tablebase(tablebase) if tablebase else None
+        # statistics of the last decision (see search_stats), also appended
+        # to the stats_sink file as JSON lines when one is given
+        self.last_stats: dict | None = None
+        self.stats_file = open(stats_sink, 'a') if stats_sink else None
+
     @staticmethod
-    #A simulation board is created to make sure minimax agent can move the pieces 
+    #A simulation board is created to make sure minimax agent can move the pieces
     # andevaluate the best possible move. One alternatives was creating the copy of board
     # However the challenge was to copy of the board which is created from copy is a shallow copy
     def sm_sq_to_sq(sim_square: SmSq, board: Board) -> Square:
@@ -34,299 +165,563 @@ class MinimaxAgent(ChessAgent):
     def choose_action(self, board: Board, verbose: bool = True):
 
         start_time = time.time()
-        best_move = None
-        best_value = float('-inf') # setting the best value to least so that it can be updated later
 
-        sim_bd = SimulationBoard() # a simulation board is being created 
+        sim_bd = SimulationBoard() # a simulation board is being created
         sim_bd.copy_from_board(board)
-        possible_move = self.get_all_possible_moves(sim_bd, self.color)
-
-        random.shuffle(possible_move)
-
-        for move in possible_move:
-            sim_bd.handle_move(move['curr_pos'], move['next_pos'])
-            mv_value = self.minimax(sim_bd, 
-                                      depth=3, 
-                                      alpha=float('-inf'), 
-                                      beta=float('inf'), 
-                                      maximizing_player=False)
-            if mv_value > best_value:
-                best_value = mv_value
-                best_move = (move['start'], move['end'])
-        
-
-        end_time = time.time()  # End measuring time
-        decision_time = end_time - start_time  # Calculate the decision time
-        print(f"Decision Time: {decision_time:.4f} seconds")
+
+        if self.book is not None:
+            # the simulation board plays without en passant, the book key
+            # still needs the square of a double step (see Board.ep_square)
+            book_move = self.book.find_move(sim_bd, self.book_mode, self.rng, board.ep_square)
+            if book_move is not None:
+                if verbose:
+                    print(f"Book move: {move_uci(book_move)}")
+                self.record_stats(dict(color=self.color, book=True, best_move=move_uci(book_move),
+                                       seconds=round(time.time() - start_time, 4)))
+                if self.ponderer is not None:
+                    self.ponderer.stop()
+                return (board.get_square_from_pos(square_pos(move_from(book_move))),
+                        board.get_square_from_pos(square_pos(move_to(book_move))))
+
+        best_move = self.pondered_move(sim_bd, start_time)
+        if best_move is None:
+            _, best_move, _ = self.search(sim_bd, start_time)
+        if best_move and self.ponderer is not None:
+            self.start_pondering(board, best_move['move'])
+
+        if verbose:
+            stats = self.last_stats
+            if stats.get('ponderhit'):
+                print("Ponderhit")
+            print(f"Decision Time: {stats['seconds']:.4f} seconds")
+            print(f"depth {stats['depth']} score {stats['score']} nodes {stats['nodes']} "
+                  f"({stats['qnodes']} quiescence) nps {stats['nps']} ebf {stats['ebf']} "
+                  f"pv {' '.join(stats['pv'])}")
 
         # Convert the best move's SimulationSquare to Square before returning
         if best_move:
-            start_square = self.sm_sq_to_sq(best_move[0], board)
-            end_square = self.sm_sq_to_sq(best_move[1], board)
+            start_square = self.sm_sq_to_sq(best_move['start'], board)
+            end_square = self.sm_sq_to_sq(best_move['end'], board)
             return (start_square, end_square)
 
         return False
 
-    # def print_possible_moves(self, possible_moves):
-    #     print("\n###################################")
-    #     print("-------------  MOVES --------------\n")
-    #     for move in possible_moves:
-    #             print("-----------------------------")
-    #             print("curr_pos: ", move["curr_pos"])
-    #             print("curr_piece", move["curr_piece_color"], move["curr_piece_notation"])
-    #             print("next_pos: ", move["next_pos"])
-    #             print("next_piece: ", move["next_piece_color"], move["next_piece_notation"])
-    #             print("can_capture: ", move["can_capture"])
-    #             print("points: ", move["points"])
-    #     print()
-    
-    def evaluate_board(self, board: Board): #Function to evaluate board
-        point_map = {
-            "P": 1,
-            "N": 3,
-            "B": 3,
-            "R": 5,
-            "Q": 9,
-            "K": 0  # King will not be considered for evaluation as the end goal is to take down the king
-        }
-
-        score = 0
-        for sq in board.squares:
-            if sq.occupying_piece:
-                piece = sq.occupying_piece
-                piece_value = point_map.get(piece.notation.upper(), 0)
-                score += piece_value if piece.color == self.color else -piece_value
-
-        return score
+    def start_search(self, board: Board, deadline: float | None = None) -> ThreadedSearch:
+        # chooses the action in a background thread, so the caller (e.g. an
+        # event loop) keeps running meanwhile. Cancelling the handle, or its
+        # deadline passing, plays the move of the last completed depth.
+        return ThreadedSearch(self, board, deadline)
+
+    def stop(self):
+        self.stopped = True
+        for pool in (self.parallel, self.ponderer):
+            if pool is not None:
+                pool.cancel()
+
+    def clear_stop(self):
+        self.stopped = False
+        for pool in (self.parallel, self.ponderer):
+            if pool is not None:
+                pool.cancelled = False
+
+    def start_pondering(self, board: Board, move: int):
+        # queues the search of the opponent's replies to move, the agent's
+        # move about to be played on board
+        position = SimulationBoard()
+        position.copy_from_board(board)
+        position.make_move(move)
+        replies = position.get_legal_moves()
+        pv = self.last_stats['pv'] if self.last_stats else []
+        expected = [reply for reply in replies if len(pv) > 1 and move_uci(reply) == pv[1]]
+        if self.ponder == 'all' or not expected:
+            # without an expected reply every reply is pondered
+            replies.sort(key=lambda reply: reply not in expected)
+        else:
+            replies = expected
+        self.ponderer.start(position, replies)
+
+    def pondered_move(self, board: SimulationBoard, start_time: float) -> dict | None:
+        # the move dict of the pondered search of the position when there is
+        # one (waiting for it within the time budget), None otherwise
+        if self.ponderer is None:
+            return None
+        result = self.ponderer.result(board, self.time_limit)
+        if result is None or result[1] is None or result[2] == 0:
+            return None
+        value, move, depth, stats = result
+        # seconds is the time the opponent waited, ponder_seconds the search's
+        self.record_stats(dict(stats, ponderhit=True, seconds=round(time.time() - start_time, 4),
+                               ponder_seconds=stats['seconds']))
+        for possible_move in self.get_all_possible_moves(board, self.color):
+            if possible_move['move'] == move:
+                return possible_move
+        return None
+
+    def search(self, board: SimulationBoard, start_time: float | None = None):
+        # searches the position for the agent's color, which has to be the
+        # side to move, within the budget counted from start_time. Returns
+        # (best value, best move dict, depth) of the deepest completed
+        # iteration, the move being None without a legal move.
+        # The statistics of the search are left in last_stats.
+        if start_time is None:
+            start_time = time.time()
+        root = board.snapshot()
+        self.new_search()
+        self.root_ply = len(board.history)
+        self.deadline = start_time + self.time_limit if self.time_limit else None
+        possible_move = self.get_all_possible_moves(board, self.color)
+
+        entry = self.tt.probe(board.key)
+        self.order_moves(board, possible_move, 0, entry[0] if entry else 0)
+
+        if self.workers > 1 and len(possible_move) > 1:
+            value, move, depth = self.parallel_search().search(
+                board, possible_move, self.max_depth, self.deadline, self.node_limit)
+            for name, count in self.parallel.counters.items():
+                setattr(self, name, getattr(self, name) + count)
+            self.iteration_nodes = self.parallel.iteration_nodes
+        else:
+            value, move, depth = self.iterative_deepening(board, possible_move)
+        # the board may be left mid-search, the PV is read from a fresh copy
+        self.record_stats(self.search_stats(SimulationBoard.from_snapshot(root), value, move,
+                                            depth, time.time() - start_time))
+        return value, move, depth
+
+    def reset_counters(self):
+        for name in COUNTERS:
+            setattr(self, name, 0)
+
+    def counters(self) -> dict[str, int]:
+        return {name: getattr(self, name) for name in COUNTERS}
+
+    def search_stats(self, board: SimulationBoard, value: int | None, move: dict | None,
+                     depth: int, seconds: float) -> dict:
+        # counters of the decision plus the derived rates: nodes per second,
+        # the share of beta cutoffs made by the first move searched, the
+        # share of table probes that found their position, the effective
+        # branching factor (nodes of the last iteration over the one before)
+        # and the share of the table filled by this search
+        table = getattr(self.parallel, 'tt', None) or self.tt
+        stats = dict(color=self.color, book=False, ponderhit=False, **self.counters())
+        iterations = [after - before for before, after
+                      in zip([0] + self.iteration_nodes, self.iteration_nodes)]
+        stats.update(
+            seconds=round(seconds, 4),
+            nps=round(self.nodes / max(seconds, 1e-9)),
+            first_move_cutoff_rate=round(self.first_move_cutoffs / self.cutoffs, 3) if self.cutoffs else None,
+            tt_hit_rate=round(self.tt_hits / self.tt_probes, 3) if self.tt_probes else None,
+            hashfull=round(table.hashfull(), 3),
+            ebf=round(iterations[-1] / iterations[-2], 2)
+                if len(iterations) >= 2 and iterations[-2] else None,
+            depth=depth,
+            score=value,
+            best_move=move_uci(move['move']) if move else None,
+            pv=self.principal_variation(board, move, depth),
+        )
+        return stats
+
+    def principal_variation(self, board: SimulationBoard, move: dict | None, depth: int) -> list[str]:
+        # the best move followed by the hash moves of the positions it leads
+        # to, in UCI notation. The workers of a root parallel search keep
+        # their tables, so there the line is often the move alone.
+        if move is None:
+            return []
+        table = getattr(self.parallel, 'tt', None) or self.tt
+        seen = {board.key}
+        mv = move['move']
+        pv = []
+        while True:
+            pv.append(move_uci(mv))
+            board.make_move(mv)
+            if len(pv) >= max(depth, 1) or board.key in seen:
+                break
+            seen.add(board.key)
+            entry = table.probe(board.key)
+            if entry is None or entry[0] not in board.get_legal_moves():
+                break
+            mv = entry[0]
+        return pv
+
+    def record_stats(self, stats: dict):
+        self.last_stats = stats
+        if self.stats_file is not None:
+            self.stats_file.write(json.dumps(stats) + '\n')
+            self.stats_file.flush()
+
+    def new_search(self):
+        # resets the per decision state of the search
+        self.tt.new_search()
+        self.reset_counters()
+        self.iteration_nodes = []
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        self.age_history()
+
+    def iterative_deepening(self, board: SimulationBoard, possible_moves: list[dict]):
+        # the move of the deepest completed iteration is played, returns
+        # (best value, best move, depth) like the parallel searches
+        if not possible_moves:
+            # checkmated or stalemated, there is nothing to search
+            return None, None, 0
+        best_value, best_move, completed = None, possible_moves[0], 0
+        for depth in range(1, self.max_depth + 1):
+            try:
+                best_value, best_move = self.search_depth(board, possible_moves, depth, best_value)
+            except SearchAborted:
+                # the board is left mid-search, it is not used anymore
+                break
+            completed = depth
+            self.iteration_nodes.append(self.nodes)
+            # the best move so far is searched first in the next iteration
+            possible_moves.remove(best_move)
+            possible_moves.insert(0, best_move)
+            if abs(best_value) > MATE_BOUND:
+                break  # a forced mate was found, searching deeper will not change it
+        return best_value, best_move, completed
+
+    def parallel_search(self):
+        if self.parallel is None:
+            from data.classes.ParallelSearch import RootParallelSearch, LazySMPSearch
+            search = LazySMPSearch if self.parallel_mode == 'lazy_smp' else RootParallelSearch
+            self.parallel = search(self.color, self.workers, self.search_options)
+        return self.parallel
+
+    def close(self):
+        # stops the worker processes of the parallel search and of pondering,
+        # and closes the book, the tablebase and the statistics file
+        if self.parallel is not None:
+            self.parallel.close()
+            self.parallel = None
+        if self.ponderer is not None:
+            self.ponderer.close()
+            self.ponderer = None
+        if self.book is not None:
+            self.book.close()
+            self.book = None
+        if self.tablebase is not None:
+            self.tablebase.close()
+            self.tablebase = None
+        if self.stats_file is not None:
+            self.stats_file.close()
+            self.stats_file = None
+
+    def search_root(self, board: SimulationBoard, possible_moves: list[dict], depth: int,
+                    alpha: int = -INFINITY, beta: int = INFINITY):
+        # returns the best value and move of a search `depth` plies deep. The
+        # best value so far is the alpha of the moves after it, which only
+        # get a null window search unless they might beat it (see negamax);
+        # the search stops early when a move reaches beta.
+        best_move = None
+        best_value = -INFINITY
+        for i, move in enumerate(possible_moves):
+            board.make_move(move['move'])
+            if i == 0:
+                value = -self.negamax(board, depth - 1, -beta, -alpha)
+            else:
+                value = -self.negamax(board, depth - 1, -alpha - 1, -alpha)
+                if alpha < value < beta:
+                    self.researches += 1
+                    value = -self.negamax(board, depth - 1, -beta, -alpha)
+            board.unmake_move()
+            if best_move is None or value > best_value:
+                best_value = value
+                best_move = move
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+        return best_value, best_move
+
+    def search_depth(self, board: SimulationBoard, possible_moves: list[dict], depth: int,
+                     guess: int | None = None):
+        # one iteration of iterative deepening. Given the score of the
+        # previous iteration the root is searched in an aspiration window
+        # around it, widened on the side the score falls out of until the
+        # score lands inside.
+        if guess is None or abs(guess) > MATE_BOUND:
+            return self.search_root(board, possible_moves, depth)
+        delta = ASPIRATION_WINDOW
+        alpha, beta = guess - delta, guess + delta
+        while True:
+            value, move = self.search_root(board, possible_moves, depth, alpha, beta)
+            if value <= alpha:
+                alpha = max(value - delta, -INFINITY)
+            elif value >= beta:
+                beta = min(value + delta, INFINITY)
+            else:
+                return value, move
+            self.aspiration_researches += 1
+            delta *= 2
+
+    def order_moves(self, board: SimulationBoard, possible_moves: list[dict], ply: int, tt_move: int):
+        # hash move, then captures (and promotions) by MVV-LVA, then the killer
+        # moves of the ply, then the remaining quiet moves by history score
+        killers = self.killers[ply] if ply < MAX_PLY else (0, 0)
+        history = self.history[board.side]
+        rng = self.rng
+        def order(move):
+            mv = move['move']
+            if mv == tt_move:
+                key = TT_MOVE_ORDER
+            elif move['can_capture'] or move_promotion(mv):
+                victim = move['points'] + (point_map[PIECE_NOTATION[move_promotion(mv)]] if move_promotion(mv) else 0)
+                key = CAPTURE_ORDER + victim * 16 - attacker_values[move['curr_piece_notation']]
+            elif mv == killers[0]:
+                key = KILLER_ORDER + 1
+            elif mv == killers[1]:
+                key = KILLER_ORDER
+            else:
+                key = history[mv & 0xFFF]
+            return key + rng.random() if rng else key
+        possible_moves.sort(key=order, reverse=True)
+
+    def record_cutoff(self, board: SimulationBoard, move: dict, ply: int, depth: int,
+                      index: int = 0):
+        # quiet moves refuting a position are remembered as killers and in
+        # history, index is the move's place in the search order
+        self.cutoffs += 1
+        if index == 0:
+            self.first_move_cutoffs += 1
+        mv = move['move']
+        if move['can_capture'] or move_promotion(mv):
+            return
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if killers[0] != mv:
+                killers[1] = killers[0]
+                killers[0] = mv
+        history = self.history[board.side]
+        history[mv & 0xFFF] += depth * depth
+        if history[mv & 0xFFF] >= HISTORY_LIMIT:
+            self.age_history()
+
+    def age_history(self):
+        for history in self.history:
+            for i in range(len(history)):
+                history[i] >>= 1
+
+    def check_budget(self):
+        if self.stopped or (self.stop_flag is not None and self.stop_flag.value):
+            raise SearchAborted()
+        nodes = self.nodes
+        if self.shared_nodes is not None:
+            # the workers of a parallel search spend one node budget together
+            with self.shared_nodes.get_lock():
+                self.shared_nodes.value += BUDGET_CHECK_INTERVAL
+                nodes = self.shared_nodes.value
+        if self.node_limit is not None and nodes >= self.node_limit:
+            raise SearchAborted()
+        if self.deadline is not None and time.time() >= self.deadline:
+            raise SearchAborted()
+
+    def evaluate_board(self, board: SimulationBoard): #Function to evaluate board
+        # material and piece-square balance in centipawns from the point of view
+        # of the agent, the board keeps the terms up to date on every move
+        score = tapered_score(board.middle_game[0] - board.middle_game[1],
+                              board.end_game[0] - board.end_game[1],
+                              board.phase)
+        return score if self.color == 'white' else -score
+
+    def evaluate_side(self, board: SimulationBoard) -> int:
+        # evaluate_board from the point of view of the side to move
+        score = self.evaluate_board(board)
+        return score if board.turn == self.color else -score
+
+    def evaluate_batch(self, positions):
+        # scores of many encoded positions (see BatchEvaluation.py) with the
+        # weights of evaluate_board, from the point of view of the agent
+        return evaluate_batch(positions, self.color)
 
     def get_all_possible_moves(self, board: SimulationBoard, color: str):
+        # legal moves of `color`, which has to be the side to move on the board
+        assert(board.turn == color)
         possible_moves = []
-
-        checkmate_st = self.is_in_checkmate(board, color)# helps to get the status of checkmate
-        check_st,threat_piece = self.is_in_check(board,color)# helps to get the status of check
-
-        # check if board is in checkmate
-        if checkmate_st:
-            return []
-        elif check_st:
-            
-            king_defenses = self.exit_with_king(board, color)
-            other_defenses = self.exit_with_piece(board, color, threat_piece)
-
-            defenses = king_defenses
-            defenses.extend(other_defenses)
-            return defenses
-
-        # general case
-        for sq in board.squares:
-            if sq.occupying_piece is not None:
-                if sq.occupying_piece.notation != ' ':
-                    if sq.occupying_piece.color == color:
-                        for target in sq.occupying_piece.get_valid_moves(board):
-                            can_capture = False
-                            points = point_map[" "]
-
-                            if not isinstance(target,SmSq):
-                                target_square = board.get_square(target)
-                            else:
-                                target_square = target
-
-                            if target_square.occupying_piece != None:
-                                if target_square.occupying_piece.color != self.color:
-                                    can_capture = True
-                                    points = point_map[target_square.occupying_piece.notation]
-
-                            possible_moves.append({
-                                "start":sq,
-                                "curr_pos": sq.pos,
-                                "curr_piece_color": color_code[sq.occupying_piece.color] if sq.occupying_piece else None,
-                                "curr_piece_notation": sq.occupying_piece.notation if sq.occupying_piece else None,
-                                "end": target_square,
-                                "next_pos": target_square.pos,
-                                "next_piece_color": color_code[target_square.occupying_piece.color] if target_square.occupying_piece else None,
-                                "next_piece_notation": target_square.occupying_piece.notation if target_square.occupying_piece else None,
-                                "can_capture":can_capture,
-                                "points": points
-                            })
+        mailbox = board.mailbox
+        for mv in board.get_legal_moves():
+            frm = move_from(mv)
+            to = move_to(mv)
+            piece = mailbox[frm]
+            target = mailbox[to]
+            can_capture = target >= 0
+            possible_moves.append({
+                "move": mv,
+                "start": SQUARES[frm],
+                "curr_pos": SQUARES[frm].pos,
+                "curr_piece_color": color_code[color],
+                "curr_piece_notation": PIECE_NOTATION[piece % 6],
+                "end": SQUARES[to],
+                "next_pos": SQUARES[to].pos,
+                "next_piece_color": color_code["white" if target // 6 == 0 else "black"] if can_capture else None,
+                "next_piece_notation": PIECE_NOTATION[target % 6] if can_capture else None,
+                "can_capture": can_capture,
+                "points": point_map[PIECE_NOTATION[target % 6]] if can_capture else point_map[" "]
+            })
         return possible_moves
 
     def get_opponent_color(self):
         return "black" if self.color == "white" else "white"
-    
-    def minimax(self, board: SimulationBoard, depth: int, alpha: int, beta: int, maximizing_player: bool) -> int:
+
+    def negamax(self, board: SimulationBoard, depth: int, alpha: int, beta: int) -> int:
+        # principal variation search: the score of the position for the side
+        # to move, exact when inside (alpha, beta) and otherwise a bound on
+        # the side it fell out of (fail-soft)
+        self.nodes += 1
+        if self.nodes % BUDGET_CHECK_INTERVAL == 0:
+            self.check_budget()
+        if self.tablebase is not None:
+            score = self.probe_tablebase(board)
+            if score is not None:
+                return score
         if depth == 0:
-            return self.evaluate_board(board)
-
-        # Determine the color for the current maximizing or minimizing player
-        color = self.color if maximizing_player else self.get_opponent_color()
-
-        # Get all possible moves for the current player
-        possible_moves = self.get_all_possible_moves(board, color)
-        random.shuffle(possible_moves)
-
-        if maximizing_player:
-            max_eval = float('-inf')
-            for move in possible_moves:
-                board_copy = SimulationBoard()
-                board_copy.copy_from_board(board)
-                board_copy.handle_move(move['curr_pos'], move['next_pos'])
-                eval = self.minimax(board_copy, depth - 1, alpha, beta, False)  # Recurse with minimizing player
-                max_eval = max(max_eval, eval)
-                alpha = max(alpha, eval)
-                if beta <= alpha:
-                    break  # Beta cut-off
-            return max_eval
+            if self.quiescence:
+                return self.quiescence_search(board, alpha, beta)
+            return self.evaluate_side(board)
+
+        # the plies played since the root, used to prefer the shortest mates
+        ply = len(board.history) - self.root_ply
+        alpha_orig = alpha
+        tt_move = 0
+        entry = self.tt.probe(board.key)
+        self.tt_probes += 1
+        if entry is not None:
+            self.tt_hits += 1
+            tt_move, tt_depth, bound, score = entry
+            if tt_depth >= depth:
+                score = self.score_from_tt(score, ply)
+                if bound == EXACT:
+                    return score
+                if bound == LOWER and score >= beta:
+                    return score
+                if bound == UPPER and score <= alpha:
+                    return score
+
+        possible_moves = self.get_all_possible_moves(board, board.turn)
+        if not possible_moves:
+            # checkmate is the worst outcome for the side to move, stalemate is a draw
+            if not board.is_in_check(board.turn):
+                return 0
+            return -(MATE_SCORE - ply)
+        self.order_moves(board, possible_moves, ply, tt_move)
+
+        best_value, best_move = -INFINITY, 0
+        for i, move in enumerate(possible_moves):
+            board.make_move(move['move'])
+            if i == 0:
+                value = -self.negamax(board, depth - 1, -beta, -alpha)
+            else:
+                # the first move is expected to be the best one, the others
+                # are only proven worse with a null window around alpha and
+                # searched again with the full window when they are not
+                value = -self.negamax(board, depth - 1, -alpha - 1, -alpha)
+                if alpha < value < beta:
+                    self.researches += 1
+                    value = -self.negamax(board, depth - 1, -beta, -alpha)
+            board.unmake_move()
+            if value > best_value:
+                best_value, best_move = value, move['move']
+            if value > alpha:
+                alpha = value
+            if alpha >= beta:
+                self.record_cutoff(board, move, ply, depth, i)
+                break
+
+        if best_value <= alpha_orig:
+            bound = UPPER
+        elif best_value >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.tt.store(board.key, best_move, depth, bound, self.score_to_tt(best_value, ply))
+        return best_value
+
+    def quiescence_search(self, board: SimulationBoard, alpha: int, beta: int) -> int:
+        # searches captures only until the position is quiet, so the evaluation
+        # is not taken in the middle of an exchange. Scores are for the side
+        # to move, like negamax.
+        self.qnodes += 1
+        self.nodes += 1
+        if self.nodes % BUDGET_CHECK_INTERVAL == 0:
+            self.check_budget()
+        if self.tablebase is not None:
+            score = self.probe_tablebase(board)
+            if score is not None:
+                return score
+
+        if self.quiescence_checks and board.is_in_check(board.turn):
+            # no standing pat while in check, every evasion is searched
+            moves = board.get_legal_moves()
+            if not moves:
+                return -(MATE_SCORE - (len(board.history) - self.root_ply))
+            stand_pat = None
         else:
-            min_eval = float('inf')
-            for move in possible_moves:
-                board_copy = SimulationBoard()
-                board_copy.copy_from_board(board)
-                board_copy.handle_move(move['curr_pos'], move['next_pos'])
-                eval = self.minimax(board_copy, depth - 1, alpha, beta, True)  # Recurse with maximizing player
-                min_eval = min(min_eval, eval)
-                beta = min(beta, eval)
-                if beta <= alpha:
-                    break  # Alpha cut-off
-            return min_eval
+            # standing pat: the side to move can decline every capture
+            stand_pat = self.evaluate_side(board)
+            if stand_pat >= beta:
+                return stand_pat
+            alpha = max(alpha, stand_pat)
+            moves = board.get_legal_moves(captures_only=True)
+
+        mailbox = board.mailbox
+        def gain(mv):
+            victim = mailbox[move_to(mv)]
+            value = MATERIAL[victim % 6] if victim >= 0 else 0
+            if move_promotion(mv):
+                value += MATERIAL[move_promotion(mv)] - MATERIAL[0]
+            return value
+        def order(mv):
+            # MVV-LVA
+            attacker = PIECE_NOTATION[mailbox[move_from(mv)] % 6]
+            return gain(mv) * 16 - attacker_values[attacker]
+        moves.sort(key=order, reverse=True)
+
+        best = stand_pat if stand_pat is not None else -MATE_SCORE
+        for mv in moves:
+            # delta pruning
+            if stand_pat is not None and stand_pat + gain(mv) + DELTA_MARGIN <= alpha:
+                continue
+            board.make_move(mv)
+            score = -self.quiescence_search(board, -beta, -alpha)
+            board.unmake_move()
+            best = max(best, score)
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+        return best
+
+    def probe_tablebase(self, board: SimulationBoard) -> int | None:
+        # exact score for the side to move of a position the tablebase
+        # holds, None for the others
+        result = self.tablebase.probe(board)
+        if result is None:
+            return None
+        self.tablebase_hits += 1
+        outcome, plies = result
+        return outcome * (MATE_SCORE - (len(board.history) - self.root_ply) - plies) if outcome else 0
+
+    @staticmethod
+    def score_to_tt(score: int, ply: int) -> int:
+        # mate scores are stored relative to the node instead of the root
+        if score > MATE_BOUND:
+            return score + ply
+        if score < -MATE_BOUND:
+            return score - ply
+        return score
+
+    @staticmethod
+    def score_from_tt(score: int, ply: int) -> int:
+        if score > MATE_BOUND:
+            return score - ply
+        if score < -MATE_BOUND:
+            return score + ply
+        return score
 
     def is_in_check(self, board: SimulationBoard, color: str) -> bool:
         """
         Returns True if the player with the given color is in check.
         """
-        king_square = None
-        for square in board.squares:
-            if square.occupying_piece and \
-                square.occupying_piece.color == color and \
-                    square.occupying_piece.notation == 'K':
-                king_square = square
-                break
-
-        if king_square:
-            # Check if any opposing piece can move to the king's position
-            opponent_color = self.get_opponent_color() if color == self.color else self.color
-            for square in board.squares:
-                if square.occupying_piece and square.occupying_piece.color == opponent_color:
-                    valid_moves = square.occupying_piece.get_valid_moves(board)
-                    if king_square in valid_moves:
-                        return True, square
-        return False, None
+        return board.is_in_check(color)
 
     def is_in_checkmate(self, board: SimulationBoard, color: str) -> bool:
-        
         # Returns True if the player with the given color is in checkmate.
-
-        is_checked = False # setting the value to false
-        king_sq = None
-        for sq in board.squares:
-            if sq.occupying_piece and sq.occupying_piece.color == color and sq.occupying_piece.notation == 'K':
-                king_sq = sq #getting the position of the king
-                break
-
-        if king_sq:
-            # Checking if any opponent's piece can take down king by moving to its position
-            opponent_color = self.get_opponent_color() if color == self.color else self.color
-            for sq in board.squares:
-                if sq.occupying_piece and sq.occupying_piece.color == opponent_color:
-                    valid_moves = sq.occupying_piece.get_valid_moves(board)
-                    if king_sq in valid_moves:
-                        is_checked = True
-        
-        if is_checked == False:
-            return False
-    
-        # return safe moves
-        safe_moves = []
-
-        king_sq = self.get_king(board, color)
-        kings_moves = king_sq.occupying_piece.get_valid_moves(board)
-
-
-        all_opponent_moves = []
-        for square in board.squares:
-            if square.occupying_piece is not None:
-                if square.occupying_piece.color != color:
-                    # look for opponent pieces only
-                    all_opponent_moves.append(square.occupying_piece.get_valid_moves(board))
-
-        for move in kings_moves:
-            if move not in all_opponent_moves:
-                safe_moves.append(move)
-
-        if len(safe_moves)==0:
-            return True
-        return False
+        return board.is_in_checkmate(color)
 
     def get_king(self, board: SimulationBoard, color):
-        for sq in board.squares:
-            if sq.occupying_piece is not None:
-                if sq.occupying_piece.notation == 'K' and sq.occupying_piece.color == color:
-                    return sq
-    
-    def exit_with_king(self, board: SimulationBoard, color):
-            safe_moves = []
-
-            king_sq = self.get_king(board, color)
-            kings_moves = king_sq.occupying_piece.get_valid_moves(board)
-
-            all_opponent_moves = []
-            for sq in board.squares:
-                if sq.occupying_piece is not None:
-                    if sq.occupying_piece.color != color:
-                        # look for opponent pieces only
-                        moves_list = sq.occupying_piece.get_valid_moves(board)
-                        all_opponent_moves.extend(moves_list)
-
-            for move in kings_moves:
-                if move not in all_opponent_moves:
-                    can_capture = False
-                    points = point_map[" "]
-
-                    # check if the move leads to any captures
-                    if move.occupying_piece is not None:
-                        if move.occupying_piece.color != self.color:
-                            can_capture = True
-                            points = point_map[move.occupying_piece.notation]
-
-                    safe_moves.append({
-                                "start":king_sq,
-                                "curr_pos": king_sq.pos,
-                                "curr_piece_color": color_code[king_sq.occupying_piece.color] if king_sq.occupying_piece else None,
-                                "curr_piece_notation": king_sq.occupying_piece.notation if king_sq.occupying_piece else None,
-                                "end": move,
-                                "next_pos": move.pos,
-                                "next_piece_color": color_code[move.occupying_piece.color] if move.occupying_piece else None,
-                                "next_piece_notation": move.occupying_piece.notation if move.occupying_piece else None,
-                                "can_capture":can_capture,
-                                "points": points
-                            })
-
-            #print("safe moves:", [(move["curr_pos"], move["next_pos"]) for move in safe_moves])
-            # Just to debug, adding this is aking th game slow
-            return safe_moves
-
-    def exit_with_piece(self,
-                                        board: SimulationBoard,
-                                        color,
-                                        threat_piece: SmSq):
-
-        threat_moves = threat_piece.occupying_piece.get_valid_moves(board)
-
-        # print(threat_piece.occupying_piece.notation)
-        # print("threat_moves:" , [(threat_piece.occupying_piece.pos, move.pos) for move in threat_moves])
-
-        defense_moves = []
-        all_possible_moves = []
-        for square in board.squares:
-            if square.occupying_piece is not None:
-                if square.occupying_piece.notation != ' ' and \
-                    square.occupying_piece.notation != "K" and \
-                        square.occupying_piece.color == color:
-                    all_possible_moves.extend(square.occupying_piece.get_valid_moves(board))
-        
-        for defense in defense_moves:
-            if defense in threat_moves:
-                defense_moves.append(defense)    
-
-        # print("defense moves:", [(move["curr_pos"], move["next_pos"]) for move in defense_moves])
-
-        return defense_moves
+        return SQUARES[board.king_square(COLOR_INDEX[color])]
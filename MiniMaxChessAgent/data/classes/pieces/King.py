@@ -1,14 +1,12 @@
 # /* King.py
 
-import pygame
 from data.classes.Piece import Piece
+from data.classes.Sprites import get_sprite
 
 class King(Piece):
     def __init__(self, pos, color, board):
         super().__init__(pos, color, board)
-        img_path = 'data/imgs/' + color + '_king.png'
-        self.img = pygame.image.load(img_path)
-        self.img = pygame.transform.scale(self.img, (board.tile_width - 20, board.tile_height - 20))
+        self.img = get_sprite(color, 'K', (board.tile_width - 20, board.tile_height - 20))
         self.notation = 'K'
 
     def get_possible_moves(self, board):
@@ -39,6 +37,7 @@ class King(Piece):
         return output
 
     def can_castle(self, board):
+        sides = []
         if not self.has_moved:
             if self.color == 'white':
                 queenside_rook = board.get_piece_from_pos((0, 7))
@@ -48,13 +47,13 @@ class King(Piece):
                         if [
                             board.get_piece_from_pos((i, 7)) for i in range(1, 4)
                         ] == [None, None, None]:
-                            return 'queenside'
+                            sides.append('queenside')
                 if kingside_rook != None:
                     if not kingside_rook.has_moved:
                         if [
                             board.get_piece_from_pos((i, 7)) for i in range(5, 7)
                         ] == [None, None]:
-                            return 'kingside'
+                            sides.append('kingside')
             elif self.color == 'black':
                 queenside_rook = board.get_piece_from_pos((0, 0))
                 kingside_rook = board.get_piece_from_pos((7, 0))
@@ -63,24 +62,34 @@ class King(Piece):
                         if [
                             board.get_piece_from_pos((i, 0)) for i in range(1, 4)
                         ] == [None, None, None]:
-                            return 'queenside'
+                            sides.append('queenside')
                 if kingside_rook != None:
                     if not kingside_rook.has_moved:
                         if [
                             board.get_piece_from_pos((i, 0)) for i in range(5, 7)
                         ] == [None, None]:
-                            return 'kingside'
+                            sides.append('kingside')
+        # the king may not castle out of, through or into check
+        if sides:
+            enemy = 'black' if self.color == 'white' else 'white'
+            if board.is_in_check(self.color):
+                return []
+            sides = [
+                side for side in sides
+                if not any(board.attack_map.is_attacked(self.y * 8 + x, enemy)
+                           for x in ((self.x - 1, self.x - 2) if side == 'queenside'
+                                     else (self.x + 1, self.x + 2)))
+            ]
+        return sides
 
     def get_valid_moves(self, board):
-        output = []
-        for square in self.get_moves(board):
-            if not board.is_in_check(self.color, board_change=[self.pos, square.pos]):
-                output.append(square)
-        if self.can_castle(board) == 'queenside':
+        output = board.attack_map.legal_moves(self, self.get_moves(board))
+        castling_sides = self.can_castle(board)
+        if 'queenside' in castling_sides:
             output.append(
                 board.get_square_from_pos((self.x - 2, self.y))
             )
-        if self.can_castle(board) == 'kingside':
+        if 'kingside' in castling_sides:
             output.append(
                 board.get_square_from_pos((self.x + 2, self.y))
             )
@@ -1,14 +1,12 @@
 # /* Kinght.py
 
-import pygame
 from data.classes.Piece import Piece
+from data.classes.Sprites import get_sprite
 
 class Knight(Piece):
     def __init__(self, pos, color, board):
         super().__init__(pos, color, board)
-        img_path = 'data/imgs/' + color + '_knight.png'
-        self.img = pygame.image.load(img_path)
-        self.img = pygame.transform.scale(self.img, (board.tile_width - 20, board.tile_height - 20))
+        self.img = get_sprite(color, 'N', (board.tile_width - 20, board.tile_height - 20))
         self.notation = 'N'
 
     def get_possible_moves(self, board):
@@ -1,14 +1,12 @@
 # /* Queen.py
 
-import pygame
 from data.classes.Piece import Piece
+from data.classes.Sprites import get_sprite
 
 class Queen(Piece):
     def __init__(self, pos, color, board):
         super().__init__(pos, color, board)
-        img_path = 'data/imgs/' + color + '_queen.png'
-        self.img = pygame.image.load(img_path)
-        self.img = pygame.transform.scale(self.img, (board.tile_width - 20, board.tile_height - 20))
+        self.img = get_sprite(color, 'Q', (board.tile_width - 20, board.tile_height - 20))
         self.notation = 'Q'
 
     def get_possible_moves(self, board):
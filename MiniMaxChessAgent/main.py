@@ -1,6 +1,7 @@
 import argparse
 
-from data.classes.ChessMatch import chess_match
+from data.classes.ChessMatch import chess_match, run_experiments, make_agent
+from data.classes import Profiling
 from data.classes.agents.RandomPlayer import RandomPlayer
 from data.classes.agents.HumanPlayer import HumanPlayer
 from data.classes.agents.MinimaxAgent import MinimaxAgent
@@ -10,6 +11,28 @@ def main():
     parser = argparse.ArgumentParser(description="Initialize players for the game.")
     parser.add_argument('white', type=str, help="Type of the white player")
     parser.add_argument('black', type=str, help="type of the black player")
+    parser.add_argument('--games', type=int, default=0,
+                        help="play this many headless games instead of one in a window, "
+                             "the white player alternating colors with the black one")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="number of processes playing headless games")
+    parser.add_argument('--timeout', type=float, default=None,
+                        help="seconds after which a headless game is drawn")
+    parser.add_argument('--output', type=str, default=None,
+                        help="file the headless games are streamed to (.csv or JSON lines)")
+    parser.add_argument('--tablebase', type=str, default=None,
+                        help="endgame tablebase file for the MinimaxAgent players")
+    parser.add_argument('--move-time', type=float, default=None,
+                        help="seconds after which the search of an agent playing in the "
+                             "window is cut off")
+    parser.add_argument('--ponder', choices=('expected', 'all'), default=None,
+                        help="MinimaxAgent players search on the opponent's time, the "
+                             "expected reply or every reply")
+    parser.add_argument('--profile', type=str, default=None,
+                        help="directory every decision is profiled to, also set by the "
+                             f"{Profiling.PROFILE_ENV} environment variable")
+    parser.add_argument('--profile-format', choices=Profiling.FORMATS, default='pstats',
+                        help="cProfile stats, or sampled stacks collapsed for flame graphs")
     args = parser.parse_args()
     if args.white not in globals().keys():
         print(f'White player {args.white} not found!')
@@ -19,10 +42,28 @@ def main():
         return
     
     print(args.white, args.black)
+    if args.profile:
+        Profiling.configure(args.profile, args.profile_format)
 
-    white_player: ChessAgent = globals()[args.white]('white')
-    black_player: ChessAgent = globals()[args.black]('black')
-    chess_match(white_player, black_player)
+    def agent_spec(name):
+        # agent class, with its options when it takes any (see make_agent)
+        agent_class = globals()[name]
+        options = {'tablebase': args.tablebase, 'ponder': args.ponder}
+        options = {key: value for key, value in options.items() if value}
+        if options and agent_class is MinimaxAgent:
+            return agent_class, options
+        return agent_class
+
+    if args.games > 0:
+        results = run_experiments(agent_spec(args.white), agent_spec(args.black),
+                                  iterations=args.games, workers=args.workers,
+                                  timeout=args.timeout, output=args.output)
+        print(results)
+        return
+
+    white_player: ChessAgent = make_agent(agent_spec(args.white), 'white')
+    black_player: ChessAgent = make_agent(agent_spec(args.black), 'black')
+    chess_match(white_player, black_player, move_time=args.move_time)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file